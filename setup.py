@@ -9,12 +9,19 @@ requirements = [
     "click>=7.0",
     "click-help-colors>=0.5",
     "pandas>=0.20.3",
-    "openpyxl>=2.4.8",
+    "openpyxl>=2.6",
     "pendulum>=1.3.2",
     "pydantic>= 1.1",
     "ftfy>=5.5.1",
 ]
 
+extra_requirements = {
+    "async": ["httpx>=0.18"],
+    "fast": ["orjson>=3.0"],
+    "stream": ["ijson>=3.1"],
+    "arrow": ["pyarrow>=4.0"],
+}
+
 setup_requirements = ["pytest-runner", "setuptools>=38.6.0", "wheel>=0.31.0"]
 
 test_requirements = ["pytest", "responses", "pytest-sugar"]
@@ -36,6 +43,7 @@ setup(
     package_data={"hexpy": ["py.typed"]},
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extra_requirements,
     python_requires=">=3.6",
     zip_safe=False,
     keywords="hexpy",
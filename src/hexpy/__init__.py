@@ -3,6 +3,17 @@
 __version__ = "0.7.3"
 
 from .activity import ActivityAPI
+from .aio import (
+    AsyncActivityAPI,
+    AsyncAnalysisAPI,
+    AsyncContentUploadAPI,
+    AsyncCustomAPI,
+    AsyncHexpySession,
+    AsyncMetadataAPI,
+    AsyncMonitorAPI,
+    AsyncRealtimeAPI,
+    AsyncStreamsAPI,
+)
 from .analysis import AnalysisAPI
 from .content_upload import ContentUploadAPI
 from .custom import CustomAPI
@@ -12,6 +23,7 @@ from .project import Project
 from .realtime import RealtimeAPI
 from .session import HexpySession
 from .streams import StreamsAPI
+from .sync import MonitorSync
 
 __all__ = [
     "HexpySession",
@@ -24,4 +36,14 @@ __all__ = [
     "RealtimeAPI",
     "ActivityAPI",
     "Project",
+    "MonitorSync",
+    "AsyncHexpySession",
+    "AsyncMonitorAPI",
+    "AsyncMetadataAPI",
+    "AsyncStreamsAPI",
+    "AsyncAnalysisAPI",
+    "AsyncContentUploadAPI",
+    "AsyncCustomAPI",
+    "AsyncRealtimeAPI",
+    "AsyncActivityAPI",
 ]
@@ -0,0 +1,495 @@
+"""Module for calling the API concurrently with asyncio"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .activity import ActivityAPI
+from .analysis import AnalysisAPI
+from .cache import ResponseCache
+from .base import (
+    BULK,
+    MAX_PAYLOAD_BYTES,
+    AsyncRateLimiter,
+    AsyncSingleFlight,
+    JSONDict,
+    RetryPolicy,
+    in_thread,
+    with_priority,
+)
+from .content_upload import ContentUploadAPI, JournalOrPath, UploadJournal
+from .custom import CustomAPI
+from .metadata import MetadataAPI
+from .models import TrainCollection, UploadCollection
+from .monitor import (
+    Cell,
+    DateOrDates,
+    MetricOrMetrics,
+    MonitorAPI,
+    MonitorOrMonitors,
+    _date,
+    _post_key,
+)
+from .realtime import RealtimeAPI
+from .session import HexpySession, PoolConfig, request_key
+from .streams import StreamsAPI
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+def _query_value(value: Any) -> Any:
+    """Format query string values the way requests does."""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_query_value(item) for item in value]
+    return value
+
+
+if httpx is not None:
+
+    class _AsyncClient(httpx.AsyncClient):
+        """httpx client accepting the same request arguments as a requests Session.
+
+        Query string parameters set to None are dropped, and raw bytes passed as `data`
+        are sent as the request body. Concurrent identical GET requests are sent once,
+        and the rate limit token drawn by the callers sharing a response is returned.
+        """
+
+        def __init__(self, limiter: AsyncRateLimiter, **kwargs: Any) -> None:
+            super().__init__(**kwargs)
+            self.limiter = limiter
+            self.single_flight = AsyncSingleFlight()
+
+        async def request(  # type: ignore
+            self,
+            method: str,
+            url: str,
+            params: Optional[Mapping[str, Any]] = None,
+            data: Any = None,
+            **kwargs: Any,
+        ) -> "httpx.Response":
+            if params is not None:
+                params = {
+                    key: _query_value(value)
+                    for key, value in params.items()
+                    if value is not None
+                }
+            if isinstance(data, (bytes, str)):
+                kwargs["content"] = data
+                data = None
+            kwargs.pop("stream", None)
+            send = functools.partial(
+                super().request, method, url, params=params, data=data, **kwargs
+            )
+            if method.upper() != "GET":
+                return await send()
+            response, shared = await self.single_flight.do(
+                request_key(url, params, kwargs), send
+            )
+            if shared:
+                await self.limiter.run(self.limiter.refund)
+            return response
+
+        async def get(self, url: str, **kwargs: Any) -> "httpx.Response":  # type: ignore
+            return await self.request("GET", url, **kwargs)
+
+        async def post(self, url: str, **kwargs: Any) -> "httpx.Response":  # type: ignore
+            return await self.request("POST", url, **kwargs)
+
+        async def delete(self, url: str, **kwargs: Any) -> "httpx.Response":  # type: ignore
+            return await self.request("DELETE", url, **kwargs)
+
+
+class AsyncHexpySession(HexpySession):
+    """Session for calling the API concurrently from asyncio code.
+
+    Requires [httpx](https://www.python-httpx.org), installed with `pip install hexpy[async]`.
+    Every method of the `Async*API` clients created from this session is a coroutine.
+    Clients share an asyncio aware rate limiter, so any number of calls may be awaited
+    at once without exceeding the rate limit. With `shared_limit=True` or `cache=True`,
+    the SQLite databases holding the rate limit and the cache are read and written in
+    worker threads, so they do not block the event loop.
+
+    # Example Usage
+
+    ```python
+    >>> import asyncio
+    >>> from hexpy import AsyncHexpySession, AsyncMonitorAPI
+    >>> async def main():
+    ...     async with AsyncHexpySession.load_auth_from_file() as session:
+    ...         client = AsyncMonitorAPI(session)
+    ...         return await asyncio.gather(
+    ...             *[client.details(monitor_id) for monitor_id in monitor_ids]
+    ...         )
+    >>> asyncio.run(main())
+    ```
+    """
+
+    def __init__(
+        self,
+        token: str,
+        shared_limit: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        json_backend: str = "auto",
+        cache: Union[bool, ResponseCache] = False,
+        pool: Optional[PoolConfig] = None,
+    ) -> None:
+        if httpx is None:
+            raise ImportError(
+                "AsyncHexpySession requires httpx. Install it with `pip install hexpy[async]`."
+            )
+        super().__init__(
+            token,
+            shared_limit=shared_limit,
+            retry_policy=retry_policy
+            or RetryPolicy(exceptions=(httpx.TransportError,)),
+            json_backend=json_backend,
+            cache=cache,
+            pool=pool,
+        )
+
+    def _create_limiter(self, token: str, shared_limit: bool) -> AsyncRateLimiter:
+        """Create the asyncio rate limiter shared by every client of this session."""
+        return AsyncRateLimiter(super()._create_limiter(token, shared_limit))
+
+    def _create_session(self) -> "httpx.AsyncClient":
+        """Create the httpx client used by every client of this session."""
+        pool = self.pool
+        timeout: Any = pool.timeout
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(None, connect=timeout[0], read=timeout[1])
+        return _AsyncClient(
+            self.limiter,
+            params=self.auth,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool.pool_maxsize if pool.block else None,
+                max_keepalive_connections=pool.pool_maxsize if pool.keep_alive else 0,
+            ),
+            event_hooks={"response": [self._on_response]},
+        )
+
+    async def _on_response(self, response: "httpx.Response") -> None:
+        await self.limiter.run(
+            self.limiter.observe, response.headers, response.status_code == 429
+        )
+        response.codec = self.codec  # type: ignore
+
+    async def close(self) -> None:  # type: ignore
+        """Close persisted connections to API server."""
+        await self.session.aclose()
+
+    async def __aenter__(self) -> "AsyncHexpySession":
+        """Use AsyncHexpySession with async Context Manager."""
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Exit async Context Manager and close session."""
+        await self.close()
+
+
+class AsyncMonitorAPI(MonitorAPI):
+    """asyncio version of [MonitorAPI](Monitor.md).
+
+    `aggregate` and `batch_train` make their calls concurrently, and `iter_posts`
+    is an asynchronous generator.
+    """
+
+    async def aggregate(  # type: ignore
+        self,
+        monitor_ids: MonitorOrMonitors,
+        dates: DateOrDates,
+        metrics: MetricOrMetrics,
+        max_workers: Optional[int] = None,
+        return_errors: bool = False,
+    ) -> Any:
+        """Return aggregated results for one or monitor ids, for one or more date pairs, for one or more metrics.
+
+        # Arguments
+            monitor_ids: Integer or list of Integers, id(s) of the monitor(s) being requested
+            dates: Tuple of Strings or list of Tuples, pair(s) of 'YYYY-MM-DD' date strings
+            metrics: String or list of Strings, metric(s) to aggregate upon
+            max_workers: Integer, number of calls to make concurrently. Default is no limit other than the rate limit.
+            return_errors: Boolean, if True, return a tuple of results and errors instead of raising the first error.
+        """
+        layout = self._aggregate_layout(monitor_ids, dates, metrics)
+        cells = self._aggregate_cells(layout)
+        semaphore = asyncio.Semaphore(max_workers or len(cells) or 1)
+
+        async def call(cell: Cell) -> JSONDict:
+            async with semaphore:
+                return await self._call_cell(cell)  # type: ignore
+
+        tasks = [asyncio.ensure_future(call(cell)) for cell in cells]
+        try:
+            outcomes = await asyncio.gather(*tasks, return_exceptions=return_errors)
+        finally:
+            for task in tasks:
+                task.cancel()
+        values = {}
+        errors = {}
+        for cell, outcome in zip(cells, outcomes):
+            if isinstance(outcome, Exception):
+                errors[cell] = outcome
+            else:
+                values[cell] = outcome
+        self._fill_layout(layout, values)
+        if return_errors:
+            return layout, errors
+        return layout
+
+    async def batch_train(  # type: ignore
+        self,
+        monitor_id: int,
+        items: TrainCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> JSONDict:
+        """Concurrently upload training documents in batches of at most 1000 items and `max_bytes` bytes.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            items: validated instance of [TrainCollection](Data_Validation.md#traincollection) model
+            max_bytes: Integer, target size of the documents of a batch in bytes.
+        """
+        batches = self._training_batches(items, max_bytes)
+        responses = await asyncio.gather(
+            *[
+                with_priority(self._post_training, BULK)(
+                    monitor_id, category_id, payloads
+                )
+                for category_id, payloads in batches
+            ]
+        )
+        logger.info(f"Uploaded {len(batches)} batches")
+        return {f"Batch {num}": response for num, response in enumerate(responses)}
+
+    async def _posts_windows(  # type: ignore
+        self, monitor_id: int, start: str, end: str, cap: int
+    ) -> List[Tuple[str, str]]:
+        """Split a date range into windows whose volume fits under `cap` posts."""
+        days = (
+            await with_priority(self.volume, BULK)(
+                monitor_id, start, end, group_by="DAILY"
+            )
+        )["volume"]
+        windows, busy_days = self._pack_windows(days, cap)
+        hours = await asyncio.gather(
+            *[
+                with_priority(self.volume, BULK)(
+                    monitor_id,
+                    _date(day["startDate"]),
+                    _date(day["endDate"]),
+                    group_by="HOURLY",
+                )
+                for day in busy_days
+            ]
+        )
+        for day_hours in hours:
+            hour_windows, busy_hours = self._pack_windows(day_hours["volume"], cap)
+            windows.extend(hour_windows)
+            for hour in busy_hours:
+                logger.warning(
+                    f"{hour['numberOfDocuments']} posts from {hour['startDate']} to {hour['endDate']}. Posts will be sampled."
+                )
+                windows.append((hour["startDate"], hour["endDate"]))
+        return sorted(windows)
+
+    async def iter_posts(  # type: ignore
+        self,
+        monitor_id: int,
+        start: str,
+        end: str,
+        filter_string: Optional[str] = None,
+        full_contents: bool = False,
+        geotagged: bool = False,
+        max_workers: int = 4,
+    ) -> AsyncIterator[JSONDict]:
+        """Yield every post in a date range, beyond the 10,000 posts returned per call.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            start: String, inclusive start date in YYYY-MM-DD
+            end: String, exclusive end date in YYYY-MM-DD
+            filter_string: String, pipe-separated list of field:value pairs used to filter posts
+            full_contents: Boolean, if True, the contents field will return the original, complete posts contents instead of truncating around search terms
+            geo tagged: Boolean, if True, returns only geotagged documents matching the given filter
+            max_workers: Integer, number of windows to fetch concurrently.
+        """
+        windows = await self._posts_windows(monitor_id, start, end, self.POSTS_LIMIT)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(window_start: str, window_end: str) -> JSONDict:
+            async with semaphore:
+                return await with_priority(self.posts, BULK)(
+                    monitor_id,
+                    window_start,
+                    window_end,
+                    filter_string=filter_string,
+                    extend_limit=True,
+                    full_contents=full_contents,
+                    geotagged=geotagged,
+                )
+
+        tasks = [asyncio.ensure_future(fetch(*window)) for window in windows]
+        seen: Set[str] = set()
+        try:
+            for task in asyncio.as_completed(tasks):
+                for post in (await task)["posts"]:
+                    key = _post_key(post)
+                    if key not in seen:
+                        seen.add(key)
+                        yield post
+        finally:
+            for pending in tasks:
+                pending.cancel()
+
+
+class AsyncContentUploadAPI(ContentUploadAPI):
+    """asyncio version of [ContentUploadAPI](Upload.md).
+
+    `batch_upload` and `stream_upload` upload their batches concurrently.
+    """
+
+    async def _upload_batch(  # type: ignore
+        self,
+        document_type: int,
+        batch_num: int,
+        batch: UploadCollection,
+        payloads: List[bytes],
+        journal: Optional[UploadJournal],
+    ) -> JSONDict:
+        if journal is not None:
+            response = await in_thread(journal.completed, document_type, batch)
+            if response is not None:
+                return response
+        try:
+            response = await with_priority(self._post_upload, BULK)(
+                document_type, payloads
+            )
+        except Exception as error:
+            if journal is not None:
+                await in_thread(
+                    journal.record, document_type, batch_num, batch, None, error
+                )
+            raise
+        if journal is not None:
+            await in_thread(journal.record, document_type, batch_num, batch, response)
+        return response
+
+    async def batch_upload(  # type: ignore
+        self,
+        document_type: int,
+        items: UploadCollection,
+        request_usage: bool = True,
+        journal: JournalOrPath = None,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> JSONDict:
+        """Concurrently upload collection of Custom Content in groups of at most 1000 items and `max_bytes` bytes.
+
+        With a `journal`, the outcome of every batch is recorded and calling again
+        with the same items skips the batches already uploaded.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            items: validated UploadCollection.
+            requestUsage: Bool, return usage information.
+            journal: UploadJournal, or String or Path of its SQLite file, to resume uploads from.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        batches = self._batches(items, max_bytes)
+        with UploadJournal.open(journal) as journal:
+            responses = await asyncio.gather(
+                *[
+                    self._upload_batch(
+                        document_type, batch_num, batch, payloads, journal
+                    )
+                    for batch_num, (batch, payloads) in enumerate(batches)
+                ]
+            )
+        logger.info(f"Uploaded {len(batches)} batches")
+        return {f"Batch {num}": response for num, response in enumerate(responses)}
+
+    async def stream_upload(  # type: ignore
+        self,
+        document_type: int,
+        collections: Iterable[UploadCollection],
+        request_usage: bool = True,
+        journal: JournalOrPath = None,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> AsyncIterator[JSONDict]:
+        """Upload collections as they are produced, concurrently uploading the batches of each.
+
+        The next collection is produced in a thread while the current one uploads.
+        Yield the response of every batch, in order.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            collections: Iterable of validated UploadCollections.
+            requestUsage: Bool, return usage information.
+            journal: UploadJournal, or String or Path of its SQLite file, to resume uploads from.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        loop = asyncio.get_event_loop()
+        collections = iter(collections)
+        batch_num = 0
+        with UploadJournal.open(journal) as journal:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                collection = await loop.run_in_executor(
+                    executor, next, collections, None
+                )
+                while collection is not None:
+                    pending = loop.run_in_executor(executor, next, collections, None)
+                    batches = self._batches(collection, max_bytes)
+                    for response in await asyncio.gather(
+                        *[
+                            self._upload_batch(
+                                document_type, batch_num + i, batch, payloads, journal
+                            )
+                            for i, (batch, payloads) in enumerate(batches)
+                        ]
+                    ):
+                        yield response
+                    batch_num += len(batches)
+                    collection = await pending
+
+
+class AsyncStreamsAPI(StreamsAPI):
+    """asyncio version of [StreamsAPI](Streams.md)."""
+
+
+class AsyncRealtimeAPI(RealtimeAPI):
+    """asyncio version of [RealtimeAPI](Realtime.md)."""
+
+
+class AsyncAnalysisAPI(AnalysisAPI):
+    """asyncio version of [AnalysisAPI](Analysis.md)."""
+
+
+class AsyncMetadataAPI(MetadataAPI):
+    """asyncio version of [MetadataAPI](Metadata.md)."""
+
+
+class AsyncActivityAPI(ActivityAPI):
+    """asyncio version of [ActivityAPI](Activity.md)."""
+
+
+class AsyncCustomAPI(CustomAPI):
+    """asyncio version of [CustomAPI](Custom.md)."""
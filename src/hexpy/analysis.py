@@ -2,7 +2,7 @@
 
 import inspect
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import INTERACTIVE, JSONDict, handle_response, rate_limited
 from .models import AnalysisRequest
 from .session import HexpySession
 
@@ -22,11 +22,12 @@ class AnalysisAPI:
 
     def __init__(self, session: HexpySession) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
         self.TEMPLATE = session.ROOT + "results"
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name not in ["__init__"]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self, name, rate_limited(fn, session.limiter, session.retry_policy)
                 )
 
     def analysis_request(self, request: AnalysisRequest) -> JSONDict:
@@ -1,58 +1,922 @@
 """rate limiting decorator and handling responses for exceptions and JSON conversion"""
 
+import asyncio
 import functools
+import hashlib
+import heapq
+import inspect
+import itertools
+import json
 import logging
+import random
+import sqlite3
 import threading
 import time
-from collections import deque
-from typing import Any, Callable, Deque, Dict
+import weakref
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
+import requests
 from requests.models import Response
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
 JSONDict = Dict[str, Any]
 
+logger = logging.getLogger(__name__)
+
+
+class JSONCodec:
+    """JSON encoder and decoder used for request and response bodies.
+
+    # Arguments
+        backend: String, `json` for the standard library, `orjson` for [orjson](https://github.com/ijl/orjson),
+            or `auto` to use orjson when it is installed.
+    """
+
+    def __init__(self, backend: str = "auto") -> None:
+        if backend == "auto":
+            backend = "json" if orjson is None else "orjson"
+        if backend == "orjson" and orjson is None:
+            raise ImportError(
+                "orjson is not installed. Install with `pip install orjson`"
+            )
+        elif backend not in ("json", "orjson"):
+            raise ValueError(f"Unknown JSON backend '{backend}'. Use json or orjson.")
+        self.backend = backend
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Decode JSON document."""
+        if self.backend == "orjson":
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        """Encode object as UTF-8 JSON document."""
+        if self.backend == "orjson":
+            return orjson.dumps(obj)
+        return json.dumps(obj).encode("utf-8")
+
+
+MAX_BATCH_ITEMS = 1000
+MAX_PAYLOAD_BYTES = 10_000_000
+
+
+def pack_payloads(
+    payloads: Sequence[bytes],
+    max_items: int = MAX_BATCH_ITEMS,
+    max_bytes: int = MAX_PAYLOAD_BYTES,
+) -> List[slice]:
+    """Split serialized items into runs of consecutive items to send in one request each.
+
+    Every run has at most `max_items` items, and the JSON array of their payloads,
+    brackets and commas included, takes at most `max_bytes` bytes. An item larger
+    than `max_bytes` on its own is sent alone.
+
+    # Arguments
+        payloads: Sequence of bytes, every item serialized once, e.g. with `JSONCodec.dumps`.
+        max_items: Integer, maximum number of items in a request.
+        max_bytes: Integer, target size of the items of a request in bytes.
+    """
+    batches = []
+    start = 0
+    size = 2
+    for i, payload in enumerate(payloads):
+        if i > start and (
+            i - start >= max_items or size + 1 + len(payload) > max_bytes
+        ):
+            batches.append(slice(start, i))
+            start, size = i, 2
+        size += len(payload) + (i > start)
+    if start < len(payloads):
+        batches.append(slice(start, len(payloads)))
+    return batches
+
+
+def json_array(payloads: Sequence[bytes]) -> bytes:
+    """Join serialized items into a JSON array."""
+    return b"[" + b",".join(payloads) + b"]"
+
+
+class ResponseError(ValueError):
+    """Raised when the API responds with an error.
+
+    # Attributes
+        status_code: Integer, HTTP status code of the response.
+        method: String, HTTP method of the request, e.g. `GET`.
+    """
+
+    def __init__(self, message: str, status_code: int, method: str = "GET") -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.method = method
+
+
+class RateLimitError(ResponseError):
+    """Raised when the server rejects a request for exceeding the rate limit.
+
+    # Attributes
+        retry_after: Float or None, seconds the server asked to wait before retrying.
+    """
+
+    def __init__(
+        self, message: str, method: str = "GET", retry_after: Optional[float] = None
+    ) -> None:
+        super().__init__(message, 429, method)
+        self.retry_after = retry_after
+
+
+def seconds_until(value: Optional[str]) -> Optional[float]:
+    """Convert a header holding a delay in seconds, an epoch timestamp or an HTTP date to seconds from now."""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date is None:
+            return None
+        return max(date.timestamp() - time.time(), 0.0)
+    if number > 1e9:
+        return max(number - time.time(), 0.0)
+    return max(number, 0.0)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+INTERACTIVE = 0
+BULK = 1
+
+
+class RateLimiter:
+    """Token bucket shared by every API client created from the same `HexpySession`.
+
+    Tokens refill continuously at `max_calls / period` per second up to a burst of
+    `max_calls`, so a call is granted as soon as budget frees up.
+    Threads waiting for a token are served by priority, `INTERACTIVE` before `BULK`,
+    and in the order they arrived within a priority. `BULK` calls leave a share of
+    the bucket untouched, so interactive calls never wait behind a bulk job for
+    longer than it takes to refill one token.
+
+    # Arguments
+        max_calls: Integer, number of calls allowed per period.
+        period: Number, length of the period in seconds.
+        reserve: Number, share of `max_calls` kept for `INTERACTIVE` calls.
+    """
+
+    def __init__(self, max_calls: int, period: float, reserve: float = 0.0) -> None:
+        self.max_calls = max_calls
+        self.period = period
+        self.reserve = reserve
+        self._tokens = float(max_calls)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._arrivals = itertools.count()
+
+    @property
+    def rate(self) -> float:
+        """Number of tokens added to the bucket per second."""
+        return self.max_calls / self.period
+
+    def _refilled(self, tokens: float, elapsed: float) -> float:
+        return min(float(self.max_calls), tokens + max(elapsed, 0.0) * self.rate)
+
+    def _update(self, change: Callable[[float], Tuple[float, float]]) -> float:
+        """Apply `change` to the current token count and store the new count.
+
+        `change` receives the refilled number of tokens and returns the new number of
+        tokens along with a result that is passed back to the caller.
+        Must be called while holding `self._condition`.
+        """
+        now = time.monotonic()
+        tokens = self._refilled(self._tokens, now - self._updated)
+        self._tokens, result = change(tokens)
+        self._updated = now
+        return result
+
+    def _needed(self, priority: int) -> float:
+        """Return the number of tokens the bucket must hold to grant a call."""
+        if priority > INTERACTIVE:
+            return 1.0 + self.reserve * self.max_calls
+        return 1.0
+
+    def _take(self, priority: int = INTERACTIVE) -> float:
+        """Take a token if one is available, otherwise return seconds until one is."""
+        needed = self._needed(priority)
+
+        def take(tokens: float) -> Tuple[float, float]:
+            if tokens >= needed:
+                return tokens - 1, 0.0
+            return tokens, (needed - tokens) / self.rate
+
+        return self._update(take)
+
+    def acquire(self, priority: int = INTERACTIVE) -> float:
+        """Block until a call may be made and return the number of seconds waited.
+
+        # Arguments
+            priority: Integer, `INTERACTIVE` or `BULK`.
+        """
+        waiter = (priority, next(self._arrivals))
+        started = time.monotonic()
+        logged = False
+        with self._condition:
+            heapq.heappush(self._waiters, waiter)
+            self._condition.notify_all()
+            try:
+                while True:
+                    if self._waiters[0] == waiter:
+                        sleeptime = self._take(priority)
+                        if sleeptime <= 0:
+                            return time.monotonic() - started
+                        if not logged:
+                            logger.info(
+                                f"Rate Limit Reached. (Sleeping for {sleeptime:.2f} seconds)"
+                            )
+                            logged = True
+                        self._condition.wait(sleeptime)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def estimate(self, calls: int, priority: int = INTERACTIVE) -> float:
+        """Return seconds until `calls` more calls could be granted, from the current state of the bucket.
+
+        Calls made by anything else in the meantime are not accounted for.
+
+        # Arguments
+            calls: Integer, number of calls.
+            priority: Integer, `INTERACTIVE` or `BULK`.
+        """
+        if calls <= 0:
+            return 0.0
+        with self._condition:
+            tokens = self._update(lambda tokens: (tokens, tokens))
+        return max(self._needed(priority) + calls - 1 - tokens, 0.0) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every call for `seconds`."""
+
+        def drain(tokens: float) -> Tuple[float, float]:
+            return min(tokens, 1 - seconds * self.rate), 0.0
+
+        with self._condition:
+            self._update(drain)
+            self._condition.notify_all()
+
+    def refund(self) -> None:
+        """Return a token drawn for a call that did not reach the server."""
+        with self._condition:
+            self._update(lambda tokens: (min(float(self.max_calls), tokens + 1), 0.0))
+            self._condition.notify_all()
+
+    def observe(self, headers: Mapping[str, str], throttled: bool = False) -> None:
+        """Adjust the bucket to the rate limit state reported by the server.
+
+        `X-RateLimit-Limit` replaces `max_calls` and `X-RateLimit-Window`, the length of
+        the server's window in seconds, replaces `period`. A limit sent without a window
+        is ignored, since the server's window may not match `period`.
+        `X-RateLimit-Remaining` caps the available tokens. Calls are paused for
+        `Retry-After` seconds, or until `X-RateLimit-Reset` once the server is
+        throttling or no calls remain.
+        A throttled response without any of these headers pauses calls for a full period.
+
+        # Arguments
+            headers: Mapping, response headers.
+            throttled: Boolean, True if the server rejected the request for exceeding the rate limit.
+        """
+        limit = _header_float(headers, "X-RateLimit-Limit")
+        window = _header_float(headers, "X-RateLimit-Window")
+        remaining = _header_float(headers, "X-RateLimit-Remaining")
+        retry_after = seconds_until(headers.get("Retry-After"))
+        if retry_after is None and (throttled or remaining == 0):
+            retry_after = seconds_until(headers.get("X-RateLimit-Reset"))
+        if retry_after is None and throttled:
+            retry_after = float(self.period)
+
+        with self._condition:
+            if limit and window and (limit, window) != (self.max_calls, self.period):
+                logger.info(
+                    f"Server rate limit is {int(limit)} calls per {window:g} seconds."
+                )
+                self._update(lambda tokens: (tokens, 0.0))
+                self.max_calls = int(limit)
+                self.period = window
+            if remaining is not None:
+                left = remaining
+                self._update(lambda tokens: (min(tokens, left), 0.0))
+            self._condition.notify_all()
+        if retry_after is not None:
+            logger.info(f"Throttled by server. (Pausing for {retry_after:.2f} seconds)")
+            self.pause(retry_after)
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket stored in a SQLite database on the local host.
+
+    Every `SharedRateLimiter` opened with the same `path` and `key`, in this or any
+    other process, draws from one budget. Threads within a process are still served
+    by priority and in the order they arrived.
+
+    # Arguments
+        max_calls: Integer, number of calls allowed per period.
+        period: Number, length of the period in seconds.
+        key: String, identifies the budget to share, usually the API token. Only a hash of the key is stored.
+        path: String or Path, location of the SQLite database file.
+        reserve: Number, share of `max_calls` kept for `INTERACTIVE` calls.
+    """
+
+    def __init__(
+        self,
+        max_calls: int,
+        period: float,
+        key: str,
+        path: Union[str, Path],
+        reserve: float = 0.0,
+    ) -> None:
+        super().__init__(max_calls, period, reserve)
+        self.path = Path(path)
+        self.key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(self.path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _update(self, change: Callable[[float], Tuple[float, float]]) -> float:
+        """Apply `change` to the shared token count inside an exclusive transaction."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = self._connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (self.key,)
+            ).fetchone()
+            if row is None:
+                tokens = float(self.max_calls)
+            else:
+                tokens = self._refilled(row[0], now - row[1])
+            tokens, result = change(tokens)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (self.key, tokens, now),
+            )
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return result
+
+
+async def in_thread(func: Callable[..., Any], *args: Any) -> Any:
+    """Call `func` with `args` in the event loop's default executor and return its result."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+class _AsyncQueue:
+    """Coroutines of one event loop waiting for a token, ordered by priority."""
+
+    def __init__(self) -> None:
+        self.waiters: List[Tuple[int, int]] = []
+        self.changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def push(self, waiter: Tuple[int, int]) -> None:
+        heapq.heappush(self.waiters, waiter)
+        self._notify()
+
+    def remove(self, waiter: Tuple[int, int]) -> None:
+        self.waiters.remove(waiter)
+        heapq.heapify(self.waiters)
+        self._notify()
+
+
+class AsyncRateLimiter:
+    """asyncio front end for a `RateLimiter`, used by `AsyncHexpySession`.
+
+    Coroutines waiting for a token are served by priority and in the order they
+    arrived, and sleep without blocking the event loop. Throttling feedback is passed
+    on to the backend. A `SharedRateLimiter` backend is called in a worker thread,
+    so its SQLite transactions do not block the event loop either.
+
+    # Arguments
+        backend: RateLimiter, holds the token bucket, e.g. a `SharedRateLimiter`.
+    """
+
+    def __init__(self, backend: RateLimiter) -> None:
+        self.backend = backend
+        self.blocking = isinstance(backend, SharedRateLimiter)
+        self._queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _AsyncQueue]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _queue(self) -> "_AsyncQueue":
+        loop = asyncio.get_event_loop()
+        if loop not in self._queues:
+            self._queues[loop] = _AsyncQueue()
+        return self._queues[loop]
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Call `func` with `args`, in a worker thread if the backend blocks on I/O."""
+        if self.blocking:
+            return await in_thread(func, *args)
+        return func(*args)
+
+    def _take(self, priority: int) -> float:
+        with self.backend._condition:
+            return self.backend._take(priority)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> float:
+        """Wait until a call may be made and return the number of seconds waited.
+
+        # Arguments
+            priority: Integer, `INTERACTIVE` or `BULK`.
+        """
+        queue = self._queue()
+        waiter = (priority, next(self.backend._arrivals))
+        started = time.monotonic()
+        logged = False
+        queue.push(waiter)
+        try:
+            while True:
+                changed = queue.changed
+                sleeptime = None
+                if queue.waiters[0] == waiter:
+                    sleeptime = await self.run(self._take, priority)
+                    if sleeptime <= 0:
+                        return time.monotonic() - started
+                    if not logged:
+                        logger.info(
+                            f"Rate Limit Reached. (Sleeping for {sleeptime:.2f} seconds)"
+                        )
+                        logged = True
+                try:
+                    await asyncio.wait_for(changed.wait(), sleeptime)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            queue.remove(waiter)
+
+    def estimate(self, calls: int, priority: int = INTERACTIVE) -> float:
+        """Return seconds until `calls` more calls could be granted."""
+        return self.backend.estimate(calls, priority)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every call for `seconds`."""
+        self.backend.pause(seconds)
+
+    def refund(self) -> None:
+        """Return a token drawn for a call that did not reach the server."""
+        self.backend.refund()
+
+    def observe(self, headers: Mapping[str, str], throttled: bool = False) -> None:
+        """Adjust the bucket to the rate limit state reported by the server."""
+        self.backend.observe(headers, throttled)
+
+
+class SingleFlight:
+    """Share one call and its outcome among threads making the same call at once."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Dict[str, Any]] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Call `func` unless a call with the same `key` is in flight, and wait for it instead.
+
+        Returns the result, and whether it was shared from another thread's call.
+        """
+        with self._lock:
+            shared = self._calls.get(key)
+            if shared is None:
+                call = self._calls[key] = {"done": threading.Event()}
+            else:
+                call = shared
+        if shared is not None:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"], True
+        try:
+            call["result"] = func()
+        except BaseException as error:
+            call["error"] = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"], False
+
+
+class AsyncSingleFlight:
+    """Share one call and its outcome among coroutines making the same call at once."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(
+        self, key: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """Await `func` unless a call with the same `key` is in flight, and wait for it instead.
+
+        Returns the result, and whether it was shared from another coroutine's call.
+        """
+        if key in self._calls:
+            return await asyncio.shield(self._calls[key]), True
+        future = asyncio.get_event_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+        return result, False
+
+
+class RetryPolicy:
+    """Policy for retrying calls that failed with a transient error.
+
+    Calls are retried only if their request is idempotent: GET requests, and API
+    methods marked with `idempotent`. Every attempt draws a token from the limiter.
+
+    # Arguments
+        max_attempts: Integer, total number of attempts per call, including the first.
+        backoff: Number, seconds to wait before the first retry.
+        multiplier: Number, factor the wait grows by with every retry.
+        max_backoff: Number, upper bound in seconds of the wait between attempts.
+        jitter: Number between 0 and 1, fraction of every wait that is randomized.
+        statuses: Sequence of Integers, HTTP status codes worth retrying.
+        exceptions: Tuple of exception types worth retrying.
+        methods: Sequence of Strings, HTTP methods that are safe to retry.
+        max_throttled: Integer, number of times a call throttled by the server is retried.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 1.0,
+        multiplier: float = 2.0,
+        max_backoff: float = 30.0,
+        jitter: float = 0.5,
+        statuses: Sequence[int] = (500, 502, 503, 504),
+        exceptions: Tuple[Type[Exception], ...] = (
+            requests.ConnectionError,
+            requests.Timeout,
+        ),
+        methods: Sequence[str] = ("GET",),
+        max_throttled: int = 10,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = set(statuses)
+        self.exceptions = exceptions
+        self.methods = set(methods)
+        self.max_throttled = max_throttled
+
+    def delay(self, attempt: int) -> float:
+        """Return seconds to wait after failed attempt number `attempt`, starting at 1."""
+        wait = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return wait * (1 - self.jitter * random.random())
+
+    def retryable(self, error: Exception, idempotent: bool = False) -> bool:
+        """Return True if the call that raised `error` is worth retrying."""
+        method: Optional[str]
+        if isinstance(error, ResponseError):
+            transient = error.status_code in self.statuses
+            method = error.method
+        elif isinstance(error, self.exceptions):
+            transient = True
+            request = getattr(error, "request", None)
+            method = getattr(request, "method", None)
+        else:
+            return False
+        return transient and (idempotent or method in self.methods)
+
+
+def idempotent(func: Callable[..., JSONDict]) -> Callable[..., JSONDict]:
+    """Mark an API method as safe to retry even though it does not use GET."""
+    func.idempotent = True  # type: ignore
+    return func
+
+
+def cacheable(
+    func: Optional[Callable[..., JSONDict]] = None, ttl: Optional[float] = None
+) -> Any:
+    """Mark an API method whose results may be served from the session's cache.
+
+    Use as `@cacheable`, or as `@cacheable(ttl=seconds)` to set how long an in memory
+    cache keeps the results.
+    """
+
+    def mark(func: Callable[..., JSONDict]) -> Callable[..., JSONDict]:
+        func.cacheable = True  # type: ignore
+        func.cache_ttl = ttl  # type: ignore
+        return func
+
+    if func is None:
+        return mark
+    return mark(func)
+
+
+def _cache_lookup(
+    cache: Any,
+    func: Callable[..., Any],
+    args: Sequence[Any],
+    kwargs: Dict[str, Any],
+    scope: str,
+) -> Tuple[str, Dict[str, Any], Optional[JSONDict]]:
+    """Return the cache key and arguments of a call, and its cached result if any."""
+    arguments = call_arguments(func, args, kwargs)
+    key = cache.key(func.__qualname__, arguments, scope)
+    return key, arguments, cache.get(key)
+
+
+def call_arguments(
+    func: Callable[..., Any], args: Sequence[Any], kwargs: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Return every argument of a call to `func` by name, including defaults."""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def _retry_delay(
+    policy: RetryPolicy,
+    error: Exception,
+    attempts: int,
+    throttled: int,
+    is_idempotent: bool,
+) -> Optional[float]:
+    """Return seconds to wait before retrying a failed call, or None to give up."""
+    if hasattr(error, "attempts"):
+        return None
+    if isinstance(error, RateLimitError):
+        if throttled > policy.max_throttled:
+            return None
+        logger.info(f"Retrying throttled call. (Attempt {attempts + 1})")
+        return 0.0
+    if attempts >= policy.max_attempts or not policy.retryable(error, is_idempotent):
+        return None
+    delay = policy.delay(attempts)
+    logger.info(
+        f"{type(error).__name__} on attempt {attempts} of {policy.max_attempts}. (Retrying in {delay:.2f} seconds)"
+    )
+    return delay
+
 
 def rate_limited(
-    func: Callable[..., JSONDict], max_calls: int, period: int
+    func: Callable[..., JSONDict],
+    limiter: Union[RateLimiter, AsyncRateLimiter],
+    retry_policy: Optional[RetryPolicy] = None,
+    cache: Optional[Any] = None,
+    cache_scope: str = "",
 ) -> Callable[..., JSONDict]:
-    """Limit the number of times a function can be called."""
-    calls: Deque = deque()
+    """Draw a token from `limiter` before every call to `func`.
+
+    Calls throttled by the server are retried once the limiter allows it again, and
+    calls that failed with a transient error are retried according to `retry_policy`.
+    The error raised after the last attempt has an `attempts` attribute, so that
+    nested rate limited calls are not retried twice.
+    Results of `cacheable` methods are served from `cache` without drawing a token,
+    keyed by `cache_scope` as well as by the call.
+    Tokens are drawn with the `priority` keyword argument of the call, or else the
+    `priority` attribute of the client `func` is bound to, `INTERACTIVE` by default.
+    With an `AsyncRateLimiter` the wrapped function is a coroutine function, and
+    `cache` is read and written in a worker thread.
+    """
+    policy = retry_policy or RetryPolicy(max_attempts=1)
+    is_idempotent = getattr(func, "idempotent", False)
+    if not getattr(func, "cacheable", False):
+        cache = None
+    client = getattr(func, "__self__", None)
+
+    if isinstance(limiter, AsyncRateLimiter):
+        return _async_rate_limited(
+            func, limiter, policy, is_idempotent, cache, cache_scope, client
+        )
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, priority: Optional[int] = None, **kwargs: Any) -> JSONDict:
+        """Wrap function."""
+        if priority is None:
+            priority = getattr(client, "priority", INTERACTIVE)
+        if cache is not None:
+            key, arguments, cached = _cache_lookup(
+                cache, func, args, kwargs, cache_scope
+            )
+            if cached is not None:
+                return cached
+        attempts = 0
+        throttled = 0
+        while True:
+            limiter.acquire(priority)
+            attempts += 1
+            try:
+                result = func(*args, **kwargs)
+                if cache is not None:
+                    cache.set(key, result, cache.ttl(func, arguments))
+                return result
+            except Exception as error:
+                if isinstance(error, RateLimitError):
+                    throttled += 1
+                delay = _retry_delay(policy, error, attempts, throttled, is_idempotent)
+                if delay is None:
+                    error.attempts = attempts  # type: ignore
+                    raise
+                time.sleep(delay)
+
+    return wrapper
 
-    # Add thread safety
-    lock = threading.RLock()
-    logger = logging.getLogger(func.__name__)
 
+def with_priority(func: Callable[..., Any], priority: int) -> Callable[..., Any]:
+    """Return a rate limited method drawing its tokens with `priority` instead of its client's."""
+    return functools.partial(func, priority=priority)
+
+
+def _async_rate_limited(
+    func: Callable[..., Any],
+    limiter: AsyncRateLimiter,
+    policy: RetryPolicy,
+    is_idempotent: bool,
+    cache: Optional[Any],
+    cache_scope: str,
+    client: Any,
+) -> Callable[..., Any]:
     @functools.wraps(func)
-    def wrapper(*args: Any, **kwargs: Any) -> JSONDict:
+    async def wrapper(
+        *args: Any, priority: Optional[int] = None, **kwargs: Any
+    ) -> JSONDict:
         """Wrap function."""
-        with lock:
-            if len(calls) >= max_calls:
-                until = time.time() + period - (calls[-1] - calls[0])
-                sleeptime = until - time.time()
-                if sleeptime > 0:
-                    logger.info(
-                        f"Rate Limit Reached. (Sleeping for {round(sleeptime + 5)} seconds)"
-                    )
-                    time.sleep(sleeptime + 10)
-                while len(calls) > 0:
-                    calls.popleft()
-            calls.append(time.time())
-
-            # Pop the timestamp list front (ie: the older calls) until the sum goes
-            # back below the period. This is our 'sliding period' window.
-            while (calls[-1] - calls[0]) >= period:
-                calls.popleft()
-
-        return func(*args, **kwargs)
+        if priority is None:
+            priority = getattr(client, "priority", INTERACTIVE)
+        if cache is not None:
+            key, arguments, cached = await in_thread(
+                _cache_lookup, cache, func, args, kwargs, cache_scope
+            )
+            if cached is not None:
+                return cached
+        attempts = 0
+        throttled = 0
+        while True:
+            await limiter.acquire(priority)
+            attempts += 1
+            try:
+                result = func(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+                if cache is not None:
+                    await in_thread(cache.set, key, result, cache.ttl(func, arguments))
+                return result
+            except Exception as error:
+                if isinstance(error, RateLimitError):
+                    throttled += 1
+                delay = _retry_delay(policy, error, attempts, throttled, is_idempotent)
+                if delay is None:
+                    error.attempts = attempts  # type: ignore
+                    raise
+                await asyncio.sleep(delay)
 
     return wrapper
 
 
+STANDARD_CODEC = JSONCodec("json")
+
+
 def handle_response(response: Response) -> JSONDict:
-    """Ensure responses do not contain errors."""
+    """Ensure responses do not contain errors and decode the body once.
+
+    Bodies are decoded with the `codec` attached to responses by `HexpySession`,
+    or with the standard library for other responses. The decoded body is kept on
+    the response, so responses shared by coalesced requests are decoded once.
+    Given a pending response from an async client, returns a coroutine instead.
+    """
+    if inspect.isawaitable(response):
+        return _handle_pending_response(response)  # type: ignore
+
+    method = (response.request.method if response.request else None) or "GET"
+    if response.status_code == 429:
+        raise RateLimitError(
+            f"Something Went Wrong. {response.text}",
+            method=method,
+            retry_after=seconds_until(response.headers.get("Retry-After")),
+        )
+    elif response.status_code >= 400:
+        raise ResponseError(
+            f"Something Went Wrong. {response.text}", response.status_code, method
+        )
+    if hasattr(response, "decoded"):
+        data = response.decoded  # type: ignore
+    else:
+        codec: JSONCodec = getattr(response, "codec", STANDARD_CODEC)
+        data = response.decoded = codec.loads(response.content)  # type: ignore
+    if isinstance(data, dict) and data.get("status") == "error":
+        raise ResponseError(
+            f"Something Went Wrong. {response.text}", response.status_code, method
+        )
+    return data
+
+
+async def _handle_pending_response(response: Awaitable[Response]) -> JSONDict:
+    return handle_response(await response)
+
+
+def iter_items(response: Response, path: str) -> Iterator[Any]:
+    """Ensure a streamed response does not contain errors and yield the items of an array in its body.
+
+    With [ijson](https://github.com/ICRAR/ijson) installed, the body is decompressed
+    and parsed as it is read, so only one item is held in memory at a time.
+    Otherwise, and for responses of async clients, the body is decoded at once like
+    in `handle_response`. Error statuses are raised before returning, so that calls
+    are retried. Given a pending response from an async client, returns a coroutine.
+
+    # Arguments
+        response: requests Response, made with `stream=True`.
+        path: String, dotted path of the array in the body, e.g. `posts` for `{"posts": [...]}`.
+    """
+    if inspect.isawaitable(response):
+        return _iter_pending_items(response, path)  # type: ignore
+    if response.status_code >= 400 or ijson is None or not hasattr(response, "raw"):
+        data = handle_response(response)
+        for key in path.split("."):
+            data = data.get(key, []) if isinstance(data, dict) else []
+        return iter(data)
+    return _parse_items(response, path)
+
+
+async def _iter_pending_items(
+    response: Awaitable[Response], path: str
+) -> Iterator[Any]:
+    return iter_items(await response, path)
+
+
+def _parse_items(response: Response, path: str) -> Iterator[Any]:
+    method = (response.request.method if response.request else None) or "GET"
+    response.raw.decode_content = True
+
+    def events() -> Iterator[Tuple[str, str, Any]]:
+        for prefix, event, value in ijson.parse(response.raw, use_float=True):
+            if prefix == "status" and value == "error":
+                raise ResponseError(
+                    "Something Went Wrong. API responded with status 'error'.",
+                    response.status_code,
+                    method,
+                )
+            yield prefix, event, value
 
-    if not response.ok:
-        raise ValueError(f"Something Went Wrong. {response.text}")
-    elif ("status" in response.json()) and response.json()["status"] == "error":
-        raise ValueError(f"Something Went Wrong. {response.text}")
-    return response.json()
+    try:
+        yield from ijson.items(events(), path + ".item")
+    finally:
+        response.close()
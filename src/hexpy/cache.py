@@ -0,0 +1,225 @@
+"""Module for caching API results"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Union
+
+
+class ResponseCache:
+    """Persistent cache of API results stored in a SQLite database.
+
+    Results for date ranges that ended more than `settle_days` days ago never expire,
+    while results for more recent ranges expire after `recent_ttl` seconds.
+    Once the cache holds more than `max_entries` results, the least recently used are evicted.
+
+    # Arguments
+        path: String or Path, location of the SQLite database file.
+        max_entries: Integer, maximum number of results to keep.
+        recent_ttl: Number, seconds to keep results for date ranges that are not settled yet.
+        settle_days: Integer, days after which results for a date range no longer change.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_entries: int = 10000,
+        recent_ttl: float = 900,
+        settle_days: int = 2,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.recent_ttl = recent_ttl
+        self.settle_days = settle_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(self.path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+
+    @staticmethod
+    def key(name: str, arguments: Mapping[str, Any], scope: str = "") -> str:
+        """Return a key identifying a call to the method `name` with `arguments`.
+
+        Calls made with different `scope`, the digest of the API token of a session,
+        get different keys, so that a cache shared by several accounts never serves
+        the results of one to another.
+        """
+        arguments_json = json.dumps(arguments, sort_keys=True, default=str)
+        if scope:
+            return f"{name}:{scope}:{arguments_json}"
+        return f"{name}:{arguments_json}"
+
+    def ttl(
+        self, func: Callable[..., Any], arguments: Mapping[str, Any]
+    ) -> Optional[float]:
+        """Return seconds to keep the result of a call, or None to keep it for good."""
+        end = arguments.get("end")
+        if not isinstance(end, str):
+            return self.recent_ttl
+        try:
+            end_date = datetime.strptime(end[:10], "%Y-%m-%d")
+        except ValueError:
+            return self.recent_ttl
+        if end_date <= datetime.utcnow() - timedelta(days=self.settle_days):
+            return None
+        return self.recent_ttl
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM responses WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Return the cached result for `key`, or None if there is none.
+
+        Unlike `get`, this counts no hit or miss and does not mark the result as used.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM responses WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for `key`, or None if there is none."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM responses WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store the result for `key`, expiring after `ttl` seconds unless it is None."""
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of cache hits, misses and stored results."""
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class MemoryCache:
+    """In memory cache of API results with a time to live per method.
+
+    Methods declare how long their results are kept with `cacheable(ttl=...)`.
+    Once the cache holds more than `max_entries` results, the least recently used are evicted.
+
+    # Arguments
+        max_entries: Integer, maximum number of results to keep.
+        default_ttl: Number, seconds to keep results of methods without a ttl of their own.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 3600) -> None:
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    key = staticmethod(ResponseCache.key)
+
+    def ttl(
+        self, func: Callable[..., Any], arguments: Mapping[str, Any]
+    ) -> Optional[float]:
+        """Return seconds to keep the result of a call to `func`."""
+        return getattr(func, "cache_ttl", None) or self.default_ttl
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)  # type: ignore
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for `key`, or None if there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store the result for `key`, expiring after `ttl` seconds unless it is None."""
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, method: Optional[str] = None) -> None:
+        """Remove cached results of `method`, or of every method if it is None."""
+        with self._lock:
+            if method is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if key.split(":", 1)[0].rsplit(".", 1)[-1] == method:
+                    del self._entries[key]
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        self.invalidate()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of cache hits, misses and stored results."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,298 @@
+"""Module for writing posts, results and uploads as Parquet or Arrow (Feather) files"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+from .base import JSONDict
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+FORMATS = {"parquet": ".parquet", "feather": ".feather"}
+
+COMPRESSIONS = {
+    "parquet": ("zstd", "snappy", "gzip", "brotli", "lz4", "none"),
+    "feather": ("zstd", "lz4", "none"),
+}
+
+ROW_GROUP_SIZE = 10_000
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError(
+            "Parquet and Feather output require pyarrow. Install it with `pip install hexpy[arrow]`."
+        )
+
+
+def check_options(output_format: str, compression: str) -> None:
+    """Raise ValueError unless `output_format` is known and supports `compression`."""
+    _require_pyarrow()
+    if output_format not in FORMATS:
+        raise ValueError(
+            f"Unknown output format '{output_format}'. Use parquet or feather."
+        )
+    if compression not in COMPRESSIONS[output_format]:
+        raise ValueError(
+            f"{output_format} does not support compression '{compression}'. "
+            f"Use one of {', '.join(COMPRESSIONS[output_format])}."
+        )
+
+
+def post_types(images: bool = False) -> Dict[str, Any]:
+    """Return the Arrow type of every known column of flattened posts, in column order."""
+    _require_pyarrow()
+    types = {
+        "url": pa.string(),
+        "date": pa.timestamp("ms"),
+        "author": pa.string(),
+        "contents": pa.string(),
+        "title": pa.string(),
+        "type": pa.string(),
+        "language": pa.string(),
+        "location": pa.string(),
+        "geolocation.id": pa.string(),
+        "geolocation.name": pa.string(),
+        "geolocation.country": pa.string(),
+        "geolocation.state": pa.string(),
+        "authorPosts": pa.int64(),
+        "authorsFollowing": pa.int64(),
+        "authorsFollowers": pa.int64(),
+        "authorGender": pa.string(),
+        "assignedCategoryId": pa.int64(),
+        "assignedEmotionId": pa.int64(),
+        "category": pa.string(),
+        "emotion": pa.string(),
+    }
+    if images:
+        types.update(
+            {
+                "image.urls": pa.string(),
+                "image.objects": pa.string(),
+                "image.brands": pa.string(),
+            }
+        )
+    return types
+
+
+def upload_types() -> Dict[str, Any]:
+    """Return the Arrow type of every known column of `UploadCollection.to_dataframe`."""
+    _require_pyarrow()
+    return {
+        "title": pa.string(),
+        "author": pa.string(),
+        "language": pa.string(),
+        "date": pa.timestamp("ms", tz="UTC"),
+        "contents": pa.string(),
+        "url": pa.string(),
+        "guid": pa.string(),
+        "geolocation.id": pa.string(),
+        "geolocation.latitude": pa.float64(),
+        "geolocation.longitude": pa.float64(),
+        "geolocation.zipcode": pa.string(),
+        "age": pa.int64(),
+        "gender": pa.string(),
+        "pageId": pa.string(),
+        "parentGuid": pa.string(),
+        "authorProfileId": pa.string(),
+        "engagementType": pa.string(),
+    }
+
+
+def _array(values: pd.Series, data_type: Any) -> Any:
+    """Convert a column to an Arrow array of `data_type`.
+
+    Any value converts to a string, integers that pandas holds as floats because some values
+    are missing without a decimal point. Raise ValueError if a value does not convert to a
+    numeric or timestamp type, rather than writing a null in its place.
+    """
+    try:
+        if pa.types.is_string(data_type):
+            if (
+                pd.api.types.is_float_dtype(values)
+                and values.dropna().mod(1).eq(0).all()
+            ):
+                values = values.astype("Int64").astype(object)
+            values = values.where(values.isna(), values.astype(str))
+        elif pa.types.is_timestamp(data_type):
+            values = pd.to_datetime(values, utc=data_type.tz is not None)
+            return pa.array(values, from_pandas=True).cast(data_type, safe=False)
+        elif pa.types.is_integer(data_type) or pa.types.is_floating(data_type):
+            values = pd.to_numeric(values)
+            return pa.array(values, from_pandas=True).cast(data_type)
+        return pa.array(values, type=data_type, from_pandas=True)
+    except (ValueError, TypeError, pa.ArrowException) as error:
+        raise ValueError(
+            f"Column '{values.name}' has a value that is not {data_type}: {error}"
+        ) from error
+
+
+def dataframe_table(
+    df: pd.DataFrame, types: Dict[str, Any], schema: Optional[Any] = None
+) -> Any:
+    """Convert a dataframe to an Arrow table with typed columns.
+
+    Without a `schema`, the table has every column of `types` in order, with nulls where `df`
+    does not have it, followed by the other columns of `df` in alphabetical order as strings.
+    With a `schema`, usually that of a first chunk, the table follows it and other columns
+    of `df` are left out. Raise ValueError if a value does not convert to the type of its column.
+
+    # Arguments
+        df: pd.DataFrame, flattened posts or upload items.
+        types: Dictionary of column names to Arrow types, the known columns.
+        schema: Optional pa.Schema the table must follow.
+    """
+    _require_pyarrow()
+    if schema is not None:
+        columns = [
+            _array(df[field.name], field.type)
+            if field.name in df
+            else pa.nulls(len(df), field.type)
+            for field in schema
+        ]
+        return pa.Table.from_arrays(columns, schema=schema)
+    arrays = {
+        column: _array(df[column], data_type)
+        if column in df
+        else pa.nulls(len(df), data_type)
+        for column, data_type in types.items()
+    }
+    arrays.update(
+        (column, _array(df[column], pa.string()))
+        for column in sorted(set(df) - set(types))
+    )
+    return pa.table(arrays)
+
+
+def _metric_array(payloads: List[Any]) -> Any:
+    """Return metric results as an array of their nested type, or of JSON text if they differ."""
+    try:
+        return pa.array(payloads)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(
+            [None if payload is None else json.dumps(payload) for payload in payloads],
+            pa.string(),
+        )
+
+
+def results_table(results: List[JSONDict]) -> Any:
+    """Convert `MonitorAPI.aggregate` results to an Arrow table with a row per monitor and date range.
+
+    Every metric is a column keeping the nested structure of its results, e.g. the daily
+    volumes of `volume` as a list of structs. Failed calls are nulls.
+
+    # Arguments
+        results: List of dictionaries, results of `MonitorAPI.aggregate`.
+    """
+    _require_pyarrow()
+    rows = [
+        {
+            "monitor_id": monitor["monitor_id"],
+            "resultsStart": period["resultsStart"],
+            "resultsEnd": period["resultsEnd"],
+            **period["results"],
+        }
+        for monitor in results
+        for period in monitor["results"]
+    ]
+    metrics = list(dict.fromkeys(metric for row in rows for metric in row))[3:]
+    frame = pd.DataFrame(rows, columns=["monitor_id", "resultsStart", "resultsEnd"])
+    arrays = {
+        "monitor_id": _array(frame["monitor_id"], pa.int64()),
+        "resultsStart": _array(frame["resultsStart"], pa.timestamp("ms")),
+        "resultsEnd": _array(frame["resultsEnd"], pa.timestamp("ms")),
+    }
+    arrays.update(
+        (metric, _metric_array([row.get(metric) for row in rows])) for metric in metrics
+    )
+    return pa.table(arrays)
+
+
+class ColumnarWriter:
+    """Write Arrow tables to a Parquet or Feather file a chunk at a time.
+
+    Every chunk is written as it comes, in row groups of at most `row_group_size` rows for
+    Parquet and record batches of at most `row_group_size` rows for Feather, so large exports
+    need little memory and the files can later be memory mapped and scanned a group at a time.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy.columnar import ColumnarWriter
+    >>> with ColumnarWriter("posts.parquet", table.schema, compression="zstd") as writer:
+    ...     writer.write(table)
+    ```
+
+    # Arguments
+        path: String or Path, location of the file.
+        schema: pa.Schema every table written must follow.
+        output_format: String, `parquet` or `feather`.
+        compression: String, codec of the columns. `zstd`, `snappy`, `gzip`, `brotli`, `lz4` or `none` for Parquet, and `zstd`, `lz4` or `none` for Feather.
+        row_group_size: Integer, maximum number of rows in a row group or record batch.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        schema: Any,
+        output_format: str = "parquet",
+        compression: str = "zstd",
+        row_group_size: int = ROW_GROUP_SIZE,
+    ) -> None:
+        check_options(output_format, compression)
+        codec = None if compression == "none" else compression
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows = 0
+        if output_format == "parquet":
+            self._writer = pq.ParquetWriter(str(path), schema, compression=codec)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=codec)
+            self._writer = pa.ipc.new_file(str(path), schema, options=options)
+
+    def write(self, table: Any) -> None:
+        """Write a table following the schema of the writer."""
+        if isinstance(self._writer, pq.ParquetWriter):
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            self._writer.write_table(table, max_chunksize=self.row_group_size)
+        self.rows += table.num_rows
+
+    def close(self) -> None:
+        """Finish the file."""
+        self._writer.close()
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def write_table(
+    table: Any,
+    path: Union[str, Path],
+    output_format: str = "parquet",
+    compression: str = "zstd",
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> None:
+    """Write an Arrow table to a Parquet or Feather file.
+
+    # Arguments
+        table: pa.Table, table to write.
+        path: String or Path, location of the file.
+        output_format: String, `parquet` or `feather`.
+        compression: String, codec of the columns, see `ColumnarWriter`.
+        row_group_size: Integer, maximum number of rows in a row group or record batch.
+    """
+    with ColumnarWriter(
+        path, table.schema, output_format, compression, row_group_size
+    ) as writer:
+        writer.write(table)
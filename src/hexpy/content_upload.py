@@ -1,15 +1,161 @@
 """Module for uploading custom content"""
 
+import hashlib
 import inspect
+import json
 import logging
-from typing import List
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import (
+    BULK,
+    INTERACTIVE,
+    MAX_BATCH_ITEMS,
+    MAX_PAYLOAD_BYTES,
+    JSONDict,
+    handle_response,
+    idempotent,
+    json_array,
+    pack_payloads,
+    rate_limited,
+    with_priority,
+)
 from .models import UploadCollection
 from .session import HexpySession
 
 logger = logging.getLogger(__name__)
 
+JournalOrPath = Union[None, str, Path, "UploadJournal"]
+
+
+class UploadJournal:
+    """SQLite journal of uploaded batches, their guid ranges and outcomes.
+
+    A batch is identified by its document type and the guids of its items, so uploading
+    the same items again with the same journal skips the batches that already landed
+    and retries the ones that failed or were never sent.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy.content_upload import UploadJournal
+    >>> with UploadJournal("upload.db") as journal:
+    ...     upload_client.batch_upload(123, items, max_workers=4, journal=journal)
+    ...     journal.batches(123)
+    ```
+
+    # Arguments
+        path: String or Path, location of the SQLite database file.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(self.path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS batches "
+            "(document_type INTEGER, key TEXT, batch INTEGER, first_guid TEXT, "
+            "last_guid TEXT, size INTEGER, status TEXT NOT NULL, response TEXT, "
+            "error TEXT, updated REAL NOT NULL, PRIMARY KEY (document_type, key))"
+        )
+
+    @classmethod
+    @contextmanager
+    def open(cls, journal: JournalOrPath) -> Iterator[Optional["UploadJournal"]]:
+        """Use `journal`, opening it first if it is a path and then closing it when done."""
+        if journal is None or isinstance(journal, cls):
+            yield journal
+            return
+        opened = cls(journal)  # type: ignore
+        try:
+            yield opened
+        finally:
+            opened.close()
+
+    @staticmethod
+    def key(batch: UploadCollection) -> str:
+        """Return a key identifying a batch by the guids of its items.
+
+        Raises a ValueError for an item without a guid, which cannot be told apart from others.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for item in batch.items:
+            if item.guid is None:
+                raise ValueError(
+                    f"Journaled uploads need a guid for every item: {item}"
+                )
+            digest.update(item.guid.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def completed(
+        self, document_type: int, batch: UploadCollection
+    ) -> Optional[JSONDict]:
+        """Return the response of a batch that was uploaded, or None if it was not."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM batches WHERE document_type = ? AND key = ? "
+                "AND status = 'done'",
+                (document_type, self.key(batch)),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def record(
+        self,
+        document_type: int,
+        batch_num: int,
+        batch: UploadCollection,
+        response: Optional[JSONDict] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Record the outcome of a batch, failed if `error` is given and done otherwise."""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO batches (document_type, key, batch, first_guid, "
+                "last_guid, size, status, response, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    document_type,
+                    self.key(batch),
+                    batch_num,
+                    batch.items[0].guid if batch.items else None,
+                    batch.items[-1].guid if batch.items else None,
+                    len(batch),
+                    "failed" if error is not None else "done",
+                    None if error is not None else json.dumps(response),
+                    None if error is None else repr(error),
+                    time.time(),
+                ),
+            )
+
+    def batches(self, document_type: int) -> List[JSONDict]:
+        """Return the recorded batches of a document type, in batch order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT batch, first_guid, last_guid, size, status, error FROM batches "
+                "WHERE document_type = ? ORDER BY batch, updated",
+                (document_type,),
+            ).fetchall()
+        columns = ["batch", "first_guid", "last_guid", "size", "status", "error"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def __enter__(self) -> "UploadJournal":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
 
 class ContentUploadAPI:
     """Class for working with Content Upload API.
@@ -63,19 +209,29 @@ class ContentUploadAPI:
 
     def __init__(self, session: HexpySession) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
+        self.codec = session.codec
         self.TEMPLATE = session.ROOT + "content/"
         for name, fn in inspect.getmembers(self, inspect.ismethod):
-            if name not in ["batch_upload", "__init__"]:
+            if name not in [
+                "batch_upload",
+                "stream_upload",
+                "_batches",
+                "_upload_batch",
+                "__init__",
+            ]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self, name, rate_limited(fn, session.limiter, session.retry_policy)
                 )
 
+    @idempotent
     def upload(
         self, document_type: int, items: UploadCollection, request_usage: bool = True
     ) -> JSONDict:
         """Upload collection of Custom Content to Crimson Hexagon platform.
 
         If greater than 1000 items passed, reverts to batch upload.
+        Every item has a unique guid, so failed uploads are safe to retry.
         # Arguments
             document_type: Integer, The id of the document type to which the uploading docs will belong.
             items: validated UploadCollection.
@@ -91,30 +247,155 @@ class ContentUploadAPI:
             self.session.post(
                 self.TEMPLATE + "upload",
                 params={"documentType": document_type},
-                json={"items": items.dict(skip_defaults=True)},
+                data=self.codec.dumps({"items": items.dict(skip_defaults=True)}),
+                headers={"Content-Type": "application/json"},
+            )
+        )
+
+    @idempotent
+    def _post_upload(self, document_type: int, payloads: List[bytes]) -> JSONDict:
+        """Upload items serialized beforehand, in one request."""
+        return handle_response(
+            self.session.post(
+                self.TEMPLATE + "upload",
+                params={"documentType": document_type},
+                data=b'{"items":' + json_array(payloads) + b"}",
+                headers={"Content-Type": "application/json"},
             )
         )
 
+    def _batches(
+        self, items: UploadCollection, max_bytes: int
+    ) -> List[Tuple[UploadCollection, List[bytes]]]:
+        """Serialize every item once and pack them into batches by count and size."""
+        payloads = [self.codec.dumps(item) for item in items.dict()]
+        return [
+            (items[batch], payloads[batch])
+            for batch in pack_payloads(payloads, MAX_BATCH_ITEMS, max_bytes)
+        ]
+
+    def _upload_batch(
+        self,
+        document_type: int,
+        batch_num: int,
+        batch: UploadCollection,
+        payloads: List[bytes],
+        journal: Optional[UploadJournal],
+    ) -> JSONDict:
+        """Upload one batch, unless the journal has it done, and record its outcome."""
+        if journal is not None:
+            response = journal.completed(document_type, batch)
+            if response is not None:
+                logger.info(f"Skipped batch number {batch_num}, already uploaded")
+                return response
+        try:
+            response = with_priority(self._post_upload, BULK)(document_type, payloads)
+        except Exception as error:
+            if journal is not None:
+                journal.record(document_type, batch_num, batch, error=error)
+            raise
+        if journal is not None:
+            journal.record(document_type, batch_num, batch, response)
+        logger.info(f"Uploaded batch number: {batch_num}")
+        return response
+
     def batch_upload(
-        self, document_type: int, items: UploadCollection, request_usage: bool = True
+        self,
+        document_type: int,
+        items: UploadCollection,
+        request_usage: bool = True,
+        max_workers: int = 1,
+        journal: JournalOrPath = None,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
     ) -> JSONDict:
         """Batch upload collection of Custom Content to Crimson Hexagon platform in groups of 1000.
 
+        Every item is serialized once, and consecutive items are packed into batches of at
+        most 1000 items and `max_bytes` bytes, so batches of long documents stay small
+        enough for the API to accept. An item larger than `max_bytes` is uploaded alone.
+        Batches are uploaded in `max_workers` threads drawing from the session's rate limit.
+        The first failed batch stops the batches not started yet and is raised.
+        With a `journal`, the outcome and guid range of every batch is recorded, and
+        calling again with the same items skips the batches already uploaded.
+
         # Arguments
             document_type: Integer, The id of the document type to which the uploading docs will belong.
             items: validated UploadCollection.
             requestUsage: Bool, return usage information.
-
+            max_workers: Integer, number of batches to upload concurrently.
+            journal: UploadJournal, or String or Path of its SQLite file, to resume uploads from.
+            max_bytes: Integer, target size of the items of a batch in bytes.
         """
+        batches = self._batches(items, max_bytes)
         batch_responses = {}
-        for batch_num, batch in enumerate(
-            [items[i : i + 1000] for i in range(0, len(items), 1000)]
-        ):
-            response = self.upload(document_type, batch, request_usage)
-            logger.info(f"Uploaded batch number: {batch_num}")
-            batch_responses[f"Batch {batch_num}"] = response
+        with UploadJournal.open(journal) as journal:
+            if max_workers <= 1:
+                for batch_num, (batch, payloads) in enumerate(batches):
+                    batch_responses[f"Batch {batch_num}"] = self._upload_batch(
+                        document_type, batch_num, batch, payloads, journal
+                    )
+                return batch_responses
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._upload_batch,
+                        document_type,
+                        batch_num,
+                        batch,
+                        payloads,
+                        journal,
+                    )
+                    for batch_num, (batch, payloads) in enumerate(batches)
+                ]
+                for batch_num, future in enumerate(futures):
+                    try:
+                        batch_responses[f"Batch {batch_num}"] = future.result()
+                    except Exception:
+                        for pending in futures:
+                            pending.cancel()
+                        raise
         return batch_responses
 
+    def stream_upload(
+        self,
+        document_type: int,
+        collections: Iterable[UploadCollection],
+        request_usage: bool = True,
+        journal: JournalOrPath = None,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> Iterator[JSONDict]:
+        """Upload collections in groups of 1000 as they are produced, yielding the response of every batch.
+
+        Meant for files too large to validate at once, e.g. the chunks of
+        `UploadCollection.from_dataframes`. The next collection is produced in a
+        background thread while the current one uploads, so reading and validation
+        overlap with the network and at most two collections are held in memory.
+        Batches are packed by count and size as in `batch_upload`.
+        Batches of earlier collections are already uploaded when a later one fails to validate,
+        and with a `journal` they are skipped when the upload is started again.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            collections: Iterable of validated UploadCollections.
+            requestUsage: Bool, return usage information.
+            journal: UploadJournal, or String or Path of its SQLite file, to resume uploads from.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        collections = iter(collections)
+        batch_num = 0
+        with UploadJournal.open(journal) as journal:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                collection = executor.submit(next, collections, None).result()
+                while collection is not None:
+                    pending = executor.submit(next, collections, None)
+                    for batch, payloads in self._batches(collection, max_bytes):
+                        yield self._upload_batch(
+                            document_type, batch_num, batch, payloads, journal
+                        )
+                        batch_num += 1
+                    collection = pending.result()
+
     def delete_content_batch(self, document_type: int, batch: str) -> JSONDict:
         """Delete single batch of custom content via the API.
 
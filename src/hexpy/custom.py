@@ -3,7 +3,7 @@
 import inspect
 from typing import Any, Dict
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import INTERACTIVE, JSONDict, handle_response, rate_limited
 from .session import HexpySession
 
 
@@ -22,11 +22,12 @@ class CustomAPI:
 
     def __init__(self, session: HexpySession, endpoint: str) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
         self.TEMPLATE = session.ROOT + endpoint
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name not in ["__init__"]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self, name, rate_limited(fn, session.limiter, session.retry_policy)
                 )
 
     def get(self, url_params: str = "", params: Dict[str, Any] = None) -> JSONDict:
@@ -0,0 +1,162 @@
+"""Module for validating and looking up geolocations offline"""
+
+import bisect
+import gzip
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import pandas as pd
+
+from .base import JSONDict
+from .metadata import MetadataAPI
+from .session import HexpySession
+
+FIELDS = ["id", "name", "country", "state", "latitude", "longitude"]
+
+
+class GeographyIndex:
+    """Index of the geographical locations accepted by the API.
+
+    Built once from `MetadataAPI.geography` and saved to a compressed file, the index
+    validates geolocation ids without calling the API.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy import HexpySession
+    >>> from hexpy.geography import GeographyIndex
+    >>> session = HexpySession.load_auth_from_file()
+    >>> geography = GeographyIndex.load_or_build(session)
+    >>> "USA.NY" in geography
+    True
+    >>> geography.prefix("USA.N")
+    >>> geography.validate(df["geolocation.id"])
+    ```
+
+    # Arguments
+        resources: List of dictionaries, locations with `id`, `name`, `country` and optionally `state`, `latitude` and `longitude`.
+    """
+
+    GEOGRAPHY_FILE = Path.home() / ".hexpy" / "geography.json.gz"
+
+    def __init__(self, resources: Sequence[JSONDict]) -> None:
+        self._locations: Dict[str, JSONDict] = {
+            location["id"]: location for location in resources
+        }
+        self._ids = sorted(self._locations)
+        self._names: Dict[str, List[str]] = {}
+        for location in resources:
+            self._names.setdefault(location["name"].lower(), []).append(location["id"])
+
+    @classmethod
+    def from_api(cls, session: HexpySession) -> "GeographyIndex":
+        """Build the index from the geography endpoint.
+
+        # Arguments
+            session: HexpySession, session used for the API call.
+        """
+        return cls(MetadataAPI(session).geography()["resources"])
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "GeographyIndex":
+        """Load an index saved with `save`.
+
+        # Arguments
+            path: String or Path, location of the index file.
+        """
+        with gzip.open(str(path), "rt", encoding="utf-8") as infile:
+            rows = json.load(infile)
+        return cls(
+            [
+                {field: value for field, value in zip(FIELDS, row) if value is not None}
+                for row in rows
+            ]
+        )
+
+    @classmethod
+    def load_or_build(
+        cls, session: HexpySession, path: Union[str, Path, None] = None
+    ) -> "GeographyIndex":
+        """Load the index from `path`, building and saving it first if it does not exist.
+
+        # Arguments
+            session: HexpySession, session used to build the index.
+            path: String or Path, location of the index file. Default is `~/.hexpy/geography.json.gz`
+        """
+        index_path = Path(path) if path else cls.GEOGRAPHY_FILE
+        if index_path.exists():
+            return cls.load(index_path)
+        index = cls.from_api(session)
+        index.save(index_path)
+        return index
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Save the index as compressed rows of location fields.
+
+        # Arguments
+            path: String or Path, location of the index file.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        rows = [
+            [location.get(field) for field in FIELDS]
+            for location in self._locations.values()
+        ]
+        with gzip.open(str(path), "wt", encoding="utf-8") as outfile:
+            json.dump(rows, outfile, separators=(",", ":"))
+
+    def __contains__(self, location_id: object) -> bool:
+        return location_id in self._locations
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    def get(self, location_id: str) -> Optional[JSONDict]:
+        """Return the location with id `location_id`, or None if there is none."""
+        return self._locations.get(location_id)
+
+    def prefix(self, prefix: str) -> List[JSONDict]:
+        """Return every location whose id starts with `prefix`, e.g. 'USA.' for every state of the USA."""
+        start = bisect.bisect_left(self._ids, prefix)
+        end = bisect.bisect_left(self._ids, prefix + "\uffff")
+        return [self._locations[location_id] for location_id in self._ids[start:end]]
+
+    def find(self, name: str, country: Optional[str] = None) -> List[JSONDict]:
+        """Return the locations called `name`, ignoring case, optionally within `country`."""
+        locations = [
+            self._locations[location_id]
+            for location_id in self._names.get(name.lower(), [])
+        ]
+        if country:
+            locations = [
+                location for location in locations if location["country"] == country
+            ]
+        return locations
+
+    def validate(self, ids: pd.Series) -> pd.Series:
+        """Return a boolean Series, True where the id is a known location or missing.
+
+        # Arguments
+            ids: pd.Series, geolocation ids.
+        """
+        return ids.isin(self._locations.keys()) | ids.isna() | (ids == "")
+
+    def resolve(self, values: pd.Series) -> pd.Series:
+        """Return the location ids of a Series of ids or unambiguous location names.
+
+        Values matching neither, or matching more than one location name, are left unchanged.
+
+        # Arguments
+            values: pd.Series, geolocation ids or names.
+        """
+        names = {
+            name: location_ids[0]
+            for name, location_ids in self._names.items()
+            if len(location_ids) == 1
+        }
+        known = values.isin(self._locations.keys())
+        resolved = values.astype(str).str.lower().map(names)
+        return values.where(known | resolved.isna(), resolved)
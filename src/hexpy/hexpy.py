@@ -3,11 +3,23 @@ import json
 import time
 from collections import Counter
 from getpass import getpass
+from itertools import islice
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
 
 import click
-import numpy as np
+import openpyxl
 import pandas as pd
 import requests
 from click_help_colors import HelpColorsGroup
@@ -15,15 +27,29 @@ from pydantic import BaseModel, ValidationError, validator
 
 from . import __version__
 from .base import JSONDict
+from .cache import ResponseCache
+from .columnar import (
+    COMPRESSIONS,
+    FORMATS,
+    ROW_GROUP_SIZE,
+    ColumnarWriter,
+    check_options,
+    dataframe_table,
+    post_types,
+    results_table,
+    write_table,
+)
 from .content_upload import ContentUploadAPI
+from .geography import GeographyIndex
 from .metadata import MetadataAPI
 from .models import TrainCollection, UploadCollection
 from .monitor import MonitorAPI
+from .plan import CallPlan, Planner
 from .session import HexpySession
 from .streams import StreamsAPI
 
 
-def helpful_validation_error(errors: List[JSONDict]) -> str:
+def helpful_validation_error(errors: List[JSONDict], offset: int = 0) -> str:
 
     top_error_template = "\t* {field} - {msg}\n"
     sub_error_template = "\t* {field} - {number} - {subfield} - {msg}\n"
@@ -34,73 +60,272 @@ def helpful_validation_error(errors: List[JSONDict]) -> str:
         else:
             error_message += sub_error_template.format(
                 field=e["loc"][0],
-                number=e["loc"][1],
+                number=e["loc"][1] + offset,
                 subfield=e["loc"][2],
                 msg=e["msg"],
             )
     return error_message
 
 
+POST_COLUMNS = [
+    "url",
+    "date",
+    "author",
+    "contents",
+    "title",
+    "type",
+    "language",
+    "location",
+    "geolocation.id",
+    "geolocation.name",
+    "geolocation.country",
+    "geolocation.state",
+    "authorPosts",
+    "authorsFollowing",
+    "authorsFollowers",
+    "authorGender",
+    "assignedCategoryId",
+    "assignedEmotionId",
+    "category",
+    "emotion",
+]
+
+IMAGE_COLUMNS = ["image.urls", "image.objects", "image.brands"]
+
+NEWLINES = str.maketrans("\n\r", "  ")
+
+
+def _top_score(doc: JSONDict, key: str, scores: List[JSONDict]) -> str:
+    """Return the name with the highest of `scores`, the first one if tied, or Uncategorized."""
+    name = key.split("Scores")[0]
+    if doc[f"assigned{name.title()}Id"] == 0:
+        return "Uncategorized"
+    top = scores[0]
+    for score in scores:
+        if score["score"] > top["score"]:
+            top = score
+    return top[name + "Name"]
+
+
+def _image_fields(images: List[JSONDict]) -> JSONDict:
+    """Return the urls, object classes and brands of the images of a post."""
+    record = {"image.urls": " :: ".join(x["url"] for x in images)}
+    objects = " :: ".join(
+        "|".join(x["className"] for x in item["objects"])
+        for item in images
+        if "objects" in item
+    )
+    if objects:
+        record["image.objects"] = objects
+    brands = " :: ".join(
+        "|".join(x["brand"] for x in item["brands"])
+        for item in images
+        if "brands" in item
+    )
+    if brands:
+        record["image.brands"] = brands
+    return record
+
+
+def _flatten_post(doc: JSONDict, images: bool) -> JSONDict:
+    record: JSONDict = {}
+    for key, val in doc.items():
+        try:
+            if isinstance(val, str):
+                if key == "contents" or key == "title":
+                    record[key] = val.translate(NEWLINES)
+                else:
+                    record[key] = val
+            elif key.endswith("Scores") and len(val) > 0:
+                record[key.split("Scores")[0]] = _top_score(doc, key, val)
+            elif isinstance(val, dict):
+                for subkey, subval in val.items():
+                    record[key + "." + subkey] = subval
+            elif isinstance(val, List) and key == "imageInfo":
+                if images and len(val) > 0:
+                    record.update(_image_fields(val))
+            elif isinstance(val, int):
+                record[key] = val
+        except Exception:
+            continue
+    return record
+
+
 def posts_json_to_df(docs: List[JSONDict], images: bool = False) -> pd.DataFrame:
     """Convert post json to flattened pandas dataframe."""
+    return pd.DataFrame.from_records([_flatten_post(doc, images) for doc in docs])
 
-    items = []
 
-    for doc in docs:
-        record: JSONDict = {}
-        for key, val in doc.items():
-            try:
-                if isinstance(val, str):
-                    if key == "contents" or key == "title":
-                        record[key] = val.replace("\n", " ").replace("\r", " ")
-                    else:
-                        record[key] = val
-                elif key.endswith("Scores") and len(val) > 0:
-                    category_name = key.split("Scores")[0]
-                    if doc[f"assigned{category_name.title()}Id"] == 0:
-                        record[category_name] = "Uncategorized"
-                    else:
-                        category_max_index = np.argmax([x["score"] for x in val])
-                        category = val[category_max_index][category_name + "Name"]
-                        record[category_name] = category
-                elif isinstance(val, dict):
-                    for subkey, subval in val.items():
-                        record[key + "." + subkey] = subval
-                elif isinstance(val, List) and key == "imageInfo":
-                    if images:
-                        if len(val) > 0:
-                            urls = [x["url"] for x in val]
-                            objects = []
-                            brands = []
-                            for item in val:
-
-                                if "objects" in item:
-                                    objects.append(
-                                        "|".join(
-                                            x["className"] for x in item["objects"]
-                                        )
-                                    )
-                                if "brands" in item:
-                                    brands.append(
-                                        "|".join(x["brand"] for x in item["brands"])
-                                    )
-                            record["image.urls"] = " :: ".join(urls)
-                            if len(objects) > 0:
-                                object_str = " :: ".join(objects)
-                                if object_str != "":
-                                    record["image.objects"] = object_str
-                            if len(brands) > 0:
-                                brand_str = " :: ".join(brands)
-                                if brand_str != "":
-                                    record["image.brands"] = brand_str
-                elif isinstance(val, int):
-                    record[key] = val
-            except Exception:
-                continue
-        items.append(record)
+def post_columns(df: pd.DataFrame, images: bool = False) -> List[str]:
+    """Return the columns of flattened posts in a stable order.
+
+    Every known post field comes first, in the same order whether or not the posts have it,
+    followed by any other columns of `df` in alphabetical order.
+    """
+    columns = POST_COLUMNS + (IMAGE_COLUMNS if images else [])
+    return columns + sorted(set(df.columns) - set(columns))
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of at most `size` consecutive items."""
+    iterator = iter(items)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _warn_dropped(dropped: Set[str], reason: str) -> None:
+    if dropped:
+        click.secho(
+            f"Leaving out columns {reason}: {sorted(dropped)}",
+            fg="yellow",
+            err=True,
+        )
+
+
+def write_posts_csv(
+    docs: Iterable[JSONDict],
+    outfile: TextIO,
+    images: bool = False,
+    separator: str = ",",
+    chunksize: int = 1000,
+) -> int:
+    """Flatten posts in chunks and write each chunk to a CSV file as soon as it is ready.
+
+    Memory use does not grow with the number of posts. The columns are the known post fields,
+    `POST_COLUMNS` and with `images` also `IMAGE_COLUMNS`, so the header is written before
+    the first post. Any other field is left out with a warning.
+    Return the number of posts written.
+    """
+    columns = POST_COLUMNS + (IMAGE_COLUMNS if images else [])
+    pd.DataFrame(columns=columns).to_csv(outfile, index=False, sep=separator)
+    dropped: Set[str] = set()
+    count = 0
+    for chunk in chunked(docs, chunksize):
+        df = posts_json_to_df(chunk, images)
+        unknown = set(df.columns) - set(columns) - dropped
+        _warn_dropped(unknown, "that are not post fields")
+        dropped |= unknown
+        df.reindex(columns=columns).to_csv(
+            outfile, index=False, sep=separator, header=False
+        )
+        outfile.flush()
+        count += len(df)
+    return count
+
+
+def read_spreadsheet(
+    filename: str, separator: str = ",", chunksize: int = 1000
+) -> Iterator[pd.DataFrame]:
+    """Read a UTF-8 encoded .csv or .xlsx file as dataframes of at most `chunksize` rows.
+
+    Rows are read as they are needed, so memory use does not grow with the size of the file.
+    Rows are numbered across chunks, starting from 0 for the first row after the header.
+    """
+    if filename.endswith(".csv"):
+        yield from pd.read_csv(filename, sep=separator, chunksize=chunksize)
+    elif filename.endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(filename, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, ())
+            columns = [
+                f"Unnamed: {i}" if name is None else name
+                for i, name in enumerate(header)
+            ]
+            values = (row for row in rows if any(cell is not None for cell in row))
+            start = 0
+            for chunk in chunked(values, chunksize):
+                index = range(start, start + len(chunk))
+                yield pd.DataFrame(chunk, columns=columns, index=index)
+                start += len(chunk)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError("File type must be either UTF-8 encoded .csv or .xlsx")
 
-    df = pd.DataFrame.from_records(items)
-    return df
+
+def _read_chunks(
+    filename: str, separator: str, chunksize: int
+) -> Iterator[pd.DataFrame]:
+    try:
+        yield from read_spreadsheet(filename, separator, chunksize)
+    except Exception as e:
+        raise click.ClickException(
+            f"Error reading spreadsheet file. File type must be either UTF-8 encoded .csv or .xlsx. message: {e.args}"
+        )
+
+
+def _validated_chunks(
+    dfs: Iterable[pd.DataFrame],
+    geography: Optional[GeographyIndex],
+    trusted: bool = False,
+) -> Iterator[UploadCollection]:
+    """Validate chunks of a spreadsheet, numbering problems by their row in the whole file."""
+    offset = 0
+    try:
+        for collection in UploadCollection.from_dataframes(
+            dfs, geography=geography, resolve_geography=True, trusted=trusted
+        ):
+            yield collection
+            offset += len(collection)
+    except ValidationError as e:
+        raise click.ClickException(
+            click.style(helpful_validation_error(e.errors(), offset), fg="red")
+        ) from e
+    except ValueError as e:
+        raise click.ClickException(click.style(str(e), fg="red")) from e
+
+
+def _check_columnar(output_format: str, compression: str) -> None:
+    try:
+        check_options(output_format, compression)
+    except (ImportError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+
+def write_posts_columnar(
+    docs: Iterable[JSONDict],
+    path: str,
+    output_format: str = "parquet",
+    images: bool = False,
+    compression: str = "zstd",
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> int:
+    """Flatten posts a row group at a time and write them to a Parquet or Feather file.
+
+    The schema is set by the first row group. Known post fields are always typed columns, e.g. `date`
+    is a timestamp and `authorPosts` an integer, and other fields of the first row group are strings.
+    Other fields first appearing later are left out with a warning.
+    Raise ValueError if a value does not convert to the type of its column.
+    Return the number of posts written.
+    """
+    types = post_types(images)
+    writer: Optional[ColumnarWriter] = None
+    try:
+        for chunk in chunked(docs, row_group_size):
+            df = posts_json_to_df(chunk, images)
+            if writer is None:
+                table = dataframe_table(df, types)
+                writer = ColumnarWriter(
+                    path, table.schema, output_format, compression, row_group_size
+                )
+            else:
+                _warn_dropped(
+                    set(df.columns) - set(writer.schema.names),
+                    f"missing from the first {row_group_size} posts",
+                )
+                table = dataframe_table(df, types, writer.schema)
+            writer.write(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        empty = dataframe_table(pd.DataFrame(), types)
+        write_table(empty, path, output_format, compression, row_group_size)
+        return 0
+    return writer.rows
 
 
 class Param(BaseModel):
@@ -214,7 +439,7 @@ def login(force: bool = False, expiration: bool = True) -> HexpySession:
     """Get API token with username and password and save to ~/.hexpy/token.json."""
     try:
         if not force:
-            session = HexpySession.load_auth_from_file()
+            session = HexpySession.load_auth_from_file(shared_limit=True)
             return session
         else:
             raise IOError
@@ -223,7 +448,11 @@ def login(force: bool = False, expiration: bool = True) -> HexpySession:
         password = getpass(prompt="Enter password: ")
         try:
             session = HexpySession.login(
-                username, password, no_expiration=not expiration, force=force
+                username,
+                password,
+                no_expiration=not expiration,
+                force=force,
+                shared_limit=True,
             )
         except ValueError as exception:
             raise click.ClickException(click.style(str(exception), fg="red", bold=True))
@@ -242,6 +471,36 @@ def login(force: bool = False, expiration: bool = True) -> HexpySession:
     default=None,
     help="start and end date of export in YYYY-MM-DD format.",
 )
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="Keep results in ~/.hexpy/cache.db and reuse them. (default=no-cache)",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print the API calls needed and an estimate of how long they take, without running them.",
+)
+@click.option(
+    "--output_type",
+    "-o",
+    type=click.Choice(["json", "parquet", "feather"]),
+    default="json",
+    help="print results as json or write them to a parquet or feather file. (default=json)",
+)
+@click.option(
+    "--filename",
+    "-f",
+    default=None,
+    help="filename of parquet or feather output. Default is monitor id.",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(COMPRESSIONS["parquet"]),
+    default="zstd",
+    help="compression of parquet or feather output. Feather supports zstd, lz4 and none. (default=zstd)",
+)
 @click.argument("monitor_id", type=int)
 @click.argument("metrics", nargs=-1)
 @click.pass_context
@@ -250,6 +509,11 @@ def results(
     monitor_id: int,
     metrics: List[str],
     date_range: Tuple[str, str] = None,
+    cache: bool = False,
+    plan: bool = False,
+    output_type: str = "json",
+    filename: Optional[str] = None,
+    compression: str = "zstd",
 ) -> None:
     """Get Monitor results for 1 or more metrics.
 
@@ -262,18 +526,30 @@ def results(
         * sentiment_and_categories
     """
 
+    if output_type in FORMATS:
+        _check_columnar(output_type, compression)
     session = ctx.invoke(login, expiration=True, force=False)
+    if cache:
+        session.cache = ResponseCache(session.CACHE_FILE)
     client = MonitorAPI(session)
     if date_range:
         start = date_range[0]
         end = date_range[1]
-        results = client.aggregate(monitor_id, (start, end), list(metrics))
     else:
         details = client.details(monitor_id)
         start = details["resultsStart"]
         end = details["resultsEnd"]
-        results = client.aggregate(monitor_id, (start, end), list(metrics))
-    click.echo(json.dumps(results[0]["results"][0], ensure_ascii=False))
+    if plan:
+        call_plan = Planner(session).aggregate(monitor_id, (start, end), list(metrics))
+        click.echo(json.dumps(call_plan.summary(), indent=4))
+        return
+    results = client.aggregate(monitor_id, (start, end), list(metrics))
+    if output_type in FORMATS:
+        name = (filename or f"{monitor_id}_Results") + FORMATS[output_type]
+        write_table(results_table(results), name, output_type, compression)
+        click.secho("✅ Done!", fg="green", bold=True)
+    else:
+        click.echo(json.dumps(results[0]["results"][0], ensure_ascii=False))
 
 
 metadata_choices = [
@@ -395,42 +671,84 @@ def api_documentation(ctx: click.Context, output_type: str = "json") -> None:
     type=int,
 )
 @click.option("--separator", "-s", default=",", help="CSV column separator.")
+@click.option(
+    "--check-geography",
+    "-g",
+    is_flag=True,
+    default=False,
+    help="Reject unknown geolocation ids before uploading, resolving location names to ids.",
+)
+@click.option(
+    "--chunksize",
+    "-c",
+    type=int,
+    default=1000,
+    help="Rows read and validated at a time, uploaded while the next chunk is read. (default=1000)",
+)
+@click.option(
+    "--journal",
+    "-j",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite file recording uploaded batches. Uploading again with it skips the batches already uploaded.",
+)
+@click.option(
+    "--trusted",
+    is_flag=True,
+    default=False,
+    help="Check the file a column at a time instead of item by item. Faster for large files, without fixing mojibake.",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print the API calls needed and an estimate of how long they take, without running them.",
+)
 @click.pass_context
 def upload(
-    ctx: click.Context, filename: str, document_type: int, separator: str = ","
+    ctx: click.Context,
+    filename: str,
+    document_type: int,
+    separator: str = ",",
+    check_geography: bool = False,
+    plan: bool = False,
+    chunksize: int = 1000,
+    journal: Optional[str] = None,
+    trusted: bool = False,
 ) -> None:
-    """Upload spreadsheet file as custom content."""
+    """Upload spreadsheet file as custom content.
+
+    The file is read, validated and uploaded a chunk of rows at a time, so files larger
+    than memory can be uploaded. Guids are checked for duplicates across the whole file.
+    With a journal, an upload that failed part way resumes from the batches left.
+    """
 
     if separator == "\\t":
         separator = "\t"
     session = ctx.invoke(login, expiration=True, force=False)
     client = ContentUploadAPI(session)
-    try:
-        if filename.endswith(".csv"):
-            items = pd.read_csv(filename, sep=separator)
-        elif filename.endswith(".xlsx"):
-            items = pd.read_excel(filename)
-        else:
-            raise click.ClickException(
-                click.style(
-                    "Error reading spreadsheet file. File type must be either UTF-8 encoded .csv or .xlsx",
-                    fg="red",
-                )
-            )
-    except Exception as e:
-        raise click.ClickException(
-            f"Error reading spreadsheet file. File type must be either UTF-8 encoded .csv or .xlsx. message: {e.args}"
+    geography = GeographyIndex.load_or_build(session) if check_geography else None
+    collections = _validated_chunks(
+        _read_chunks(filename, separator, chunksize), geography, trusted
+    )
+    if plan:
+        call_plan = Planner(session).stream_upload(document_type, collections)
+        click.echo(json.dumps(call_plan.summary(), indent=4))
+        return
+    batch_responses = list(
+        client.stream_upload(
+            document_type, collections, request_usage=True, journal=journal
         )
-
-    try:
-        collection = UploadCollection.from_dataframe(items)
-    except ValidationError as e:
-        raise click.ClickException(
-            click.style(helpful_validation_error(e.errors()), fg="red")
-        ) from e
-    response = client.upload(
-        document_type=document_type, items=collection, request_usage=True
     )
+    if not batch_responses:
+        raise click.ClickException(click.style("No items found to upload.", fg="red"))
+    if len(batch_responses) == 1:
+        response = batch_responses[0]
+    else:
+        response = {
+            f"Batch {batch_num}": batch_response
+            for batch_num, batch_response in enumerate(batch_responses)
+        }
     click.echo(json.dumps(response, indent=4))
 
 
@@ -438,9 +756,19 @@ def upload(
 @click.argument("filename", type=str)
 @click.argument("monitor_id", type=int)
 @click.option("--separator", "-s", default=",", help="CSV column separator.")
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print the API calls needed and an estimate of how long they take, without running them.",
+)
 @click.pass_context
 def train(
-    ctx: click.Context, filename: str, monitor_id: int, separator: str = ","
+    ctx: click.Context,
+    filename: str,
+    monitor_id: int,
+    separator: str = ",",
+    plan: bool = False,
 ) -> None:
     """Upload spreadsheet file of training examples for monitor."""
 
@@ -524,6 +852,19 @@ def train(
         ]
     )
 
+    if plan:
+        planner = Planner(session)
+        calls = [
+            call
+            for _, sub_df in items.groupby("categoryid")
+            for call in planner.train_monitor(
+                monitor_id, TrainCollection.from_dataframe(sub_df)
+            ).calls
+        ]
+        call_plan = CallPlan(calls, session.limiter)
+        click.echo(json.dumps(call_plan.summary(), indent=4))
+        return
+
     click.echo("Preparing to upload:\n" + count_string)
 
     for cat_id, sub_df in items.groupby("categoryid"):
@@ -547,7 +888,7 @@ def train(
 @click.option(
     "--output_type",
     "-o",
-    type=click.Choice(["csv", "excel", "json"]),
+    type=click.Choice(["csv", "excel", "json", "parquet", "feather"]),
     default="csv",
     help="file type of export. (default=csv)",
 )
@@ -577,6 +918,37 @@ def train(
 @click.option(
     "--images/--no-images", "-i", default=False, help="include image recognition."
 )
+@click.option(
+    "--all-posts",
+    "-a",
+    is_flag=True,
+    default=False,
+    help="Export every post, splitting the date range by volume beyond the 10K limit.",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(COMPRESSIONS["parquet"]),
+    default="zstd",
+    help="compression of parquet or feather output. Feather supports zstd, lz4 and none. (default=zstd)",
+)
+@click.option(
+    "--row-group-size",
+    type=int,
+    default=ROW_GROUP_SIZE,
+    help=f"posts per row group of parquet or feather output. (default={ROW_GROUP_SIZE})",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print the API calls needed and an estimate of how long they take, without running them.",
+)
+@click.option(
+    "--fetch-volume",
+    is_flag=True,
+    default=False,
+    help="With --plan and --all-posts, fetch monitor volume missing from the cache to plan the export. Uses the rate limit.",
+)
 @click.pass_context
 def export(
     ctx: click.Context,
@@ -585,15 +957,22 @@ def export(
     dates: Tuple[str, str] = None,
     output_type: str = "csv",
     post_type: str = "post_list",
-    filename: str = None,
+    filename: Optional[str] = None,
     separator: str = ",",
     images: bool = False,
+    all_posts: bool = False,
+    plan: bool = False,
+    fetch_volume: bool = False,
+    compression: str = "zstd",
+    row_group_size: int = ROW_GROUP_SIZE,
 ) -> None:
     """Export monitor posts as json or to a spreadsheet."""
     if post_type not in {"post_list", "training_posts"}:
         raise click.ClickException(
             "Invalid post_type: Must be either 'post_list' or training_posts"
         )
+    if output_type in FORMATS:
+        _check_columnar(output_type, compression)
     if separator == "\\t":
         separator = "\t"
     session = ctx.invoke(login, expiration=True, force=False)
@@ -602,33 +981,73 @@ def export(
     info = details["name"]
     if post_type == "post_list":
         if dates:
-            docs = client.posts(monitor_id, dates[0], dates[1], extend_limit=not limit)[
-                "posts"
-            ]
+            start, end = dates
         else:
             start = details["resultsStart"]
             end = details["resultsEnd"]
-            docs = client.posts(monitor_id, start, end, extend_limit=not limit)["posts"]
+        if plan:
+            planner = Planner(session)
+            if all_posts:
+                try:
+                    call_plan = planner.iter_posts(
+                        monitor_id, start, end, fetch_volume=fetch_volume
+                    )
+                except ValueError:
+                    raise click.ClickException(
+                        "Planning an export of every post needs the monitor's volume. "
+                        "Add --fetch-volume to fetch it, which uses the rate limit."
+                    )
+            else:
+                call_plan = planner.call(
+                    client.stream_posts, monitor_id, start, end, extend_limit=not limit
+                )
+            click.echo(json.dumps(call_plan.summary(), indent=4))
+            return
+        docs: Iterator[JSONDict]
+        if all_posts:
+            docs = client.iter_posts(monitor_id, start, end)
+        else:
+            docs = client.stream_posts(monitor_id, start, end, extend_limit=not limit)
     else:
         info += "_Training"
-        docs = client.training_posts(monitor_id)["trainingPosts"]
+        if plan:
+            call_plan = Planner(session).call(client.stream_training_posts, monitor_id)
+            click.echo(json.dumps(call_plan.summary(), indent=4))
+            return
+        docs = client.stream_training_posts(monitor_id)
 
     if output_type == "json":
         for p in docs:
             click.echo(json.dumps(p, ensure_ascii=False))
     else:
-        df = posts_json_to_df(docs, images)
-
         if filename:
             name = filename
         else:
             name = f"{monitor_id}_{info.replace(' ', '_')}_Posts"
         if output_type == "csv":
-            df.to_csv(name + ".csv", index=False, sep=separator)
+            with open(name + ".csv", "w", newline="", encoding="utf-8") as outfile:
+                write_posts_csv(docs, outfile, images, separator)
         elif output_type == "excel":
-            df.to_excel(name + ".xlsx", index=False)
+            df = posts_json_to_df(list(docs), images)
+            df.reindex(columns=post_columns(df, images)).to_excel(
+                name + ".xlsx", index=False
+            )
+        elif output_type in FORMATS:
+            try:
+                write_posts_columnar(
+                    docs,
+                    name + FORMATS[output_type],
+                    output_type,
+                    images,
+                    compression,
+                    row_group_size,
+                )
+            except ValueError as e:
+                raise click.ClickException(str(e))
         else:
-            raise click.ClickException("Output type must be either csv, excel or json")
+            raise click.ClickException(
+                "Output type must be either csv, excel, json, parquet or feather"
+            )
         click.secho("✅ Done!", fg="green", bold=True)
 
 
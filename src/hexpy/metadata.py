@@ -1,10 +1,17 @@
 """Module for API Metadata"""
 
 import inspect
+import logging
+from typing import Optional, Sequence
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import INTERACTIVE, JSONDict, cacheable, handle_response, rate_limited
 from .session import HexpySession
 
+logger = logging.getLogger(__name__)
+
+ONE_HOUR = 60 * 60
+ONE_DAY = 24 * ONE_HOUR
+
 
 class MetadataAPI:
     """Class for working with Crimson Hexagon account and analysis metadata.
@@ -18,17 +25,51 @@ class MetadataAPI:
     >>> metadata_client.team_list()
     >>> session.close()
     ```
+
+    Reference data (teams, geography, image classes and documentation) is kept in
+    the session's `metadata_cache` for an hour or a day, so repeated lookups do not
+    use the rate limit. Pass `memoize=False` to always call the API.
     """
 
-    def __init__(self, session: HexpySession) -> None:
+    WARM_UP = ("team_list", "geography", "countries", "image_classes")
+
+    def __init__(self, session: HexpySession, memoize: bool = True) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
         self.TEMPLATE = session.ROOT
+        self.cache = session.metadata_cache
         for name, fn in inspect.getmembers(self, inspect.ismethod):
-            if name not in ["__init__"]:
+            if name not in ["__init__", "warm_up", "invalidate"]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self,
+                    name,
+                    rate_limited(
+                        fn,
+                        session.limiter,
+                        session.retry_policy,
+                        self.cache if memoize else None,
+                    ),
                 )
 
+    def warm_up(self, endpoints: Optional[Sequence[str]] = None) -> None:
+        """Fill the cache with reference data ahead of the first lookup.
+
+        # Arguments
+            endpoints: List of Strings, methods to call. Default is team_list, geography, countries and image_classes.
+        """
+        for endpoint in endpoints or self.WARM_UP:
+            getattr(self, endpoint)()
+            logger.info(f"Cached {endpoint}")
+
+    def invalidate(self, endpoint: Optional[str] = None) -> None:
+        """Drop cached results of `endpoint`, or of every endpoint if it is None.
+
+        # Arguments
+            endpoint: String, name of the method whose results are dropped.
+        """
+        self.cache.invalidate(endpoint)
+
+    @cacheable(ttl=ONE_HOUR)
     def team_list(self) -> JSONDict:
         """Return a list of teams accessible to the requesting user."""
         return handle_response(self.session.get(self.TEMPLATE + "team/list"))
@@ -44,12 +85,14 @@ class MetadataAPI:
             self.session.get(self.TEMPLATE + "monitor/list", params={"team": team_id})
         )
 
+    @cacheable(ttl=ONE_DAY)
     def geography(self) -> JSONDict:
         """Return all the geographical locations that you may use to
         filter monitor results and to upload documents with location information.
         """
         return handle_response(self.session.get(self.TEMPLATE + "geography/info/all"))
 
+    @cacheable(ttl=ONE_DAY)
     def states(self, country: str) -> JSONDict:
         """Return all the states for a given country that you may use to
         filter monitor results and to upload documents with location information.
@@ -63,6 +106,7 @@ class MetadataAPI:
             )
         )
 
+    @cacheable(ttl=ONE_DAY)
     def cities(self, country: str) -> JSONDict:
         """Return all the cities or urban areas defined in the given country that you may use to
         filter monitor results and to upload documents with location information.
@@ -76,6 +120,7 @@ class MetadataAPI:
             )
         )
 
+    @cacheable(ttl=ONE_DAY)
     def countries(self) -> JSONDict:
         """Return all the countries that you may use to filter monitor results
         and to upload documents with location information.
@@ -84,12 +129,14 @@ class MetadataAPI:
             self.session.get(self.TEMPLATE + "geography/info/countries")
         )
 
+    @cacheable(ttl=ONE_DAY)
     def image_classes(self) -> JSONDict:
         """Return list of all class IDs and names."""
         return handle_response(
             self.session.get(self.TEMPLATE + "imageanalysis/resources/classes")
         )
 
+    @cacheable(ttl=ONE_DAY)
     def api_documentation(self) -> JSONDict:
         """Return latest JSON version of Crimson Hexagon API endpoint documentation."""
         return handle_response(self.session.get(self.TEMPLATE + "documentation"))
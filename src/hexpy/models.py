@@ -1,16 +1,34 @@
 """Module for Data Validation Models"""
 
+import hashlib
 from collections import Counter
 from enum import Enum
-from typing import Any, Dict, List, Optional, Union
-
-import ftfy
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
 import pandas as pd
 import pendulum
 from pandas.io.json import json_normalize
 from pendulum.exceptions import ParserError
 from pydantic import BaseModel, Field, HttpUrl, NoneStr, validator
 
+from .columnar import ROW_GROUP_SIZE, dataframe_table, upload_types, write_table
+from .text import TEXT_FIXER, fix_text
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .geography import GeographyIndex
+
 
 def parse_datetime(date_string: str) -> str:
     """Validate date string using pendulum parsing followed by ISO formatting."""
@@ -26,6 +44,83 @@ def parse_datetime(date_string: str) -> str:
     return date.to_iso8601_string()
 
 
+TEXT_FIELDS = ("title", "author", "contents")
+
+
+def _fix_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Fix mojibake in the text columns of `df` at once.
+
+    The fixed strings are `FixedText`, which the validators of items built from the
+    fixed columns return as they are instead of fixing them again.
+    """
+    return df.assign(
+        **{
+            column: TEXT_FIXER.fix_column(df[column])
+            for column in TEXT_FIELDS
+            if column in df
+        }
+    )
+
+
+def _problem(problems: List[str], mask: pd.Series, description: str) -> None:
+    """Add a problem for the rows selected by `mask`, if there are any."""
+    if mask.any():
+        rows = list(mask.index[mask.to_numpy()][:10])
+        problems.append(f"{int(mask.sum())} rows have {description}: {rows}")
+
+
+def _text(column: pd.Series) -> pd.Series:
+    """Return a column as strings, keeping missing values."""
+    return column.astype(object).where(column.isna(), column.astype(str))
+
+
+def _format_dates(dates: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Parse a column of dates at once and format them as UTC ISO 8601 strings.
+
+    Return the formatted dates and a mask of the dates that could not be parsed.
+    """
+    parsed = pd.to_datetime(dates, errors="coerce", utc=True)
+    formatted = (
+        parsed.dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        .str.replace(".000000Z", "Z", regex=False)
+        .where(parsed.notna())
+    )
+    return formatted, dates.notna() & parsed.isna()
+
+
+def _check_frame(
+    df: pd.DataFrame, required: List[str], problems: List[str]
+) -> pd.DataFrame:
+    """Check the fields common to upload and training items a column at a time.
+
+    Return the dataframe with empty strings as missing values, text fields as strings
+    and dates formatted as `parse_datetime` would.
+    """
+    missing = [column for column in required if column not in df]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+    df = df.replace("", np.nan)
+    for column in required:
+        _problem(problems, df[column].isna(), f"no {column}")
+    for column in ("title", "author", "contents", "language"):
+        df[column] = _text(df[column])
+    _problem(
+        problems,
+        df["language"].notna() & (df["language"].str.len() != 2),
+        "language codes that are not 2 characters",
+    )
+    df["date"], invalid = _format_dates(df["date"])
+    _problem(problems, invalid, "dates that could not be parsed")
+    if "url" in df:
+        df["url"] = _text(df["url"])
+        _problem(
+            problems,
+            df["url"].notna() & ~df["url"].str.match(r"https?://[^\s/?#]+\S*$"),
+            "invalid urls",
+        )
+    return df
+
+
 class GenderEnum(str, Enum):
     """Valid values for Gender Types"""
 
@@ -147,17 +242,17 @@ class UploadItem(BaseModel):
     @validator("contents")
     def fix_contents(cls, value: str) -> str:
         """Fix mojibake in contents"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     @validator("title")
     def fix_title(cls, value: str) -> str:
         """Fix mojibake in title"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     @validator("author")
     def fix_author(cls, value: str) -> str:
         """Fix mojibake in author"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     @validator("custom", whole=True)
     def validate_len_custom_fields(cls, value_dict: Dict[str, str]) -> Dict[str, str]:
@@ -193,6 +288,62 @@ class UploadItem(BaseModel):
         return f"<UploadItem guid='{self.guid}'>"
 
 
+class GuidIndex:
+    """Set of upload item guids, kept as sorted arrays of 64 bit fingerprints.
+
+    Memory grows by 8 bytes per guid, so guids can be checked for duplicates across
+    millions of rows. Arrays are merged as they double in size and each lookup is a
+    binary search per array. Two distinct guids share a fingerprint with a probability
+    of about 1 in 10^19.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy.models import GuidIndex
+    >>> guids = GuidIndex()
+    >>> guids.add(["post1", "post2"])
+    >>> guids.find(["post2", "post3"])
+    ['post2']
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._levels: List[np.ndarray] = []
+
+    @staticmethod
+    def fingerprints(guids: Iterable[str]) -> np.ndarray:
+        """Return the 64 bit fingerprint of every guid."""
+        digests = b"".join(
+            hashlib.blake2b(guid.encode("utf-8"), digest_size=8).digest()
+            for guid in guids
+        )
+        return np.frombuffer(digests, dtype="<u8")
+
+    def find(self, guids: List[str]) -> List[str]:
+        """Return the guids already in the index."""
+        fingerprints = self.fingerprints(guids)
+        found = np.zeros(len(fingerprints), dtype=bool)
+        for level in self._levels:
+            positions = np.searchsorted(level, fingerprints).clip(max=len(level) - 1)
+            found |= level[positions] == fingerprints
+        return [guid for guid, seen in zip(guids, found) if seen]
+
+    def add(self, guids: List[str]) -> None:
+        """Add guids to the index."""
+        level = np.unique(self.fingerprints(guids))
+        if len(level) == 0:
+            return
+        while self._levels and len(self._levels[-1]) <= len(level):
+            level = np.union1d(self._levels.pop(), level)
+        self._levels.append(level)
+
+    def __contains__(self, guid: object) -> bool:
+        return isinstance(guid, str) and bool(self.find([guid]))
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels)
+
+
 class UploadCollection(BaseModel):
     """Validation model for collection of items to be uploaded.
 
@@ -254,13 +405,90 @@ class UploadCollection(BaseModel):
 
         return items
 
-    @classmethod
-    def from_dataframe(cls, df: pd.DataFrame) -> "UploadCollection":
-        """Create UploadCollection from pandas DataFrame containing necessary fields
+    @staticmethod
+    def _check_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+        """Check upload items a column at a time, raising ValueError listing the rows with problems.
 
-        ## Arguments:
-            * df: pd.DataFrame
+        Return the dataframe with the columns of UploadItem, missing guids taken from urls,
+        dates formatted and values of the types of UploadItem fields.
         """
+        problems: List[str] = []
+        df = _check_frame(
+            df, ["title", "author", "language", "date", "contents"], problems
+        )
+        _problem(
+            problems,
+            df["contents"].str.len() > 16384,
+            "contents longer than 16384 characters",
+        )
+        guid = _text(df["guid"]) if "guid" in df else pd.Series(np.nan, df.index)
+        if "url" in df:
+            guid = guid.fillna(df["url"])
+        df["guid"] = guid
+        _problem(problems, guid.isna(), "neither guid nor url")
+        _problem(
+            problems, guid.duplicated(keep=False) & guid.notna(), "duplicate guids"
+        )
+
+        custom = [column for column in df if column.startswith("custom.")]
+        long_keys = [column[7:] for column in custom if len(column) - 7 >= 100]
+        if long_keys:
+            problems.append(
+                f"{len(long_keys)} custom field names are 100 characters or more: {long_keys[:10]}"
+            )
+        if custom:
+            values = df[custom].apply(_text)
+            _problem(
+                problems, values.notna().sum(axis=1) > 10, "more than 10 custom fields"
+            )
+            _problem(
+                problems,
+                values.apply(lambda column: column.str.len() >= 10_000).any(axis=1),
+                "custom values of 10,000 characters or more",
+            )
+            df[custom] = values
+
+        for column, enum in (
+            ("gender", GenderEnum),
+            ("engagementType", EngagementEnum),
+        ):
+            if column in df:
+                members = {member.value: member for member in enum}
+                _problem(
+                    problems,
+                    df[column].notna() & ~df[column].isin(list(members)),
+                    f"invalid {column} values",
+                )
+                df[column] = df[column].map(members)
+        for column in ("age", "geolocation.latitude", "geolocation.longitude"):
+            if column in df:
+                numbers = pd.to_numeric(df[column], errors="coerce")
+                invalid = df[column].notna() & numbers.isna()
+                if column == "age":
+                    invalid |= numbers % 1 > 0
+                    numbers = numbers.astype("Int64").astype(object)
+                _problem(problems, invalid, f"invalid {column} values")
+                df[column] = numbers
+        for column in (
+            "pageId",
+            "parentGuid",
+            "authorProfileId",
+            "geolocation.id",
+            "geolocation.zipcode",
+        ):
+            if column in df:
+                df[column] = _text(df[column])
+
+        if problems:
+            raise ValueError(f"Could not validate items. {'; '.join(problems)}")
+        known = set(UploadItem.__fields__) | {
+            f"geolocation.{field}" for field in Geolocation.__fields__
+        }
+        return df[[c for c in df if c in known or c.startswith("custom.")]]
+
+    @staticmethod
+    def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Convert rows to item dictionaries, nesting geolocation and custom fields."""
         df = df.fillna("")
         sub_df = df[
             [
@@ -291,12 +519,129 @@ class UploadCollection(BaseModel):
                     records[i]["geolocation"] = geo_obj
                 if custom_obj:
                     records[i]["custom"] = custom_obj
-        return cls(items=records)
+        return records
+
+    @classmethod
+    def from_dataframe(
+        cls,
+        df: pd.DataFrame,
+        geography: Optional["GeographyIndex"] = None,
+        resolve_geography: bool = False,
+        trusted: bool = False,
+    ) -> "UploadCollection":
+        """Create UploadCollection from pandas DataFrame containing necessary fields
+
+        With a `geography` index, rows with an unknown `geolocation.id` are rejected
+        before upload, optionally after resolving location names to ids.
+        Mojibake in titles, authors and contents is fixed a column at a time with
+        `hexpy.text.TEXT_FIXER` before items are validated, and their validators do not fix it again.
+
+        With `trusted`, the dataframe is checked a column at a time instead of item by item:
+        required fields, language codes, lengths of contents and custom fields, number of
+        custom fields, urls, dates, gender and engagement values, and duplicate guids.
+        Items are then built without running their validators, so dates are converted to
+        UTC and titles, authors and contents are kept as they are, without fixing mojibake.
+        Problems raise ValueError listing the index labels of the rows that have them.
+
+        ## Arguments:
+            * df: pd.DataFrame
+            * geography: Optional GeographyIndex, validates geolocation ids.
+            * resolve_geography: Bool, replace unambiguous location names by their ids.
+            * trusted: Bool, check columns at once and build items without validating them one by one.
+        """
+        if geography is not None and "geolocation.id" in df.columns:
+            if resolve_geography:
+                df = df.assign(
+                    **{"geolocation.id": geography.resolve(df["geolocation.id"])}
+                )
+            valid = geography.validate(df["geolocation.id"])
+            if not valid.all():
+                invalid = df["geolocation.id"][~valid]
+                examples = list(invalid.unique()[:10])
+                raise ValueError(
+                    f"{len(invalid)} rows have unknown geolocation ids: {examples}"
+                )
+        if not trusted or df.empty:
+            return cls.parse_obj({"items": cls._records(_fix_text_columns(df))})
+        records = cls._records(cls._check_dataframe(df))
+        for record in records:
+            if "geolocation" in record:
+                record["geolocation"] = Geolocation.construct(**record["geolocation"])
+        return cls.construct(items=[UploadItem.construct(**rec) for rec in records])
+
+    @classmethod
+    def from_dataframes(
+        cls,
+        dfs: Iterable[pd.DataFrame],
+        geography: Optional["GeographyIndex"] = None,
+        resolve_geography: bool = False,
+        trusted: bool = False,
+    ) -> Iterator["UploadCollection"]:
+        """Create an UploadCollection from each chunk of a large spreadsheet, one at a time.
+
+        Chunks are validated as they are needed, so only the current one is held in
+        memory, e.g. with `pd.read_csv(filename, chunksize=1000)`. Guids are checked
+        for duplicates across chunks, and a guid already seen in an earlier chunk
+        raises ValueError when its chunk is reached.
+
+        ## Arguments:
+            * dfs: Iterable of pd.DataFrame
+            * geography: Optional GeographyIndex, validates geolocation ids.
+            * resolve_geography: Bool, replace unambiguous location names by their ids.
+            * trusted: Bool, check columns at once and build items without validating them one by one.
+        """
+        guids = GuidIndex()
+        for df in dfs:
+            collection = cls.from_dataframe(df, geography, resolve_geography, trusted)
+            chunk_guids = [str(item.guid) for item in collection]
+            duplicates = guids.find(chunk_guids)
+            if duplicates:
+                raise ValueError(f"Duplicate item guids detected: {duplicates}")
+            guids.add(chunk_guids)
+            yield collection
 
     def to_dataframe(self) -> pd.DataFrame:
         """Convert UploadCollection to pandas Dataframe with one colume for each field"""
         return json_normalize(self.dict())
 
+    def to_arrow(self) -> Any:
+        """Convert UploadCollection to a pyarrow Table with a typed column for each field.
+
+        Every field of UploadItem is a column, in the same order whether or not the items have it,
+        followed by the custom fields in alphabetical order. Dates are UTC timestamps.
+        """
+        return dataframe_table(self.to_dataframe(), upload_types())
+
+    def to_parquet(
+        self,
+        path: Union[str, Path],
+        compression: str = "zstd",
+        row_group_size: int = ROW_GROUP_SIZE,
+    ) -> None:
+        """Write UploadCollection to a Parquet file with a typed column for each field.
+
+        # Arguments
+            path: String or Path, location of the file.
+            compression: String, `zstd`, `snappy`, `gzip`, `brotli`, `lz4` or `none`.
+            row_group_size: Integer, maximum number of items in a row group.
+        """
+        write_table(self.to_arrow(), path, "parquet", compression, row_group_size)
+
+    def to_feather(
+        self,
+        path: Union[str, Path],
+        compression: str = "zstd",
+        row_group_size: int = ROW_GROUP_SIZE,
+    ) -> None:
+        """Write UploadCollection to an Arrow IPC (Feather) file with a typed column for each field.
+
+        # Arguments
+            path: String or Path, location of the file.
+            compression: String, `zstd`, `lz4` or `none`.
+            row_group_size: Integer, maximum number of items in a record batch.
+        """
+        write_table(self.to_arrow(), path, "feather", compression, row_group_size)
+
     def dict(self, *args: Any, **kwargs: Any):  # type: ignore
         return [rec.dict(exclude_unset=True) for rec in self.items]
 
@@ -308,9 +653,12 @@ class UploadCollection(BaseModel):
             yield item
 
     def __getitem__(self, slice: Union[int, slice]):  # type: ignore
+        """Return an item, or a collection of a slice of the items without validating them again."""
         items = self.items[slice]
         if isinstance(items, list):
-            return UploadCollection(items=items)
+            if not items:
+                return UploadCollection(items=items)
+            return UploadCollection.construct(items=items)
         else:
             return items
 
@@ -366,17 +714,17 @@ class TrainItem(BaseModel):
     @validator("contents")
     def fix_contents(cls, value: str) -> str:
         """Fix mojibake in contents"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     @validator("title")
     def fix_title(cls, value: str) -> str:
         """Fix mojibake in title"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     @validator("author")
     def fix_author(cls, value: str) -> str:
         """Fix mojibake in author"""
-        return ftfy.fix_text(value)
+        return fix_text(value)
 
     def __hash__(self):  # type: ignore
         """Identify unique object by url"""
@@ -445,14 +793,47 @@ class TrainCollection(BaseModel):
         return items
 
     @classmethod
-    def from_dataframe(cls, df: pd.DataFrame) -> "TrainCollection":
+    def from_dataframe(
+        cls, df: pd.DataFrame, trusted: bool = False
+    ) -> "TrainCollection":
         """Create TrainCollection from pandas DataFrame containing necessary fields
 
+        Mojibake in titles, authors and contents is fixed a column at a time with
+        `hexpy.text.TEXT_FIXER` before items are validated, and their validators do not fix it again.
+
+        With `trusted`, the dataframe is checked a column at a time instead of item by item:
+        required fields, language codes, urls, dates, duplicate urls and a single category id.
+        Items are then built without running their validators, as in `UploadCollection.from_dataframe`.
+
         ## Arguments:
             * df: pd.DataFrame
+            * trusted: Bool, check columns at once and build items without validating them one by one.
         """
-        records = df.to_dict(orient="records")
-        return cls(items=records)
+        if not trusted or df.empty:
+            records = _fix_text_columns(df).to_dict(orient="records")
+            return cls(items=records)
+        problems: List[str] = []
+        df = _check_frame(df, list(TrainItem.__fields__), problems)
+        _problem(
+            problems,
+            df["url"].duplicated(keep=False) & df["url"].notna(),
+            "duplicate urls",
+        )
+        category_ids = pd.to_numeric(df["categoryid"], errors="coerce")
+        _problem(
+            problems,
+            df["categoryid"].notna() & (category_ids.isna() | (category_ids % 1 > 0)),
+            "invalid categoryid values",
+        )
+        if category_ids.nunique() > 1:
+            problems.append(
+                f"Multiple `categoryid` values detected: {set(category_ids.dropna())}"
+            )
+        if problems:
+            raise ValueError(f"Could not validate items. {'; '.join(problems)}")
+        df["categoryid"] = category_ids.astype("int64").astype(object)
+        records = df[list(TrainItem.__fields__)].to_dict(orient="records")
+        return cls.construct(items=[TrainItem.construct(**rec) for rec in records])
 
     def to_dataframe(self) -> pd.DataFrame:
         """Convert TrainCollection to pandas Dataframe with one colume for each Field"""
@@ -469,9 +850,12 @@ class TrainCollection(BaseModel):
             yield item
 
     def __getitem__(self, index):  # type:ignore
+        """Return an item, or a collection of a slice of the items without validating them again."""
         items = self.items[index]
         if isinstance(items, list):
-            return TrainCollection(items=items)
+            if not items:
+                return TrainCollection(items=items)
+            return TrainCollection.construct(items=items)
         else:
             return items
 
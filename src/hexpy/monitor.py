@@ -1,20 +1,59 @@
 """Module for monitor results API"""
 
 import inspect
+import json
 import logging
-from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
-
-from .base import JSONDict, handle_response, rate_limited
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .base import (
+    BULK,
+    INTERACTIVE,
+    MAX_BATCH_ITEMS,
+    MAX_PAYLOAD_BYTES,
+    JSONDict,
+    cacheable,
+    handle_response,
+    iter_items,
+    json_array,
+    pack_payloads,
+    rate_limited,
+    with_priority,
+)
 from .models import TrainCollection
 from .session import HexpySession
 
 DateOrDates = Union[Tuple[str, str], Sequence[Tuple[str, str]]]
 MonitorOrMonitors = Union[Sequence[int], int]
 MetricOrMetrics = Union[Sequence[str], str]
+Cell = Tuple[int, str, str, str]
 
 logger = logging.getLogger(__name__)
 
 
+def _date(timestamp: str) -> str:
+    """Shorten a volume period boundary to a date when it falls on midnight."""
+    if timestamp.endswith("T00:00:00"):
+        return timestamp[: -len("T00:00:00")]
+    return timestamp
+
+
+def _post_key(post: JSONDict) -> str:
+    """Identify a post by its url, or by its contents when it has none."""
+    return post.get("url") or json.dumps(post, sort_keys=True)
+
+
 class MonitorAPI:
     """Class for working with Crimson Hexagon Monitor API.
 
@@ -31,18 +70,36 @@ class MonitorAPI:
     ```
     """
 
+    POSTS_LIMIT = 10000
+
     def __init__(self, session: HexpySession) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
+        self.codec = session.codec
         self.TEMPLATE = session.ROOT + "monitor/"
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name not in [
                 "__init__",
                 "_aggregate_metrics",
                 "_aggregate_dates",
+                "_aggregate_layout",
+                "_call_cell",
                 "aggregate",
+                "batch_train",
+                "_training_batches",
+                "_posts_windows",
+                "iter_posts",
             ]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self,
+                    name,
+                    rate_limited(
+                        fn,
+                        session.limiter,
+                        session.retry_policy,
+                        session.cache,
+                        session.cache_scope,
+                    ),
                 )
         self.METRICS: Dict[str, Callable[..., JSONDict]] = {
             "volume": self.volume,
@@ -54,15 +111,16 @@ class MonitorAPI:
 
     def _aggregate_metrics(
         self, monitor_id: int, date: Sequence[str], metrics: MetricOrMetrics
-    ) -> JSONDict:
+    ) -> Dict[str, Cell]:
         if isinstance(metrics, list):
+            if not all(metric in self.METRICS for metric in metrics):
+                raise ValueError(f"valid metrics are {self.METRICS.keys()}")
             return {
-                metric: self.METRICS[metric](monitor_id, date[0], date[1])
-                for metric in metrics
+                metric: (monitor_id, date[0], date[1], metric) for metric in metrics
             }
         elif metrics in self.METRICS:
             metric: str = str(metrics)
-            return {metric: self.METRICS[metric](monitor_id, date[0], date[1])}
+            return {metric: (monitor_id, date[0], date[1], metric)}
         else:
             raise ValueError(f"valid metrics are {self.METRICS.keys()}")
 
@@ -91,26 +149,13 @@ class MonitorAPI:
                 }
             ]
 
-    def aggregate(
+    def _aggregate_layout(
         self,
         monitor_ids: MonitorOrMonitors,
         dates: DateOrDates,
         metrics: MetricOrMetrics,
     ) -> List[JSONDict]:
-        """Return aggregated results for one or monitor ids, for one or more date pairs, for one or more metrics.
-
-        Valid metrics
-        * 'volume'
-        * 'word_cloud'
-        * 'top_sources'
-        * 'interest_affinities'
-        * 'sentiment_and_categories'
-
-        # Arguments
-            monitor_ids: Integer or list of Integers, id(s) of the monitor(s) being requested
-            dates: Tuple of Strings or list of Tuples, pair(s) of 'YYYY-MM-DD' date strings
-            metrics: String or list of Strings, metric(s) to aggregate upon
-        """
+        """Return the structure of aggregated results with a cell in place of every call."""
         if isinstance(monitor_ids, list):
             return [
                 {
@@ -133,6 +178,90 @@ class MonitorAPI:
                 "monitor_ids must be integer or list of integers to aggregate"
             )
 
+    @staticmethod
+    def _aggregate_cells(layout: List[JSONDict]) -> List[Cell]:
+        """Return every distinct cell of the layout in order."""
+        cells: Dict[Cell, None] = {}
+        for monitor in layout:
+            for period in monitor["results"]:
+                cells.update(dict.fromkeys(period["results"].values()))
+        return list(cells)
+
+    @staticmethod
+    def _fill_layout(layout: List[JSONDict], values: Dict[Cell, Any]) -> None:
+        """Replace every cell of the layout with its result, or None if it failed."""
+        for monitor in layout:
+            for period in monitor["results"]:
+                period["results"] = {
+                    metric: values.get(cell)
+                    for metric, cell in period["results"].items()
+                }
+
+    def _call_cell(self, cell: Cell) -> JSONDict:
+        monitor_id, start, end, metric = cell
+        return with_priority(self.METRICS[metric], BULK)(monitor_id, start, end)
+
+    def aggregate(
+        self,
+        monitor_ids: MonitorOrMonitors,
+        dates: DateOrDates,
+        metrics: MetricOrMetrics,
+        max_workers: int = 1,
+        return_errors: bool = False,
+    ) -> Any:
+        """Return aggregated results for one or monitor ids, for one or more date pairs, for one or more metrics.
+
+        Valid metrics
+        * 'volume'
+        * 'word_cloud'
+        * 'top_sources'
+        * 'interest_affinities'
+        * 'sentiment_and_categories'
+
+        Calls are made in `max_workers` threads drawing from the session's rate limit.
+        Results keep the order of `monitor_ids`, `dates` and `metrics`.
+        With `return_errors`, failed calls do not stop the others. Their results are
+        set to None, and a dictionary of errors keyed by
+        `(monitor_id, start, end, metric)` is returned along with the results.
+
+        # Arguments
+            monitor_ids: Integer or list of Integers, id(s) of the monitor(s) being requested
+            dates: Tuple of Strings or list of Tuples, pair(s) of 'YYYY-MM-DD' date strings
+            metrics: String or list of Strings, metric(s) to aggregate upon
+            max_workers: Integer, number of calls to make concurrently.
+            return_errors: Boolean, if True, return a tuple of results and errors instead of raising the first error.
+        """
+        layout = self._aggregate_layout(monitor_ids, dates, metrics)
+        values: Dict[Cell, JSONDict] = {}
+        errors: Dict[Cell, Exception] = {}
+        cells = self._aggregate_cells(layout)
+
+        if max_workers <= 1:
+            for cell in cells:
+                try:
+                    values[cell] = self._call_cell(cell)
+                except Exception as error:
+                    if not return_errors:
+                        raise
+                    errors[cell] = error
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self._call_cell, cell) for cell in cells]
+                for cell, future in zip(cells, futures):
+                    try:
+                        values[cell] = future.result()
+                    except Exception as error:
+                        if not return_errors:
+                            for pending in futures:
+                                pending.cancel()
+                            raise
+                        errors[cell] = error
+
+        self._fill_layout(layout, values)
+        if return_errors:
+            return layout, errors
+        return layout
+
     def details(self, monitor_id: int) -> JSONDict:
         """Return detailed metadata about the selected monitor, including category metadata.
 
@@ -153,6 +282,7 @@ class MonitorAPI:
             self.session.get(self.TEMPLATE + "audit", params={"id": monitor_id})
         )
 
+    @cacheable
     def word_cloud(
         self, monitor_id: int, start: str, end: str, filter_string: Optional[str] = None
     ) -> JSONDict:
@@ -198,6 +328,27 @@ class MonitorAPI:
             )
         )
 
+    def stream_training_posts(
+        self, monitor_id: int, category: Optional[int] = None
+    ) -> Iterator[JSONDict]:
+        """Yield the training posts for a given opinion monitor as the response is downloaded.
+
+        Same as `training_posts`, but the compressed response is parsed incrementally
+        when [ijson](https://github.com/ICRAR/ijson) is installed, so the whole body is never held in memory.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            category: Integer, category id to target training posts from a specific category
+        """
+        return iter_items(
+            self.session.get(
+                self.TEMPLATE + "trainingposts",
+                params={"id": monitor_id, "category": category},
+                stream=True,
+            ),
+            "trainingPosts",
+        )
+
     def train_monitor(self, monitor_id: int, items: TrainCollection) -> JSONDict:
         """Upload training documents to monitor programmatically.
 
@@ -219,34 +370,76 @@ class MonitorAPI:
             self.session.post(
                 self.TEMPLATE + "train",
                 params={"id": monitor_id},
-                json={
-                    "monitorid": monitor_id,
-                    "categoryid": items[0].categoryid,
-                    "documents": items.dict(),
-                },
+                data=self.codec.dumps(
+                    {
+                        "monitorid": monitor_id,
+                        "categoryid": items[0].categoryid,
+                        "documents": items.dict(),
+                    }
+                ),
+                headers={"Content-Type": "application/json"},
             )
         )
 
-    def batch_train(self, monitor_id: int, items: TrainCollection) -> JSONDict:
+    def _post_training(
+        self, monitor_id: int, category_id: int, payloads: List[bytes]
+    ) -> JSONDict:
+        """Upload training documents serialized beforehand, in one request."""
+        return handle_response(
+            self.session.post(
+                self.TEMPLATE + "train",
+                params={"id": monitor_id},
+                data=b'{"monitorid":'
+                + self.codec.dumps(monitor_id)
+                + b',"categoryid":'
+                + self.codec.dumps(category_id)
+                + b',"documents":'
+                + json_array(payloads)
+                + b"}",
+                headers={"Content-Type": "application/json"},
+            )
+        )
+
+    def _training_batches(
+        self, items: TrainCollection, max_bytes: int
+    ) -> List[Tuple[int, List[bytes]]]:
+        """Serialize every item once and pack them into batches by count and size."""
+        payloads = [self.codec.dumps(item) for item in items.dict()]
+        return [
+            (items.items[batch.start].categoryid, payloads[batch])
+            for batch in pack_payloads(payloads, MAX_BATCH_ITEMS, max_bytes)
+        ]
+
+    def batch_train(
+        self,
+        monitor_id: int,
+        items: TrainCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> JSONDict:
         """Batch upload training documents to monitor programmatically for collection larger than 1000 posts.
 
         Batch upload TrainCollection of single category. Due to the restrictions involved in using this endpoint, unless you have a specific need to train monitors programmatically, training monitors via the user interface in ForSight will normally be the more efficient training option.
+        Every item is serialized once, and consecutive items are packed into batches of at most 1000 items and `max_bytes` bytes.
 
         # Arguments
             monitor_id: Integer, id of the monitor or monitor filter being requested
             category_id: Integer, the category this content should belong to
             items: validated instance of [TrainCollection](Data_Validation.md#traincollection) model
+            max_bytes: Integer, target size of the documents of a batch in bytes.
         """
 
         batch_responses = {}
-        for batch_num, batch in enumerate(
-            [items[i : i + 1000] for i in range(0, len(items), 1000)]
+        for batch_num, (category_id, payloads) in enumerate(
+            self._training_batches(items, max_bytes)
         ):
-            response = self.train_monitor(monitor_id=monitor_id, items=batch)
+            response = with_priority(self._post_training, BULK)(
+                monitor_id, category_id, payloads
+            )
             logger.info(f"Uploaded batch number: {batch_num}")
             batch_responses[f"Batch {batch_num}"] = response
         return batch_responses
 
+    @cacheable
     def interest_affinities(
         self,
         monitor_id: int,
@@ -316,6 +509,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def top_sources(self, monitor_id: int, start: str, end: str) -> JSONDict:
         """Return volume information related to the sites and content sources (e.g. Twitter, Forums, Blogs, etc.) in a monitor.
 
@@ -361,6 +555,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def volume(
         self, monitor_id: int, start: str, end: str, group_by: str = "DAILY"
     ) -> JSONDict:
@@ -414,6 +609,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def sentiment_and_categories(
         self, monitor_id: int, start: str, end: str, hide_excluded: bool = False
     ) -> JSONDict:
@@ -474,12 +670,168 @@ class MonitorAPI:
             )
         )
 
+    def stream_posts(
+        self,
+        monitor_id: int,
+        start: str,
+        end: str,
+        filter_string: Optional[str] = None,
+        extend_limit: bool = False,
+        full_contents: bool = False,
+        geotagged: bool = False,
+    ) -> Iterator[JSONDict]:
+        """Yield the posts for a given monitor as the response is downloaded.
+
+        Same as `posts`, but the compressed response is parsed incrementally when
+        [ijson](https://github.com/ICRAR/ijson) is installed, so a page of 10,000 posts with full contents is never held in memory at once.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            start: String, inclusive start date in YYYY-MM-DD
+            end: String, exclusive end date in YYYY-MM-DD
+            filter_string: String, pipe-separated list of field:value pairs used to filter posts
+            extend_limit: Boolean if True increase limit of returned posts from 500 per call to 10000 per call
+            full_contents: Boolean, if True, the contents field will return the original, complete posts contents instead of truncating around search terms
+            geo tagged: Boolean, if True, returns only geotagged documents matching the given filter
+        """
+        return iter_items(
+            self.session.get(
+                self.TEMPLATE + "posts",
+                params={
+                    "id": monitor_id,
+                    "start": start,
+                    "end": end,
+                    "filter": filter_string,
+                    "extendLimit": extend_limit,
+                    "fullContents": full_contents,
+                    "geotagged": geotagged,
+                },
+                stream=True,
+            ),
+            "posts",
+        )
+
+    @staticmethod
+    def _pack_windows(
+        periods: List[JSONDict], cap: int
+    ) -> Tuple[List[Tuple[str, str]], List[JSONDict]]:
+        """Merge consecutive volume periods into windows holding at most `cap` posts.
+
+        Returns the windows as start and end pairs, and the periods holding more than
+        `cap` posts on their own.
+        """
+        windows: List[List[str]] = []
+        oversized: List[JSONDict] = []
+        window: Optional[List[str]] = None
+        total = 0
+        for period in periods:
+            count = period["numberOfDocuments"]
+            if count > cap:
+                oversized.append(period)
+                window = None
+                continue
+            if window is not None and total + count <= cap:
+                window[1] = period["endDate"]
+                total += count
+            else:
+                window = [period["startDate"], period["endDate"]]
+                windows.append(window)
+                total = count
+        return [(_date(start), _date(end)) for start, end in windows], oversized
+
+    def _posts_windows(
+        self,
+        monitor_id: int,
+        start: str,
+        end: str,
+        cap: int,
+        volumes: Optional[List[Tuple[str, str, str]]] = None,
+        volume: Optional[Callable[..., JSONDict]] = None,
+    ) -> List[Tuple[str, str]]:
+        """Split a date range into windows whose volume fits under `cap` posts.
+
+        The start, end and grouping of every volume call made are added to `volumes`.
+        Volumes are fetched with `volume` instead of `MonitorAPI.volume` if given.
+        """
+        if volumes is None:
+            volumes = []
+        fetch = volume or with_priority(self.volume, BULK)
+        volumes.append((start, end, "DAILY"))
+        daily = fetch(monitor_id, start, end, group_by="DAILY")
+        windows, busy_days = self._pack_windows(daily["volume"], cap)
+        for day in busy_days:
+            volumes.append((_date(day["startDate"]), _date(day["endDate"]), "HOURLY"))
+            hours = fetch(monitor_id, *volumes[-1][:2], group_by="HOURLY")["volume"]
+            hour_windows, busy_hours = self._pack_windows(hours, cap)
+            windows.extend(hour_windows)
+            for hour in busy_hours:
+                logger.warning(
+                    f"{hour['numberOfDocuments']} posts from {hour['startDate']} to {hour['endDate']}. Posts will be sampled."
+                )
+                windows.append((hour["startDate"], hour["endDate"]))
+        return sorted(windows)
+
+    def iter_posts(
+        self,
+        monitor_id: int,
+        start: str,
+        end: str,
+        filter_string: Optional[str] = None,
+        full_contents: bool = False,
+        geotagged: bool = False,
+        max_workers: int = 4,
+    ) -> Iterator[JSONDict]:
+        """Yield every post in a date range, beyond the 10,000 posts returned per call.
+
+        The daily volume of the monitor is used to split the range into windows of days,
+        or hours for busy days, holding at most 10,000 posts each. Windows are fetched in
+        `max_workers` threads drawing from the session's rate limit, and their posts are
+        yielded as they arrive, once each. Hours holding more than 10,000 posts are still
+        sampled by the API.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            start: String, inclusive start date in YYYY-MM-DD
+            end: String, exclusive end date in YYYY-MM-DD
+            filter_string: String, pipe-separated list of field:value pairs used to filter posts
+            full_contents: Boolean, if True, the contents field will return the original, complete posts contents instead of truncating around search terms
+            geo tagged: Boolean, if True, returns only geotagged documents matching the given filter
+            max_workers: Integer, number of windows to fetch concurrently.
+        """
+        windows = self._posts_windows(monitor_id, start, end, self.POSTS_LIMIT)
+        seen: Set[str] = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    with_priority(self.posts, BULK),
+                    monitor_id,
+                    window_start,
+                    window_end,
+                    filter_string=filter_string,
+                    extend_limit=True,
+                    full_contents=full_contents,
+                    geotagged=geotagged,
+                )
+                for window_start, window_end in windows
+            ]
+            try:
+                for future in as_completed(futures):
+                    for post in future.result()["posts"]:
+                        key = _post_key(post)
+                        if key not in seen:
+                            seen.add(key)
+                            yield post
+            finally:
+                for future in futures:
+                    future.cancel()
+
     ##########################################################################
     # Demographics                                                           #
     # This collection of endpoints provide demographic volume Metrics        #
     #  for users within a given monitor.                                     #
     ##########################################################################
 
+    @cacheable
     def age(self, monitor_id: int, start: str, end: str) -> JSONDict:
         """Return volume metrics for a given monitor split by age bracket.
 
@@ -495,6 +847,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def ethnicity(self, monitor_id: int, start: str, end: str) -> JSONDict:
         """Return volume metrics for a given monitor split by ethnicity.
 
@@ -510,6 +863,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def gender(self, monitor_id: int, start: str, end: str) -> JSONDict:
         """Return volume metrics for a given monitor split by gender.
 
@@ -530,6 +884,7 @@ class MonitorAPI:
     #                                                                        #
     ##########################################################################
 
+    @cacheable
     def cities(self, monitor_id: int, start: str, end: str, country: str) -> JSONDict:
         """Return volume metrics for a given monitor split by city.
 
@@ -552,6 +907,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def states(self, monitor_id: int, start: str, end: str, country: str) -> JSONDict:
         """Return volume metrics for a given monitor split by state.
 
@@ -573,6 +929,7 @@ class MonitorAPI:
             )
         )
 
+    @cacheable
     def countries(self, monitor_id: int, start: str, end: str) -> JSONDict:
         """Return volume metrics for a given monitor split by country.
 
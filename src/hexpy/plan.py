@@ -0,0 +1,367 @@
+"""Module for planning the API calls of large operations before running them"""
+
+import inspect
+from collections import Counter
+from typing import Any, Callable, Iterable, List, NamedTuple, Tuple
+
+from .base import (
+    BULK,
+    INTERACTIVE,
+    MAX_BATCH_ITEMS,
+    MAX_PAYLOAD_BYTES,
+    JSONDict,
+    call_arguments,
+    with_priority,
+)
+from .content_upload import ContentUploadAPI
+from .models import TrainCollection, UploadCollection
+from .monitor import (
+    DateOrDates,
+    MetricOrMetrics,
+    MonitorAPI,
+    MonitorOrMonitors,
+)
+from .session import HexpySession
+
+BATCH_SIZE = MAX_BATCH_ITEMS
+
+
+class PlannedCall(NamedTuple):
+    """One call an operation would make."""
+
+    method: str
+    arguments: JSONDict
+    cached: bool
+
+
+class CallPlan:
+    """API calls an operation would make, and how long the rate limit stretches them.
+
+    The estimate is taken from the state of the limiter when the plan is made, and
+    counts only the time spent waiting for the rate limit, not the time the API takes
+    to respond. Calls served from the cache do not count against the rate limit.
+
+    # Arguments
+        calls: List of PlannedCall, calls in the order they would be made.
+        limiter: RateLimiter or AsyncRateLimiter the calls draw tokens from.
+        priority: Integer, `INTERACTIVE` or `BULK`, the lane the calls draw tokens in.
+    """
+
+    def __init__(
+        self, calls: List[PlannedCall], limiter: Any, priority: int = INTERACTIVE
+    ) -> None:
+        self.calls = calls
+        self.priority = priority
+        self.eta = limiter.estimate(self.api_calls, priority)
+
+    @property
+    def cache_hits(self) -> int:
+        """Number of calls that would be served from the cache."""
+        return sum(call.cached for call in self.calls)
+
+    @property
+    def api_calls(self) -> int:
+        """Number of calls that would be sent to the API."""
+        return len(self.calls) - self.cache_hits
+
+    def summary(self) -> JSONDict:
+        """Return the number of calls per method, cache hits and estimated seconds."""
+        return {
+            "calls": len(self.calls),
+            "api_calls": self.api_calls,
+            "cache_hits": self.cache_hits,
+            "eta_seconds": round(self.eta, 1),
+            "methods": dict(Counter(call.method for call in self.calls)),
+        }
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.api_calls} API calls and {self.cache_hits} cache hits, "
+            f"about {self.eta:.0f} seconds at the current rate limit"
+        )
+
+
+class Planner:
+    """Plan the calls of aggregations, batch uploads and posts exports without making them.
+
+    Every plan lists the calls an operation would make, which of them the session
+    cache would serve, and how long the rate limit would stretch the rest.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy import HexpySession
+    >>> from hexpy.plan import Planner
+    >>> session = HexpySession.load_auth_from_file()
+    >>> planner = Planner(session)
+    >>> plan = planner.aggregate([123, 456], [("2019-01-01", "2019-02-01")], ["volume", "word_cloud"])
+    >>> print(plan)
+    4 API calls and 0 cache hits, about 0 seconds at the current rate limit
+    >>> plan.summary()
+    ```
+
+    # Arguments
+        session: HexpySession, session whose limiter and cache the operations would use.
+    """
+
+    def __init__(self, session: HexpySession) -> None:
+        self.session = session
+        self.limiter = session.limiter
+        self.monitor = MonitorAPI(session)
+        self.content = ContentUploadAPI(session)
+
+    def _call(
+        self, method: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> PlannedCall:
+        """Describe a call to the rate limited client method `method`."""
+        func = inspect.unwrap(method)
+        arguments = call_arguments(func, args, kwargs)
+        cache = self.session.cache if getattr(func, "cacheable", False) else None
+        cached = False
+        if cache is not None:
+            key = cache.key(func.__qualname__, arguments, self.session.cache_scope)
+            cached = key in cache
+        return PlannedCall(func.__qualname__, arguments, cached)
+
+    def call(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> CallPlan:
+        """Plan a single call to a client method, e.g. `planner.call(client.volume, 123, start, end)`."""
+        return CallPlan([self._call(method, *args, **kwargs)], self.limiter)
+
+    def aggregate(
+        self,
+        monitor_ids: MonitorOrMonitors,
+        dates: DateOrDates,
+        metrics: MetricOrMetrics,
+    ) -> CallPlan:
+        """Plan a call to `MonitorAPI.aggregate`.
+
+        # Arguments
+            monitor_ids: Integer or list of Integers, ids of the monitors.
+            dates: start and end pair, or list of start and end pairs.
+            metrics: String or list of Strings, metrics to aggregate.
+        """
+        layout = self.monitor._aggregate_layout(monitor_ids, dates, metrics)
+        calls = [
+            self._call(self.monitor.METRICS[metric], monitor_id, start, end)
+            for monitor_id, start, end, metric in self.monitor._aggregate_cells(layout)
+        ]
+        return CallPlan(calls, self.limiter, BULK)
+
+    def _upload_batches(
+        self, document_type: int, items: UploadCollection, max_bytes: int
+    ) -> List[PlannedCall]:
+        """Describe the batches `batch_upload` packs items into by count and size."""
+        return [
+            PlannedCall(
+                ContentUploadAPI._post_upload.__qualname__,
+                {"document_type": document_type, "items": len(payloads)},
+                False,
+            )
+            for _, payloads in self.content._batches(items, max_bytes)
+        ]
+
+    def _training_batches(
+        self, monitor_id: int, items: TrainCollection, max_bytes: int
+    ) -> List[PlannedCall]:
+        """Describe the batches `batch_train` packs documents into by count and size."""
+        return [
+            PlannedCall(
+                MonitorAPI._post_training.__qualname__,
+                {
+                    "monitor_id": monitor_id,
+                    "category_id": category_id,
+                    "items": len(payloads),
+                },
+                False,
+            )
+            for category_id, payloads in self.monitor._training_batches(
+                items, max_bytes
+            )
+        ]
+
+    def _delegating(
+        self, handover: PlannedCall, size: int, batches: Callable[[], List[PlannedCall]]
+    ) -> CallPlan:
+        """Plan a call that hands more than 1000 items over to its batch method."""
+        if size <= BATCH_SIZE:
+            return CallPlan([handover], self.limiter)
+        return CallPlan([handover] + batches(), self.limiter, BULK)
+
+    def batch_upload(
+        self,
+        document_type: int,
+        items: UploadCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> CallPlan:
+        """Plan a call to `ContentUploadAPI.batch_upload`.
+
+        Items are packed into batches by count and serialized size, as the upload would,
+        and every batch is a call to `ContentUploadAPI._post_upload`.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            items: validated UploadCollection.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        calls = self._upload_batches(document_type, items, max_bytes)
+        return CallPlan(calls, self.limiter, BULK)
+
+    def upload(
+        self,
+        document_type: int,
+        items: UploadCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> CallPlan:
+        """Plan a call to `ContentUploadAPI.upload`.
+
+        With more than 1000 items, the call draws a token of its own before handing
+        the items over to `batch_upload`.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            items: validated UploadCollection.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        handover = PlannedCall(
+            ContentUploadAPI.upload.__qualname__,
+            {"document_type": document_type, "items": len(items)},
+            False,
+        )
+        return self._delegating(
+            handover,
+            len(items),
+            lambda: self._upload_batches(document_type, items, max_bytes),
+        )
+
+    def stream_upload(
+        self,
+        document_type: int,
+        collections: Iterable[UploadCollection],
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> CallPlan:
+        """Plan a call to `ContentUploadAPI.stream_upload`.
+
+        Every collection is uploaded in batches of its own, so a collection of 1500
+        items takes two calls. Collections are consumed, one at a time.
+
+        # Arguments
+            document_type: Integer, The id of the document type to which the uploading docs will belong.
+            collections: Iterable of validated UploadCollections.
+            max_bytes: Integer, target size of the items of a batch in bytes.
+        """
+        calls = [
+            call
+            for items in collections
+            for call in self._upload_batches(document_type, items, max_bytes)
+        ]
+        return CallPlan(calls, self.limiter, BULK)
+
+    def batch_train(
+        self,
+        monitor_id: int,
+        items: TrainCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> CallPlan:
+        """Plan a call to `MonitorAPI.batch_train`.
+
+        Every batch is a call to `MonitorAPI._post_training`.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being trained.
+            items: validated instance of [TrainCollection](Data_Validation.md#traincollection) model
+            max_bytes: Integer, target size of the documents of a batch in bytes.
+        """
+        calls = self._training_batches(monitor_id, items, max_bytes)
+        return CallPlan(calls, self.limiter, BULK)
+
+    def train_monitor(
+        self,
+        monitor_id: int,
+        items: TrainCollection,
+        max_bytes: int = MAX_PAYLOAD_BYTES,
+    ) -> CallPlan:
+        """Plan a call to `MonitorAPI.train_monitor`.
+
+        With more than 1000 items, the call draws a token of its own before handing
+        the items over to `batch_train`.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being trained.
+            items: validated instance of [TrainCollection](Data_Validation.md#traincollection) model
+            max_bytes: Integer, target size of the documents of a batch in bytes.
+        """
+        handover = PlannedCall(
+            MonitorAPI.train_monitor.__qualname__,
+            {"monitor_id": monitor_id, "items": len(items)},
+            False,
+        )
+        return self._delegating(
+            handover,
+            len(items),
+            lambda: self._training_batches(monitor_id, items, max_bytes),
+        )
+
+    def _cached_volume(
+        self, monitor_id: int, start: str, end: str, group_by: str
+    ) -> JSONDict:
+        """Return a volume from the session cache, without calling the API."""
+        func = inspect.unwrap(self.monitor.volume)
+        arguments = call_arguments(
+            func, (monitor_id, start, end), {"group_by": group_by}
+        )
+        cache = self.session.cache
+        cached = None
+        if cache is not None:
+            key = cache.key(func.__qualname__, arguments, self.session.cache_scope)
+            cached = cache.peek(key)
+        if cached is None:
+            raise ValueError(
+                f"Planning the export needs the {group_by.lower()} volume of monitor {monitor_id} "
+                f"from {start} to {end}, which is not in the session cache. "
+                "Pass fetch_volume=True to fetch it, drawing from the rate limit."
+            )
+        return cached
+
+    def iter_posts(
+        self, monitor_id: int, start: str, end: str, fetch_volume: bool = False
+    ) -> CallPlan:
+        """Plan a call to `MonitorAPI.iter_posts`.
+
+        The windows of an export depend on the volume of the monitor. By default, the
+        volumes are read from the session cache and planning makes no calls, raising a
+        ValueError if a volume is not cached. With `fetch_volume=True`, planning makes
+        the volume calls the export starts with, and with a session cache the export
+        then gets them from the cache.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor or monitor filter being requested
+            start: String, inclusive start date in YYYY-MM-DD
+            end: String, exclusive end date in YYYY-MM-DD
+            fetch_volume: Boolean, if True, call the API for volumes that are not cached.
+        """
+        monitor = self.monitor
+        volumes: List[Tuple[str, str, str]] = []
+        windows = monitor._posts_windows(
+            monitor_id,
+            start,
+            end,
+            monitor.POSTS_LIMIT,
+            volumes,
+            with_priority(monitor.volume, BULK)
+            if fetch_volume
+            else self._cached_volume,
+        )
+        calls = [
+            self._call(monitor.volume, monitor_id, *volume[:2], group_by=volume[2])
+            for volume in volumes
+        ]
+        calls.extend(
+            self._call(
+                monitor.posts, monitor_id, window_start, window_end, extend_limit=True
+            )
+            for window_start, window_end in windows
+        )
+        return CallPlan(calls, self.limiter, BULK)
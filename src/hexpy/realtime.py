@@ -3,7 +3,7 @@
 import inspect
 from typing import Any, Dict, List
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import INTERACTIVE, JSONDict, handle_response, rate_limited
 from .session import HexpySession
 
 
@@ -23,11 +23,12 @@ class RealtimeAPI:
 
     def __init__(self, session: HexpySession) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
         self.TEMPLATE = session.ROOT + "realtime/monitor/"
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name not in ["__init__"]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self, name, rate_limited(fn, session.limiter, session.retry_policy)
                 )
 
     def cashtags(self, monitor_id: int, start: int = None, top: int = None) -> JSONDict:
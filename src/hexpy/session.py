@@ -1,17 +1,124 @@
 """Module for handling API authorization"""
 
+import functools
+import hashlib
 import inspect
 import json
 import logging
+import threading
 from getpass import getpass
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import (
+    JSONCodec,
+    JSONDict,
+    RateLimiter,
+    RetryPolicy,
+    SharedRateLimiter,
+    SingleFlight,
+    handle_response,
+    rate_limited,
+)
+from .cache import MemoryCache, ResponseCache
 
 logger = logging.getLogger(__name__)
 
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+
+def request_key(url: str, params: Any, kwargs: Dict[str, Any]) -> str:
+    """Return a key identifying a request by its URL and arguments."""
+    return json.dumps([url, params, kwargs], sort_keys=True, default=str)
+
+
+Timeout = Union[float, Tuple[float, float], None]
+
+
+class PoolConfig:
+    """Connection pool settings of a `HexpySession`.
+
+    Every session created with the same `PoolConfig` shares its pool of connections,
+    so the connection opened to log in is reused by the clients of the session.
+
+    # Arguments
+        pool_connections: Integer, number of hosts to keep a pool of connections for.
+        pool_maxsize: Integer, number of connections kept open per host. Should be at least the number of threads making calls.
+        block: Boolean, if True, threads wait for a free connection once `pool_maxsize` connections are in use, instead of opening connections that are closed after one request.
+        keep_alive: Boolean, if False, connections are closed after every request.
+        timeout: Number or Tuple of (connect, read) Numbers, seconds to wait for the server. Default is to wait forever.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        block: bool = False,
+        keep_alive: bool = True,
+        timeout: Timeout = None,
+    ) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.block = block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._adapter: Optional[HTTPAdapter] = None
+        self._lock = threading.Lock()
+
+    @property
+    def adapter(self) -> HTTPAdapter:
+        """Transport adapter holding the pool of connections."""
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.block,
+                )
+            return self._adapter
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Have `session` send requests through the pool of connections."""
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+
+class CoalescingSession(requests.Session):
+    """requests Session sending concurrent identical GET requests only once.
+
+    Callers waiting for a request already in flight share its response, and the rate
+    limit token they drew is returned to `limiter`. Streamed responses can only be
+    read once, so requests made with `stream=True` are always sent. Requests without
+    a timeout of their own wait for `timeout` seconds.
+    """
+
+    def __init__(self, limiter: RateLimiter, timeout: Timeout = None) -> None:
+        super().__init__()
+        self.limiter = limiter
+        self.timeout = timeout
+        self.single_flight = SingleFlight()
+
+    def request(  # type: ignore
+        self, method: str, url: str, params: Any = None, **kwargs: Any
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        if method.upper() != "GET" or kwargs.get("stream"):
+            return super().request(method, url, params=params, **kwargs)
+        response, shared = self.single_flight.do(
+            request_key(url, params, kwargs),
+            functools.partial(super().request, method, url, params=params, **kwargs),
+        )
+        if shared:
+            self.limiter.refund()
+        return response
+
 
 class HexpySession:
     """Class for generating a token for use with all API requests.
@@ -48,23 +155,133 @@ class HexpySession:
 
     >>> # session TCP connection is closed until next call to API
     ```
+
+    All clients created from the same session share its `limiter`, a token bucket
+    allowing `MAX_CALLS` requests every `ONE_MINUTE` seconds across every endpoint.
+    Pass `shared_limit=True` to share that budget with every other process on the
+    host using the same token, via a SQLite file at `~/.hexpy/rate_limit.db`.
+    ```python
+    >>> session = HexpySession.load_auth_from_file(shared_limit=True)
+    ```
+    Rate limit headers and throttled responses from the server adjust the limiter,
+    and throttled calls are retried once the server allows it.
+
+    Calls are either `INTERACTIVE`, the default, or `BULK`. Batch uploads, batch
+    training, `MonitorAPI.aggregate` and `MonitorAPI.iter_posts` are `BULK`, and leave
+    `INTERACTIVE_SHARE` of the budget to interactive calls, which are also served
+    first. Choose the priority of every call of a client, or of a single call.
+    ```python
+    >>> from hexpy.base import BULK, INTERACTIVE
+    >>> client = MonitorAPI(session)
+    >>> client.priority = BULK
+    >>> client.details(123, priority=INTERACTIVE)
+    ```
+
+    GET requests and uploads that fail with a transient error (connection errors,
+    timeouts, 5xx responses) are retried according to the session's `retry_policy`.
+    ```python
+    >>> from hexpy.base import RetryPolicy
+    >>> session = HexpySession(token="previously_saved_token", retry_policy=RetryPolicy(max_attempts=5))
+    ```
+
+    Every client of a session sends its requests through one pool of connections to
+    the API, which is kept alive between calls. Pass a `PoolConfig` to size the pool
+    for the number of threads making calls, or to set a timeout.
+    ```python
+    >>> from hexpy.session import PoolConfig
+    >>> session = HexpySession(token="previously_saved_token", pool=PoolConfig(pool_maxsize=64, timeout=(5, 60)))
+    ```
+
+    Identical GET requests made at the same time by several threads are sent once,
+    and every caller gets the parsed result without using the rate limit again.
+
+    Request and response bodies are encoded and decoded with
+    [orjson](https://github.com/ijl/orjson) when it is installed. Choose the backend
+    explicitly with `json_backend="json"` or `json_backend="orjson"`.
+
+    Pass `cache=True` to keep results of monitor metrics in a SQLite file at
+    `~/.hexpy/cache.db`, or pass a `ResponseCache` to configure it. Results for date
+    ranges that ended a few days ago are kept for good and served without using the
+    rate limit, and results for recent date ranges expire after a few minutes.
+    Results are keyed by a hash of the token, so sessions of different accounts can
+    share the cache file without being served each other's results.
+    ```python
+    >>> session = HexpySession.load_auth_from_file()
+    >>> session = HexpySession(token=session.auth["auth"], cache=True)
+    >>> session.cache.stats()
+    {'hits': 0, 'misses': 0, 'entries': 0}
+    ```
     """
 
     TOKEN_FILE = Path.home() / ".hexpy" / "token.json"
+    RATE_LIMIT_FILE = Path.home() / ".hexpy" / "rate_limit.db"
+    CACHE_FILE = Path.home() / ".hexpy" / "cache.db"
 
     ROOT = "https://api.crimsonhexagon.com/api/"
 
     ONE_MINUTE = 60
     MAX_CALLS = 120
+    INTERACTIVE_SHARE = 0.2
 
-    def __init__(self, token: str) -> None:
+    def __init__(
+        self,
+        token: str,
+        shared_limit: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        json_backend: str = "auto",
+        cache: Union[bool, ResponseCache] = False,
+        pool: Optional[PoolConfig] = None,
+    ) -> None:
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.pool = pool or PoolConfig()
+        self.codec = JSONCodec(json_backend)
+        self.cache: Optional[ResponseCache]
+        if cache is True:
+            self.cache = ResponseCache(self.CACHE_FILE)
+        else:
+            self.cache = cache or None
+        self.cache_scope = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        self.metadata_cache = MemoryCache()
+        self.limiter = self._create_limiter(token, shared_limit)
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name == "_get_token":
-                setattr(self, name, rate_limited(fn, self.MAX_CALLS, self.ONE_MINUTE))
+                setattr(self, name, rate_limited(fn, self.limiter, self.retry_policy))
 
         self.auth = {"auth": token}
-        self.session = requests.Session()
-        self.session.params = self.auth
+        self.session = self._create_session()
+
+    def _create_limiter(self, token: str, shared_limit: bool) -> Any:
+        """Create the rate limiter shared by every client of this session."""
+        if shared_limit:
+            return SharedRateLimiter(
+                self.MAX_CALLS,
+                self.ONE_MINUTE,
+                key=token,
+                path=self.RATE_LIMIT_FILE,
+                reserve=self.INTERACTIVE_SHARE,
+            )
+        return RateLimiter(self.MAX_CALLS, self.ONE_MINUTE, self.INTERACTIVE_SHARE)
+
+    def _create_session(self) -> Any:
+        """Create the HTTP session used by every client of this session."""
+        session = self.pool.mount(CoalescingSession(self.limiter, self.pool.timeout))
+        session.params = self.auth
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        session.hooks["response"].append(self._observe_rate_limit)
+        session.hooks["response"].append(self._attach_codec)
+        return session
+
+    def _observe_rate_limit(
+        self, response: requests.Response, *args: Any, **kwargs: Any
+    ) -> None:
+        """Feed the rate limit state reported with every response back into the limiter."""
+        self.limiter.observe(response.headers, throttled=response.status_code == 429)
+
+    def _attach_codec(
+        self, response: requests.Response, *args: Any, **kwargs: Any
+    ) -> None:
+        """Have `handle_response` decode the body with the session's JSON codec."""
+        response.codec = self.codec  # type: ignore
 
     @classmethod
     def _get_token(
@@ -73,6 +290,7 @@ class HexpySession:
         password: str,
         no_expiration: bool = False,
         force: bool = False,
+        pool: Optional[PoolConfig] = None,
     ) -> JSONDict:
         """Request authorization token.
 
@@ -81,9 +299,11 @@ class HexpySession:
             password: String, account password.
             no_expiration: Boolean, if True, token does not expire in 24 hours.
             force: Boolean, if true, forces authentication token update for the requesting user.
+            pool: PoolConfig, connection pool to send the request through.
         """
+        pool = pool or PoolConfig()
         return handle_response(
-            requests.Session().get(
+            pool.mount(requests.Session()).get(
                 cls.ROOT + "authenticate",
                 params={
                     "username": username,
@@ -91,6 +311,7 @@ class HexpySession:
                     "noExpiration": str(no_expiration).lower(),
                     "force": str(force).lower(),
                 },
+                timeout=pool.timeout,
             )
         )
 
@@ -118,28 +339,42 @@ class HexpySession:
         password: str = None,
         no_expiration: bool = False,
         force: bool = False,
+        shared_limit: bool = False,
+        pool: Optional[PoolConfig] = None,
     ) -> "HexpySession":
         """
         Instantiate class from username and password.
 
+        The session keeps using the connection opened to log in.
+
         # Arguments
             username: String, account username.
             password: String, account password.
             no_expiration: Boolean, if True, token does not expire in 24 hours.
             force: Boolean, if true, forces authentication token update for the requesting user.
+            shared_limit: Boolean, if True, share the rate limit with other processes using the same token.
+            pool: PoolConfig, connection pool settings of the session.
         """
         if password is None:
             password = getpass(prompt="Enter password: ")
 
-        auth = cls._get_token(username, password, no_expiration, force)
-        return cls(auth["auth"])
+        pool = pool or PoolConfig()
+        auth = cls._get_token(username, password, no_expiration, force, pool)
+        return cls(auth["auth"], shared_limit=shared_limit, pool=pool)
 
     @classmethod
-    def load_auth_from_file(cls, path: str = None) -> "HexpySession":
+    def load_auth_from_file(
+        cls,
+        path: str = None,
+        shared_limit: bool = False,
+        pool: Optional[PoolConfig] = None,
+    ) -> "HexpySession":
         """Instantiate class from previously saved token file.
 
         # Arguments
             path: String, path to store API token. default is default is `~/.hexpy/token.json`
+            shared_limit: Boolean, if True, share the rate limit with other processes using the same token.
+            pool: PoolConfig, connection pool settings of the session.
         """
         try:
             if not path:
@@ -149,7 +384,7 @@ class HexpySession:
             with open(cred_path) as infile:
                 auth = json.load(infile)
                 logger.info(f"using token: {json.dumps(auth)}")
-                return cls(token=auth["auth"])
+                return cls(token=auth["auth"], shared_limit=shared_limit, pool=pool)
         except IOError:
             raise IOError(
                 f"Credentials File at '{cred_path}' not found. Please specify token or username and password."
@@ -2,7 +2,7 @@
 
 import inspect
 
-from .base import JSONDict, handle_response, rate_limited
+from .base import INTERACTIVE, JSONDict, handle_response, rate_limited
 from .session import HexpySession
 
 
@@ -21,11 +21,12 @@ class StreamsAPI:
 
     def __init__(self, session: HexpySession) -> None:
         self.session = session.session
+        self.priority = INTERACTIVE
         self.TEMPLATE = session.ROOT + "stream"
         for name, fn in inspect.getmembers(self, inspect.ismethod):
             if name not in ["__init__"]:
                 setattr(
-                    self, name, rate_limited(fn, session.MAX_CALLS, session.ONE_MINUTE)
+                    self, name, rate_limited(fn, session.limiter, session.retry_policy)
                 )
 
     def posts(self, stream_id: int, count: int = 100) -> JSONDict:
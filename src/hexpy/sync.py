@@ -0,0 +1,198 @@
+"""Module for incrementally syncing monitor results to a local store"""
+
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import pendulum
+
+from .base import BULK, JSONDict
+from .monitor import MonitorAPI
+from .session import HexpySession
+
+logger = logging.getLogger(__name__)
+
+
+def _start_of_day(timestamp: str) -> pendulum.DateTime:
+    """Parse a monitor's results boundary and return the start of its day."""
+    parsed = pendulum.parse(timestamp)
+    if not isinstance(parsed, pendulum.DateTime):
+        raise ValueError(f"expected a date or datetime, got {timestamp!r}")
+    return parsed.start_of("day")
+
+
+class CheckpointStore:
+    """SQLite store of daily monitor results and the last closed day fetched for each.
+
+    # Arguments
+        path: String or Path, location of the SQLite database file.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints "
+            "(monitor_id INTEGER, endpoint TEXT, day TEXT NOT NULL, "
+            "PRIMARY KEY (monitor_id, endpoint))"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(monitor_id INTEGER, endpoint TEXT, day TEXT, data TEXT NOT NULL, "
+            "PRIMARY KEY (monitor_id, endpoint, day))"
+        )
+
+    def checkpoint(self, monitor_id: int, endpoint: str) -> Optional[str]:
+        """Return the last closed day fetched for a monitor endpoint, if any."""
+        row = self._connection.execute(
+            "SELECT day FROM checkpoints WHERE monitor_id = ? AND endpoint = ?",
+            (monitor_id, endpoint),
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(
+        self, monitor_id: int, endpoint: str, day: str, data: JSONDict, closed: bool
+    ) -> None:
+        """Store the results of one day, and advance the checkpoint if the day is closed."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (monitor_id, endpoint, day, data) "
+                "VALUES (?, ?, ?, ?)",
+                (monitor_id, endpoint, day, json.dumps(data)),
+            )
+            if closed:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO checkpoints (monitor_id, endpoint, day) "
+                    "VALUES (?, ?, ?)",
+                    (monitor_id, endpoint, day),
+                )
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def load(self, monitor_id: int, endpoint: str) -> Dict[str, JSONDict]:
+        """Return the stored results of a monitor endpoint by day."""
+        rows = self._connection.execute(
+            "SELECT day, data FROM results WHERE monitor_id = ? AND endpoint = ? "
+            "ORDER BY day",
+            (monitor_id, endpoint),
+        )
+        return {day: json.loads(data) for day, data in rows}
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._connection.close()
+
+
+class MonitorSync:
+    """Class for keeping a local copy of daily monitor results up to date.
+
+    Each sync fetches only the days after the last closed day fetched for the monitor
+    and endpoint, along with the most recent `open_days` days, whose results may still
+    change and are fetched again by the next sync. Running a sync again is cheap, and
+    days already stored are replaced rather than duplicated.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy import HexpySession, MonitorSync
+    >>> session = HexpySession.load_auth_from_file()
+    >>> syncer = MonitorSync(session)
+    >>> syncer.sync(monitor_id, endpoints=["posts", "volume"])
+    >>> posts = list(syncer.posts(monitor_id))
+    ```
+
+    # Arguments
+        session: HexpySession, session used for API calls.
+        path: String or Path, location of the SQLite database file. Default is `~/.hexpy/sync.db`
+        open_days: Integer, number of most recent days fetched again on every sync.
+        max_workers: Integer, number of days to fetch concurrently.
+    """
+
+    SYNC_FILE = Path.home() / ".hexpy" / "sync.db"
+
+    def __init__(
+        self,
+        session: HexpySession,
+        path: Union[str, Path, None] = None,
+        open_days: int = 1,
+        max_workers: int = 4,
+    ) -> None:
+        self.client = MonitorAPI(session)
+        self.client.priority = BULK
+        self.store = CheckpointStore(path or self.SYNC_FILE)
+        self.open_days = open_days
+        self.max_workers = max_workers
+
+    def _fetch(self, monitor_id: int, endpoint: str, day: str, end: str) -> JSONDict:
+        if endpoint == "posts":
+            return {"posts": list(self.client.iter_posts(monitor_id, day, end))}
+        return getattr(self.client, endpoint)(monitor_id, day, end)
+
+    def sync(
+        self, monitor_id: int, endpoints: Sequence[str] = ("posts",)
+    ) -> Dict[str, List[str]]:
+        """Fetch new and still open days of results and return the days fetched per endpoint.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor being synced.
+            endpoints: List of Strings, `MonitorAPI` methods taking a monitor id, start and end, or 'posts' for every post.
+        """
+        details = self.client.details(monitor_id)
+        start = _start_of_day(details["resultsStart"])
+        end = _start_of_day(details["resultsEnd"])
+        days = [
+            day.to_date_string() for day in pendulum.period(start, end).range("days")
+        ]
+        closed = set(days[: max(len(days) - 1 - self.open_days, 0)])
+
+        fetched: Dict[str, List[str]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for endpoint in endpoints:
+                checkpoint = self.store.checkpoint(monitor_id, endpoint)
+                pending = [
+                    (day, next_day)
+                    for day, next_day in zip(days, days[1:])
+                    if checkpoint is None or day > checkpoint
+                ]
+                futures = [
+                    executor.submit(self._fetch, monitor_id, endpoint, day, next_day)
+                    for day, next_day in pending
+                ]
+                try:
+                    for (day, _), future in zip(pending, futures):
+                        self.store.save(
+                            monitor_id, endpoint, day, future.result(), day in closed
+                        )
+                finally:
+                    for future in futures:
+                        future.cancel()
+                fetched[endpoint] = [day for day, _ in pending]
+                logger.info(
+                    f"Synced {len(pending)} days of {endpoint} for monitor {monitor_id}"
+                )
+        return fetched
+
+    def load(self, monitor_id: int, endpoint: str) -> Dict[str, JSONDict]:
+        """Return the synced results of a monitor endpoint by day.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor.
+            endpoint: String, name of the synced endpoint.
+        """
+        return self.store.load(monitor_id, endpoint)
+
+    def posts(self, monitor_id: int) -> Iterator[JSONDict]:
+        """Yield every synced post of a monitor in order of day.
+
+        # Arguments
+            monitor_id: Integer, id of the monitor.
+        """
+        for results in self.load(monitor_id, "posts").values():
+            yield from results["posts"]
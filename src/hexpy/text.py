@@ -0,0 +1,167 @@
+"""Module for repairing mojibake in text fields with ftfy"""
+
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import ftfy
+import pandas as pd
+
+# Anything ftfy may change in a string: characters outside printable ASCII other than
+# tabs and newlines, which covers carriage returns and control characters, and `&`
+# starting HTML entities. Strings without any are returned as they are.
+NEEDS_FIXING = re.compile(r"[^\t\n\x20-\x25\x27-\x7e]")
+
+
+def needs_fixing(text: str) -> bool:
+    """Return whether ftfy may change `text`, False for plain ASCII without entities."""
+    return NEEDS_FIXING.search(text) is not None
+
+
+class FixedText(str):
+    """A string with mojibake fixed already, which `TextFixer` returns as a plain string without fixing it again."""
+
+
+class TextFixer:
+    """Fix mojibake with `ftfy.fix_text`, skipping clean strings and remembering repeated ones.
+
+    Plain ASCII strings without HTML entities or control characters are returned as they are.
+    Fixed strings of at most `max_length` characters, such as author names and titles, are
+    remembered along with their fixed versions, so repeated values and values fixed before
+    are not fixed again. `FixedText` strings are never fixed again, whatever their length.
+    `fix_many` fixes large numbers of strings in worker processes, started for the call
+    and shut down before it returns.
+
+    # Example usage.
+
+    ```python
+    >>> from hexpy.text import TEXT_FIXER
+    >>> TEXT_FIXER.processes = 4
+    >>> TEXT_FIXER.fix_many(["cafÃ©", "plain", "cafÃ©"])
+    ['café', 'plain', 'café']
+    ```
+
+    # Arguments
+        max_entries: Integer, number of fixed strings to remember.
+        max_length: Integer, length of the longest string to remember.
+        processes: Integer, worker processes of `fix_many`, 1 to fix in this process, or None for one per CPU.
+            With a single CPU, strings are fixed in this process. Workers are spawned rather than forked, so they
+            are safe to start while other threads are running.
+        min_parallel: Integer, fewest strings to fix for `fix_many` to use worker processes.
+        chunksize: Integer, strings sent to a worker process at a time.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_length: int = 1000,
+        processes: Optional[int] = None,
+        min_parallel: int = 5000,
+        chunksize: int = 256,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self.processes = processes
+        self.min_parallel = min_parallel
+        self.chunksize = chunksize
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, text: str, fixed: str) -> None:
+        if len(text) > self.max_length:
+            return
+        with self._lock:
+            self._cache[text] = fixed
+            self._cache[fixed] = fixed
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _lookup(self, text: str) -> Optional[str]:
+        with self._lock:
+            fixed = self._cache.get(text)
+            if fixed is not None:
+                self._cache.move_to_end(text)
+        return fixed
+
+    def fix(self, text: str) -> str:
+        """Return `text` with mojibake fixed."""
+        if isinstance(text, FixedText):
+            return str(text)
+        if not needs_fixing(text):
+            return text
+        fixed = self._lookup(text)
+        if fixed is None:
+            fixed = ftfy.fix_text(text)
+            self._remember(text, fixed)
+        return fixed
+
+    def fix_many(self, texts: Iterable[str]) -> List[str]:
+        """Return `texts` with mojibake fixed, in order.
+
+        Clean and remembered strings are skipped and repeated strings are fixed once.
+        With at least `min_parallel` strings left to fix, they are fixed in worker processes
+        `chunksize` strings at a time, and the workers are shut down before returning.
+        """
+        texts = list(texts)
+        fixed: Dict[str, Optional[str]] = {}
+        for text in texts:
+            if text in fixed or isinstance(text, FixedText) or not needs_fixing(text):
+                continue
+            remembered = self._lookup(text)
+            fixed[text] = remembered
+        pending = [text for text, value in fixed.items() if value is None]
+        workers = self.processes or os.cpu_count() or 1
+        if len(pending) >= self.min_parallel and workers > 1 and _can_spawn():
+            with _executor(workers) as executor:
+                results = list(
+                    executor.map(ftfy.fix_text, pending, chunksize=self.chunksize)
+                )
+        else:
+            results = [ftfy.fix_text(text) for text in pending]
+        for text, result in zip(pending, results):
+            fixed[text] = result
+            self._remember(text, result)
+        done = {text: value for text, value in fixed.items() if value is not None}
+        return [done.get(text, text) for text in texts]
+
+    def fix_column(self, column: pd.Series) -> pd.Series:
+        """Return a column with mojibake fixed in its strings, leaving other values as they are.
+
+        The strings are `FixedText`, so fixing them again returns them as they are.
+        """
+        strings = column.map(lambda value: isinstance(value, str))
+        if not strings.any():
+            return column
+        column = column.copy()
+        column[strings] = [FixedText(text) for text in self.fix_many(column[strings])]
+        return column
+
+
+def _can_spawn() -> bool:
+    """Return whether worker processes can be started without forking a threaded process.
+
+    Before Python 3.7, workers can only be forked, which is left to single threaded processes.
+    """
+    return sys.version_info >= (3, 7) or threading.active_count() == 1
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    """Return a pool of `workers` spawned processes, or forked ones before Python 3.7."""
+    if sys.version_info < (3, 7):  # pragma: no cover
+        return ProcessPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+TEXT_FIXER = TextFixer()
+
+
+def fix_text(text: str) -> str:
+    """Fix mojibake in `text` with the shared `TEXT_FIXER`."""
+    return TEXT_FIXER.fix(text)
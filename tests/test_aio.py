@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `aio.py` module."""
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Coroutine, List
+
+import httpx
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+
+from hexpy import (
+    AsyncContentUploadAPI,
+    AsyncHexpySession,
+    AsyncMonitorAPI,
+    AsyncStreamsAPI,
+)
+from hexpy.base import (
+    BULK,
+    INTERACTIVE,
+    AsyncRateLimiter,
+    JSONDict,
+    RateLimiter,
+    ResponseError,
+    RetryPolicy,
+)
+from hexpy.cache import ResponseCache
+from hexpy.content_upload import UploadJournal
+from hexpy.models import UploadCollection
+from hexpy.session import HexpySession, PoolConfig
+
+Handler = Callable[[httpx.Request], httpx.Response]
+
+
+def make_session(handler: Handler, monkeypatch: MonkeyPatch) -> AsyncHexpySession:
+    session = AsyncHexpySession(
+        token="test-token",
+        retry_policy=RetryPolicy(
+            backoff=0, jitter=0, exceptions=(httpx.TransportError,)
+        ),
+    )
+    monkeypatch.setattr(session.session, "_transport", httpx.MockTransport(handler))
+    return session
+
+
+def run(coroutine: Coroutine) -> object:
+    return asyncio.run(coroutine)
+
+
+def test_async_limiter_waits_without_blocking() -> None:
+    """Test coroutines share the bucket and sleep on the event loop."""
+    limiter = AsyncRateLimiter(RateLimiter(max_calls=2, period=0.2))
+    ticks: List[int] = []
+
+    async def ticker() -> None:
+        for _ in range(4):
+            ticks.append(1)
+            await asyncio.sleep(0.05)
+
+    async def main() -> float:
+        start = time.monotonic()
+        await asyncio.gather(ticker(), *[limiter.acquire() for _ in range(4)])
+        return time.monotonic() - start
+
+    elapsed = run(main())
+    assert 0.15 <= elapsed < 0.5
+    assert len(ticks) == 4
+
+
+def test_async_limiter_serves_interactive_before_bulk() -> None:
+    """Test interactive coroutines overtake bulk coroutines waiting for a token."""
+    limiter = AsyncRateLimiter(RateLimiter(max_calls=1, period=0.1))
+    order: List[int] = []
+
+    async def call(priority: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await limiter.acquire(priority)
+        order.append(priority)
+
+    async def main() -> None:
+        await limiter.acquire()
+        await asyncio.gather(call(BULK, 0), call(BULK, 0.01), call(INTERACTIVE, 0.02))
+
+    run(main())
+    assert order == [INTERACTIVE, BULK, BULK]
+
+
+def test_async_session_pool_config() -> None:
+    """Test pool settings are applied to the httpx client."""
+    session = AsyncHexpySession(
+        token="test-token", pool=PoolConfig(pool_maxsize=8, block=True, timeout=(5, 30))
+    )
+
+    assert session.session.timeout.connect == 5
+    assert session.session.timeout.read == 30
+    assert session.session._transport._pool._max_connections == 8
+
+
+def test_async_client_calls(monkeypatch: MonkeyPatch) -> None:
+    """Test async client sends auth, drops empty params and decodes responses."""
+    requests: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"id": request.url.params["id"]})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            client = AsyncMonitorAPI(session)
+            return await asyncio.gather(client.details(1), client.details(2))
+
+    assert run(main()) == [{"id": "1"}, {"id": "2"}]
+    assert all(request.url.params["auth"] == "test-token" for request in requests)
+
+
+def test_async_session_cache_and_shared_limit(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test cached results and the shared limiter work from the event loop."""
+    monkeypatch.setattr(HexpySession, "RATE_LIMIT_FILE", tmp_path / "rate_limit.db")
+    calls: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"sources": []})
+
+    async def main() -> object:
+        session = AsyncHexpySession(
+            token="test-token",
+            shared_limit=True,
+            cache=ResponseCache(tmp_path / "cache.db"),
+        )
+        monkeypatch.setattr(session.session, "_transport", httpx.MockTransport(handler))
+        async with session:
+            client = AsyncMonitorAPI(session)
+            first = await client.top_sources(1, "2017-01-01", "2017-01-02")
+            second = await client.top_sources(1, "2017-01-01", "2017-01-02")
+            return first, second
+
+    assert run(main()) == ({"sources": []}, {"sources": []})
+    assert len(calls) == 1
+
+
+def test_async_stream_posts(monkeypatch: MonkeyPatch) -> None:
+    """Test streamed posts are decoded by the async client."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"posts": [{"url": "a"}, {"url": "b"}]})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            client = AsyncMonitorAPI(session)
+            return list(await client.stream_posts(1, "2019-01-01", "2019-01-02"))
+
+    assert run(main()) == [{"url": "a"}, {"url": "b"}]
+
+
+def test_async_aggregate(monkeypatch: MonkeyPatch) -> None:
+    """Test aggregate resolves every metric call."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"path": request.url.path.split("/")[-1]})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            client = AsyncMonitorAPI(session)
+            return await client.aggregate(
+                [1, 2], ("2019-01-01", "2019-01-02"), ["volume", "word_cloud"]
+            )
+
+    results = run(main())
+    assert results[1]["monitor_id"] == 2
+    assert results[1]["results"][0]["results"] == {
+        "volume": {"path": "volume"},
+        "word_cloud": {"path": "wordcloud"},
+    }
+
+
+def test_async_aggregate_cancels_pending_calls(monkeypatch: MonkeyPatch) -> None:
+    """Test the first error cancels the calls still waiting to run."""
+    paths: List[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(403)
+
+    async def main() -> None:
+        async with make_session(handler, monkeypatch) as session:
+            client = AsyncMonitorAPI(session)
+            with pytest.raises(ResponseError):
+                await client.aggregate(
+                    [1, 2, 3],
+                    ("2019-01-01", "2019-01-02"),
+                    ["volume", "word_cloud"],
+                    max_workers=1,
+                )
+            await asyncio.sleep(0.05)
+
+    run(main())
+    # the call admitted when the first one failed may start, none of the others
+    assert len(paths) <= 2
+
+
+def test_async_transient_get_retried(monkeypatch: MonkeyPatch) -> None:
+    """Test transport errors and 5xx responses are retried for GET requests."""
+    outcomes = [httpx.ConnectError("reset"), httpx.Response(503), None]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome or httpx.Response(200, json={"ok": True})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            return await AsyncMonitorAPI(session).details(1)
+
+    assert run(main()) == {"ok": True}
+    assert outcomes == []
+
+
+def test_async_post_not_retried(monkeypatch: MonkeyPatch) -> None:
+    """Test failed POST requests are raised without retrying."""
+    calls: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503, json={"status": "error"})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            return await AsyncStreamsAPI(session).create_stream(1, "stream")
+
+    with pytest.raises(ResponseError) as e:
+        run(main())
+    assert e.value.attempts == 1
+    assert len(calls) == 1
+
+
+def test_async_identical_gets_coalesced(monkeypatch: MonkeyPatch) -> None:
+    """Test concurrent identical GET requests share one response"""
+    calls: List[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"id": request.url.params["id"]})
+
+    async def main() -> object:
+        async with make_session(handler, monkeypatch) as session:
+            client = AsyncMonitorAPI(session)
+            return await asyncio.gather(
+                *[client.details(1) for _ in range(5)], client.details(2)
+            )
+
+    assert run(main()) == [{"id": "1"}] * 5 + [{"id": "2"}]
+    assert len(calls) == 2
+
+
+def test_async_stream_upload(
+    upload_items: List[JSONDict], monkeypatch: MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test collections are uploaded in order as they are produced, and only once with a journal."""
+    sizes: List[int] = []
+    threads: List[str] = []
+    closed: List[UploadJournal] = []
+    for name in ("completed", "record"):
+        method = getattr(UploadJournal, name)
+        monkeypatch.setattr(
+            UploadJournal,
+            name,
+            lambda self, *args, method=method: threads.append(
+                threading.current_thread().name
+            )
+            or method(self, *args),
+        )
+    close = UploadJournal.close
+    monkeypatch.setattr(
+        UploadJournal, "close", lambda self: closed.append(self) or close(self)
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sizes.append(len(json.loads(request.content)["items"]))
+        return httpx.Response(200, json={"batch": sizes[-1]})
+
+    items = []
+    for i in range(2500):
+        item = dict(upload_items[0])
+        item["guid"] = f"post{i}"
+        items.append(item)
+    collections = [
+        UploadCollection(items=items[:1200]),
+        UploadCollection(items=items[1200:]),
+    ]
+
+    async def main() -> List[JSONDict]:
+        client = AsyncContentUploadAPI(make_session(handler, monkeypatch))
+        uploads = client.stream_upload(1, collections, journal=tmp_path / "upload.db")
+        return [response async for response in uploads]
+
+    expected = [
+        {"batch": 1000},
+        {"batch": 200},
+        {"batch": 1000},
+        {"batch": 300},
+    ]
+    assert run(main()) == expected
+    assert run(main()) == expected
+    assert len(sizes) == 4
+    assert len(closed) == 2
+    assert threading.main_thread().name not in threads
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `cache.py` module."""
+import time
+from datetime import datetime
+from pathlib import Path
+
+import responses
+from _pytest.monkeypatch import MonkeyPatch
+
+from hexpy import HexpySession, MetadataAPI, MonitorAPI
+from hexpy.cache import MemoryCache, ResponseCache
+
+
+@responses.activate
+def test_closed_range_served_from_cache(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Test results for closed date ranges are only fetched once"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": []}
+    )
+    session = HexpySession(
+        token="test-token-00000", cache=ResponseCache(tmp_path / "cache.db")
+    )
+    client = MonitorAPI(session)
+
+    acquired = []
+    acquire = session.limiter.acquire
+    monkeypatch.setattr(
+        session.limiter, "acquire", lambda *args: acquired.append(1) or acquire(*args)
+    )
+
+    first = client.volume(123, "2019-01-01", "2019-01-02")
+    second = client.volume(123, start="2019-01-01", end="2019-01-02")
+
+    assert first == second == {"volume": []}
+    assert len(responses.calls) == 1
+    assert session.cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+    assert len(acquired) == 1
+    client.volume(123, "2019-01-01", "2019-01-02", group_by="HOURLY")
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_cache_keeps_tokens_apart(tmp_path: Path) -> None:
+    """Test sessions with different tokens sharing a cache do not share results"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": [1]}
+    )
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": [2]}
+    )
+    cache = ResponseCache(tmp_path / "cache.db")
+    first = MonitorAPI(HexpySession(token="test-token-00000", cache=cache))
+    second = MonitorAPI(HexpySession(token="test-token-11111", cache=cache))
+
+    assert first.volume(123, "2019-01-01", "2019-01-02") == {"volume": [1]}
+    assert second.volume(123, "2019-01-01", "2019-01-02") == {"volume": [2]}
+    assert first.volume(123, "2019-01-01", "2019-01-02") == {"volume": [1]}
+    assert len(responses.calls) == 2
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+
+def test_cache_ttl(tmp_path: Path) -> None:
+    """Test closed date ranges never expire and recent ones do"""
+    cache = ResponseCache(tmp_path / "cache.db", recent_ttl=60, settle_days=2)
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+
+    assert cache.ttl(MonitorAPI.volume, {"end": "2019-01-02"}) is None
+    assert cache.ttl(MonitorAPI.volume, {"end": today}) == 60
+    assert cache.ttl(MonitorAPI.volume, {}) == 60
+
+    cache.set("recent", {"value": 1}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("recent") is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    """Test the least recently used results are evicted beyond max_entries"""
+    cache = ResponseCache(tmp_path / "cache.db", max_entries=2)
+    cache.set("first", {"value": 1})
+    time.sleep(0.01)
+    cache.set("second", {"value": 2})
+    time.sleep(0.01)
+    cache.get("first")
+    cache.set("third", {"value": 3})
+
+    assert cache.get("second") is None
+    assert cache.get("first") == {"value": 1}
+    assert cache.get("third") == {"value": 3}
+
+
+def test_memory_cache_ttl_and_size() -> None:
+    """Test memory cache expires results by ttl and keeps at most max_entries"""
+    cache = MemoryCache(max_entries=2)
+    cache.set("MetadataAPI.states:1", {"value": 1}, ttl=0.01)
+    cache.set("MetadataAPI.cities:2", {"value": 2})
+    cache.set("MetadataAPI.cities:3", {"value": 3})
+    assert cache.get("MetadataAPI.states:1") is None
+
+    cache.set("MetadataAPI.states:4", {"value": 4}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("MetadataAPI.states:4") is None
+    assert cache.get("MetadataAPI.cities:3") == {"value": 3}
+    assert cache.ttl(MetadataAPI.team_list, {}) == 3600
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Tests for cli `hexpy` module."""
 
+import io
 import json
 from pathlib import Path
 from typing import List
@@ -8,13 +9,23 @@ from typing import List
 import pandas as pd
 import pytest
 import responses
+from _pytest.capture import CaptureFixture
 from _pytest.monkeypatch import MonkeyPatch
 from click.testing import CliRunner
 from pydantic import ValidationError
 
 from hexpy import HexpySession, hexpy
 from hexpy.base import JSONDict
-from hexpy.hexpy import cli, docs_to_text, helpful_validation_error, posts_json_to_df
+from hexpy.hexpy import (
+    IMAGE_COLUMNS,
+    POST_COLUMNS,
+    cli,
+    docs_to_text,
+    helpful_validation_error,
+    post_columns,
+    posts_json_to_df,
+    write_posts_csv,
+)
 from hexpy.models import UploadCollection
 
 
@@ -71,6 +82,118 @@ def test_export(posts_json: JSONDict, monkeypatch: MonkeyPatch) -> None:
     assert result.output.strip() == "\n".join([json.dumps(x) for x in posts_json])
 
 
+def test_posts_json_to_df_edge_cases() -> None:
+    """Test ties, uncategorized posts, incomplete images and dropped values"""
+    docs = [
+        {
+            "contents": "first\nline",
+            "score": 0.5,
+            "assignedCategoryId": 0,
+            "categoryScores": [{"categoryName": "A", "score": 1}],
+            "emotionScores": [{"emotionName": "A", "score": 1}],
+            "imageInfo": [
+                {"url": "a", "objects": [{"className": "x"}, {"className": "y"}]},
+                {"url": "b", "objects": [], "brands": [{"brand": "z"}]},
+            ],
+        },
+        {
+            "contents": "second",
+            "assignedCategoryId": 1,
+            "assignedEmotionId": 2,
+            "categoryScores": [
+                {"categoryName": "A", "score": 1},
+                {"categoryName": "B", "score": 1},
+            ],
+            "emotionScores": [{"emotionName": "A"}],
+            "imageInfo": [{"objects": [{"className": "x"}]}],
+        },
+    ]
+    df = posts_json_to_df(docs, images=True)
+
+    assert list(df.columns) == [
+        "contents",
+        "assignedCategoryId",
+        "category",
+        "image.urls",
+        "image.objects",
+        "image.brands",
+        "assignedEmotionId",
+    ]
+    assert df["contents"].tolist() == ["first line", "second"]
+    assert df["category"].tolist() == ["Uncategorized", "A"]
+    assert df["image.urls"].tolist()[0] == "a :: b"
+    assert df["image.objects"].tolist()[0] == "x|y :: "
+    assert df["image.brands"].tolist()[0] == "z"
+    assert df.loc[1, ["image.urls", "image.objects", "image.brands"]].isna().all()
+
+
+def test_write_posts_csv(posts_json: List[JSONDict]) -> None:
+    """Test posts are written in chunks with one stable header"""
+    outfile = io.StringIO()
+    count = write_posts_csv(iter(posts_json), outfile, images=True, chunksize=2)
+
+    df = posts_json_to_df(posts_json, images=True)
+    written = pd.read_csv(io.StringIO(outfile.getvalue()))
+    assert count == 3
+    assert list(written.columns) == post_columns(df, images=True)
+    assert written["url"].tolist() == df["url"].tolist()
+    assert (
+        written["geolocation.id"].isna().tolist()
+        == df["geolocation.id"].isna().tolist()
+    )
+
+
+def test_write_posts_csv_drops_unknown_columns(
+    posts_json: List[JSONDict], capsys: CaptureFixture
+) -> None:
+    """Test fields that are not post fields are left out with one warning"""
+    posts = [dict(post) for post in posts_json]
+    posts[1]["extraField"] = "late"
+    posts[2]["extraField"] = "later"
+    outfile = io.StringIO()
+    count = write_posts_csv(iter(posts), outfile, chunksize=1)
+
+    written = pd.read_csv(io.StringIO(outfile.getvalue()))
+    assert count == 3
+    assert list(written.columns) == POST_COLUMNS
+    assert capsys.readouterr().err.count("extraField") == 1
+
+
+def test_write_posts_csv_header_only() -> None:
+    """Test an export without posts still has the header"""
+    outfile = io.StringIO()
+    assert write_posts_csv(iter([]), outfile, images=True) == 0
+    assert outfile.getvalue().strip().split(",") == POST_COLUMNS + IMAGE_COLUMNS
+
+
+@responses.activate
+def test_export_csv(
+    posts_json: List[JSONDict], monkeypatch: MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test exporting posts from cli to csv"""
+    monkeypatch.setattr(hexpy, "login", fake_login)
+    monkeypatch.chdir(tmp_path)
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/posts",
+        json={"posts": posts_json},
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        json={"resultsStart": "day1", "resultsEnd": "day2", "name": "test monitor"},
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["export", "123456789"])
+
+    assert result.exit_code == 0
+    df = pd.read_csv(tmp_path / "123456789_test_monitor_Posts.csv")
+    assert df["url"].tolist() == [post["url"] for post in posts_json]
+
+
 @responses.activate
 def test_api_documentation(
     json_documentation: JSONDict, monkeypatch: MonkeyPatch
@@ -148,6 +271,45 @@ def test_upload(
     assert result.output.strip() == json.dumps({"status": "success"}, indent=4)
 
 
+@responses.activate
+def test_upload_chunks(
+    upload_dataframe: pd.DataFrame, monkeypatch: MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test cli uploads a file a chunk at a time and checks guids across chunks"""
+    monkeypatch.setattr(hexpy, "login", fake_login)
+    responses.add(
+        responses.POST,
+        HexpySession.ROOT + "content/upload",
+        json={"status": "success"},
+        status=200,
+    )
+    tmp_file = tmp_path / "myfile.xlsx"
+    upload_dataframe.to_excel(tmp_file, index=False)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["upload", "-d", "123", "-c", "2", str(tmp_file)])
+    assert json.loads(result.output) == {
+        "Batch 0": {"status": "success"},
+        "Batch 1": {"status": "success"},
+    }
+
+    tmp_file = tmp_path / "myfile.csv"
+    duplicated = pd.concat([upload_dataframe, upload_dataframe.iloc[:1]])
+    duplicated.to_csv(tmp_file, index=False)
+    result = runner.invoke(cli, ["upload", "-d", "123", "-c", "2", str(tmp_file)])
+    assert result.exit_code != 0
+    assert "Duplicate item guids detected" in result.output
+
+    upload_dataframe.loc[2, "author"] = None
+    upload_dataframe.to_csv(tmp_file, index=False)
+    result = runner.invoke(cli, ["upload", "-d", "123", "-c", "2", str(tmp_file)])
+    assert "items - 2 - author" in result.output
+    result = runner.invoke(
+        cli, ["upload", "-d", "123", "-c", "2", "--trusted", str(tmp_file)]
+    )
+    assert "1 rows have no author: [2]" in result.output
+
+
 @responses.activate
 def test_train(
     train_dataframe: pd.DataFrame, monkeypatch: MonkeyPatch, tmp_path: Path
@@ -217,6 +379,59 @@ def test_results(results_json: JSONDict, monkeypatch: MonkeyPatch) -> None:
     assert result.output.strip() == json.dumps(results_json)
 
 
+@responses.activate
+def test_results_feather(
+    results_json: JSONDict, monkeypatch: MonkeyPatch, tmp_path: Path
+) -> None:
+    """Test cli writes monitor results to a feather file"""
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(hexpy, "login", fake_login)
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/volume",
+        json=results_json["results"]["volume"],
+        status=200,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["results", "123456789", "volume", "-o", "feather", "-f", str(tmp_path / "r")]
+        + ["-d", "2019-01-01", "2019-01-02", "--compression", "lz4"],
+    )
+    assert result.exit_code == 0
+    table = pa.ipc.open_file(str(tmp_path / "r.feather")).read_all()
+    assert table.column("monitor_id").to_pylist() == [123456789]
+
+    result = runner.invoke(
+        cli,
+        ["results", "123456789", "volume", "-o", "feather", "--compression", "gzip"],
+    )
+    assert result.exit_code != 0
+    assert "does not support compression 'gzip'" in result.output
+
+
+@responses.activate
+def test_results_plan(monkeypatch: MonkeyPatch) -> None:
+    """Test cli plans monitor results without calling the API"""
+    monkeypatch.setattr(hexpy, "login", fake_login)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["results", "123456789", "volume", "word_cloud", "--plan"]
+        + ["-d", "2019-01-01", "2019-01-02"],
+    )
+    assert json.loads(result.output) == {
+        "calls": 2,
+        "api_calls": 2,
+        "cache_hits": 0,
+        "eta_seconds": 0.0,
+        "methods": {"MonitorAPI.volume": 1, "MonitorAPI.word_cloud": 1},
+    }
+    assert len(responses.calls) == 0
+
+
 def test_helpful_error_item(upload_items: List[JSONDict]) -> None:
     """Test invalid custom content item helpful error messages"""
     del upload_items[1]["author"]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `columnar.py` module."""
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+import pytest
+from _pytest.capture import CaptureFixture
+
+from hexpy.base import JSONDict
+from hexpy.hexpy import write_posts_columnar
+from hexpy.models import UploadCollection
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from hexpy.columnar import ColumnarWriter, results_table  # noqa: E402
+
+
+def test_posts_parquet(posts_json: List[JSONDict], tmp_path: Path) -> None:
+    """Test posts are written a row group at a time with typed columns"""
+    path = tmp_path / "posts.parquet"
+    count = write_posts_columnar(
+        iter(posts_json), str(path), images=True, compression="snappy", row_group_size=2
+    )
+
+    parquet = pq.ParquetFile(path)
+    table = parquet.read()
+    assert count == 3
+    assert parquet.metadata.num_row_groups == 2
+    assert table.schema.field("date").type == pa.timestamp("ms")
+    assert table.schema.field("authorPosts").type == pa.int64()
+    assert table.column_names[:3] == ["url", "date", "author"]
+    assert table.column("url").to_pylist() == [post["url"] for post in posts_json]
+
+
+def test_posts_schema_across_row_groups(
+    posts_json: List[JSONDict], tmp_path: Path, capsys: CaptureFixture
+) -> None:
+    """Test known fields keep their types in every row group and other fields are strings"""
+    posts = [dict(post) for post in posts_json]
+    for post in posts[:2]:
+        post.pop("geolocation", None)
+    posts[0]["sourceId"] = 5
+    posts[1]["authorGender"] = 1
+    posts[2].update(
+        geolocation={"id": "USA.MA"},
+        authorPosts="12",
+        sourceId="x",
+        extraField="late",
+    )
+    path = tmp_path / "posts.parquet"
+    write_posts_columnar(iter(posts), str(path), row_group_size=2)
+
+    table = pq.read_table(path)
+    assert table.schema.field("authorPosts").type == pa.int64()
+    assert table.column("authorPosts").to_pylist()[2] == 12
+    assert table.column("geolocation.id").to_pylist() == [None, None, "USA.MA"]
+    assert table.column("authorGender").to_pylist()[1] == "1"
+    assert table.column("sourceId").to_pylist() == ["5", None, "x"]
+    assert "extraField" not in table.column_names
+    assert "extraField" in capsys.readouterr().err
+
+
+def test_posts_values_of_wrong_type(posts_json: List[JSONDict], tmp_path: Path) -> None:
+    """Test values that do not convert to the type of a known field are not written as nulls"""
+    posts = [dict(post) for post in posts_json]
+    posts[2]["authorPosts"] = "abc"
+
+    with pytest.raises(ValueError, match="authorPosts"):
+        write_posts_columnar(
+            iter(posts), str(tmp_path / "posts.parquet"), row_group_size=2
+        )
+
+
+def test_posts_feather(posts_json: List[JSONDict], tmp_path: Path) -> None:
+    """Test posts are written to Arrow IPC files in record batches"""
+    path = tmp_path / "posts.feather"
+    write_posts_columnar(
+        iter(posts_json), str(path), "feather", compression="lz4", row_group_size=2
+    )
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        assert reader.num_record_batches == 2
+        assert reader.read_all().num_rows == 3
+
+
+def test_empty_posts(tmp_path: Path) -> None:
+    """Test an export without posts still writes the known columns"""
+    path = tmp_path / "posts.parquet"
+
+    assert write_posts_columnar(iter([]), str(path)) == 0
+    table = pq.read_table(path)
+    assert table.num_rows == 0
+    assert "assignedCategoryId" in table.column_names
+
+
+def test_results_table(results_json: JSONDict) -> None:
+    """Test aggregate results become a row per monitor and date range"""
+    table = results_table([{"monitor_id": 123, "results": [results_json]}])
+
+    assert table.column_names == [
+        "monitor_id",
+        "resultsStart",
+        "resultsEnd",
+        "volume",
+        "sentiment_and_categories",
+    ]
+    volume = table.column("volume").to_pylist()[0]
+    assert (
+        volume["numberOfDocuments"]
+        == results_json["results"]["volume"]["numberOfDocuments"]
+    )
+
+
+def test_upload_collection_parquet(
+    upload_dataframe: pd.DataFrame, tmp_path: Path
+) -> None:
+    """Test upload collections are written with typed columns"""
+    collection = UploadCollection.from_dataframe(upload_dataframe)
+    collection.to_parquet(tmp_path / "upload.parquet", compression="gzip")
+
+    table = pq.read_table(tmp_path / "upload.parquet")
+    assert table.schema.field("date").type == pa.timestamp("ms", tz="UTC")
+    assert table.column("geolocation.id").to_pylist() == [None, "USA.NY", None]
+
+    with pytest.raises(ValueError):
+        collection.to_feather(tmp_path / "upload.feather", compression="snappy")
+
+
+def test_writer_checks_options(tmp_path: Path) -> None:
+    """Test unknown formats are rejected"""
+    with pytest.raises(ValueError):
+        ColumnarWriter(tmp_path / "posts.orc", pa.schema([]), "orc")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `geography.py` module."""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from hexpy.base import JSONDict
+from hexpy.geography import GeographyIndex
+from hexpy.models import UploadCollection
+
+
+@pytest.fixture
+def geography(geography_json: JSONDict) -> GeographyIndex:
+    """Geography index of test locations"""
+    return GeographyIndex(geography_json["resources"])
+
+
+def test_geography_lookup(geography: GeographyIndex) -> None:
+    """Test lookup by id, id prefix and name"""
+    assert "AFG.Balkh" in geography
+    assert "AFG.Kabul" not in geography
+    assert geography.get("ABW")["name"] == "Aruba"
+    assert [location["id"] for location in geography.prefix("AFG.Ba")] == [
+        "AFG.Badakhshan",
+        "AFG.Badghis",
+        "AFG.Baghlan",
+        "AFG.Balkh",
+        "AFG.Bamyan",
+    ]
+    assert len(geography.find("aruba")) == 2
+    assert [location["id"] for location in geography.find("Farah", "AFG")] == [
+        "AFG.Farah"
+    ]
+
+
+def test_geography_save_and_load(geography: GeographyIndex, tmp_path: Path) -> None:
+    """Test index round trip through the compressed file"""
+    geography.save(tmp_path / "geography.json.gz")
+    loaded = GeographyIndex.load(tmp_path / "geography.json.gz")
+
+    assert list(loaded) == list(geography)
+    assert loaded.get("AFG.Balkh") == geography.get("AFG.Balkh")
+
+
+def test_geography_validate_and_resolve(geography: GeographyIndex) -> None:
+    """Test vectorized validation and name resolution"""
+    ids = pd.Series(["AFG", "Balkh", "Aruba", None, "Nowhere"])
+
+    assert geography.validate(ids).tolist() == [True, False, False, True, False]
+    assert geography.resolve(ids).tolist() == [
+        "AFG",
+        "AFG.Balkh",
+        "Aruba",
+        None,
+        "Nowhere",
+    ]
+
+
+def test_upload_rejects_unknown_geolocation(
+    geography: GeographyIndex, upload_dataframe: pd.DataFrame
+) -> None:
+    """Test unknown geolocation ids are rejected before upload"""
+    upload_dataframe["geolocation.id"] = ["AFG", "Balkh", None]
+
+    with pytest.raises(ValueError) as e:
+        UploadCollection.from_dataframe(upload_dataframe, geography=geography)
+    assert "['Balkh']" in e.value.args[0]
+
+    collection = UploadCollection.from_dataframe(
+        upload_dataframe, geography=geography, resolve_geography=True
+    )
+    assert collection[1].geolocation.id == "AFG.Balkh"
@@ -1,15 +1,36 @@
 # -*- coding: utf-8 -*-
 """Tests for hexpy `base.py` module functions."""
+import gzip
+import json
 import logging
+import threading
 import time
-from typing import Callable
+from pathlib import Path
+from typing import Callable, List
 
 import pytest
 import requests
 import responses
 from _pytest.capture import CaptureFixture
+from _pytest.monkeypatch import MonkeyPatch
 
-from hexpy.base import JSONDict, handle_response, rate_limited
+from hexpy import base
+from hexpy import ContentUploadAPI, HexpySession, MetadataAPI, MonitorAPI, StreamsAPI
+from hexpy.base import (
+    BULK,
+    INTERACTIVE,
+    JSONCodec,
+    JSONDict,
+    RateLimiter,
+    RateLimitError,
+    ResponseError,
+    RetryPolicy,
+    SharedRateLimiter,
+    handle_response,
+    rate_limited,
+    with_priority,
+)
+from hexpy.models import UploadCollection
 
 
 @responses.activate
@@ -64,6 +85,25 @@ def test_response_status_ok() -> None:
     assert results == {"key": "value"}
 
 
+@responses.activate
+def test_response_throttled() -> None:
+    """Test throttled responses raise RateLimitError with the requested delay."""
+    responses.add(
+        responses.GET,
+        "https://testsite.com/endpoint",
+        json={"status": "error"},
+        status=429,
+        headers={"Retry-After": "2"},
+    )
+
+    response = requests.get("https://testsite.com/endpoint")
+
+    with pytest.raises(RateLimitError) as e:
+        handle_response(response)
+    assert isinstance(e.value, ValueError)
+    assert e.value.retry_after == 2
+
+
 @pytest.fixture
 def base_func() -> Callable[[str], JSONDict]:
     """Fixture for testing function to be decorated with rate limiting"""
@@ -80,13 +120,16 @@ def test_rate_limiting(
 ) -> None:
     """Test function rate limiting"""
 
-    modified_func = rate_limited(base_func, max_calls=10, period=1)
+    modified_func = rate_limited(base_func, RateLimiter(max_calls=10, period=1))
 
     with caplog.at_level(logging.INFO):
+        start = time.monotonic()
         for _ in range(12):
             modified_func()
+        elapsed = time.monotonic() - start
 
-        assert caplog.records[0].msg == "Rate Limit Reached. (Sleeping for 6 seconds)"
+        assert caplog.records[0].msg.startswith("Rate Limit Reached. (Sleeping for")
+    assert 0.15 <= elapsed < 1
 
 
 def test_rate_limiting_window(
@@ -94,10 +137,536 @@ def test_rate_limiting_window(
 ) -> None:
     """Test sliding window when rate limit not exceeded."""
 
-    modified_func = rate_limited(base_func, max_calls=10, period=1)
+    modified_func = rate_limited(base_func, RateLimiter(max_calls=10, period=1))
 
     with caplog.at_level(logging.INFO):
         for _ in range(12):
             modified_func()
             time.sleep(0.2)
         assert len(caplog.records) == 0
+
+
+@responses.activate
+def test_shared_limiter(fake_session: HexpySession) -> None:
+    """Test clients created from one session draw from the same limiter."""
+    responses.add(responses.GET, HexpySession.ROOT + "team/list", json={}, status=200)
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/detail", json={}, status=200
+    )
+    monitor_client = MonitorAPI(fake_session)
+    metadata_client = MetadataAPI(fake_session, memoize=False)
+    for _ in range(fake_session.MAX_CALLS // 2):
+        monitor_client.details(123456789)
+        metadata_client.team_list()
+
+    assert fake_session.limiter._take() > 0
+
+
+def test_limiter_threads_served_in_order() -> None:
+    """Test concurrent threads are granted tokens in arrival order."""
+    limiter = RateLimiter(max_calls=1, period=0.05)
+    limiter.acquire()
+    order: List[int] = []
+
+    def worker(number: int) -> None:
+        limiter.acquire()
+        order.append(number)
+
+    threads = []
+    for number in range(5):
+        thread = threading.Thread(target=worker, args=(number,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert order == list(range(5))
+
+
+def test_limiter_reserves_share_for_interactive_calls() -> None:
+    """Test bulk calls leave the reserved share of the bucket to interactive calls."""
+    limiter = RateLimiter(max_calls=4, period=60, reserve=0.5)
+    limiter.acquire(BULK)
+    limiter.acquire(BULK)
+
+    assert limiter._take(BULK) > 0
+    assert limiter.acquire(INTERACTIVE) < 0.1
+    assert limiter.acquire() < 0.1
+
+
+def test_limiter_serves_interactive_before_bulk() -> None:
+    """Test interactive threads overtake bulk threads waiting for a token."""
+    limiter = RateLimiter(max_calls=1, period=0.1)
+    limiter.acquire()
+    order: List[int] = []
+
+    def worker(priority: int) -> None:
+        limiter.acquire(priority)
+        order.append(priority)
+
+    threads = []
+    for priority in [BULK, BULK, INTERACTIVE]:
+        thread = threading.Thread(target=worker, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert order == [INTERACTIVE, BULK, BULK]
+
+
+@responses.activate
+def test_client_and_call_priority(
+    fake_session: HexpySession, monkeypatch: MonkeyPatch
+) -> None:
+    """Test calls draw tokens with the priority of the call or of the client."""
+    priorities: List[int] = []
+    acquire = fake_session.limiter.acquire
+    monkeypatch.setattr(
+        fake_session.limiter,
+        "acquire",
+        lambda priority: priorities.append(priority) or acquire(priority),
+    )
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/detail", json={}, status=200
+    )
+    client = MonitorAPI(fake_session)
+
+    client.details(123)
+    client.priority = BULK
+    client.details(123)
+    client.details(123, priority=INTERACTIVE)
+    with_priority(client.details, INTERACTIVE)(123)
+
+    assert priorities == [INTERACTIVE, BULK, INTERACTIVE, INTERACTIVE]
+
+
+def test_shared_limiter_across_connections(tmp_path: Path) -> None:
+    """Test limiters opened on the same file and key draw from one budget."""
+    path = tmp_path / "rate_limit.db"
+    first = SharedRateLimiter(max_calls=5, period=60, key="token-a", path=path)
+    second = SharedRateLimiter(max_calls=5, period=60, key="token-a", path=path)
+    other = SharedRateLimiter(max_calls=5, period=60, key="token-b", path=path)
+
+    for _ in range(5):
+        first.acquire()
+
+    assert second._take() > 0
+    assert other._take() == 0
+
+
+def test_session_shared_limit(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Test sessions with the same token share a limiter file."""
+    monkeypatch.setattr(
+        HexpySession, "RATE_LIMIT_FILE", tmp_path / ".hexpy" / "rate_limit.db"
+    )
+    session = HexpySession(token="test-token-00000", shared_limit=True)
+    for _ in range(session.MAX_CALLS):
+        session.limiter.acquire()
+
+    other_process = HexpySession(token="test-token-00000", shared_limit=True)
+
+    assert isinstance(other_process.limiter, SharedRateLimiter)
+    assert other_process.limiter._take() > 0
+
+
+@responses.activate
+def test_throttled_call_retried(fake_session: HexpySession) -> None:
+    """Test calls throttled by the server wait for Retry-After and succeed."""
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        json={"status": "error"},
+        status=429,
+        headers={"Retry-After": "0.3"},
+    )
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        json={"name": "test_monitor"},
+        status=200,
+    )
+    client = MonitorAPI(fake_session)
+
+    start = time.monotonic()
+    details = client.details(123456789)
+
+    assert details == {"name": "test_monitor"}
+    assert time.monotonic() - start >= 0.3
+    assert len(responses.calls) == 2
+
+
+def test_limiter_observes_rate_headers() -> None:
+    """Test server rate limit headers adjust the limiter."""
+    limiter = RateLimiter(max_calls=120, period=60)
+    limiter.observe({"X-RateLimit-Limit": "240"})
+    assert limiter.max_calls == 120
+
+    limiter.observe(
+        {
+            "X-RateLimit-Limit": "240",
+            "X-RateLimit-Window": "30",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "5",
+        }
+    )
+
+    assert limiter.max_calls == 240
+    assert limiter.period == 30
+    assert limiter._take() > 4
+
+
+@pytest.fixture
+def retry_session() -> HexpySession:
+    """Session retrying transient errors without waiting"""
+    return HexpySession(
+        token="test-token-00000", retry_policy=RetryPolicy(backoff=0, jitter=0)
+    )
+
+
+def test_retry_policy_backoff() -> None:
+    """Test exponential backoff is capped and jittered"""
+    policy = RetryPolicy(backoff=1, multiplier=2, max_backoff=5, jitter=0.5)
+
+    assert policy.delay(1) <= 1
+    assert 1 <= policy.delay(2) <= 2
+    assert 2.5 <= policy.delay(10) <= 5
+
+
+@responses.activate
+def test_transient_get_retried(retry_session: HexpySession) -> None:
+    """Test GET requests failing with a transient error are retried"""
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        body=requests.ConnectionError("Connection reset by peer"),
+    )
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/detail", status=503, body="down"
+    )
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        json={"name": "test_monitor"},
+        status=200,
+    )
+    client = MonitorAPI(retry_session)
+
+    assert client.details(123456789) == {"name": "test_monitor"}
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retries_exhausted(retry_session: HexpySession) -> None:
+    """Test the last error is raised once every attempt failed"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/detail", status=500, body="down"
+    )
+    client = MonitorAPI(retry_session)
+
+    with pytest.raises(ResponseError) as e:
+        client.details(123456789)
+    assert e.value.status_code == 500
+    assert e.value.attempts == 3  # type: ignore
+
+
+@responses.activate
+def test_non_idempotent_post_not_retried(retry_session: HexpySession) -> None:
+    """Test POST requests are not retried unless marked idempotent"""
+    responses.add(responses.POST, HexpySession.ROOT + "stream", status=503)
+    client = StreamsAPI(retry_session)
+
+    with pytest.raises(ResponseError):
+        client.create_stream(team_id=123, name="test_stream")
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_idempotent_upload_retried(
+    retry_session: HexpySession, upload_items: List[JSONDict]
+) -> None:
+    """Test uploads are retried, since items are deduplicated by guid"""
+    responses.add(responses.POST, HexpySession.ROOT + "content/upload", status=502)
+    responses.add(
+        responses.POST,
+        HexpySession.ROOT + "content/upload",
+        json={"status": "success"},
+        status=200,
+    )
+    client = ContentUploadAPI(retry_session)
+
+    response = client.upload(123456789, UploadCollection(items=upload_items))
+
+    assert response == {"status": "success"}
+    assert len(responses.calls) == 2
+
+
+class CountingCodec(JSONCodec):
+    """Codec counting how many bodies were decoded"""
+
+    decoded = 0
+
+    def loads(self, data):  # type: ignore
+        self.decoded += 1
+        return super().loads(data)
+
+
+@responses.activate
+def test_response_decoded_once() -> None:
+    """Test response bodies are decoded exactly once with the attached codec"""
+    responses.add(
+        responses.GET,
+        "https://testsite.com/endpoint",
+        json={"status": "success", "posts": [1, 2, 3]},
+        status=200,
+    )
+    response = requests.get("https://testsite.com/endpoint")
+    codec = CountingCodec("json")
+    response.codec = codec  # type: ignore
+
+    assert handle_response(response) == {"status": "success", "posts": [1, 2, 3]}
+    assert codec.decoded == 1
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_json_codec_round_trip(backend: str) -> None:
+    """Test codecs encode to bytes and decode back"""
+    pytest.importorskip(backend)
+    codec = JSONCodec(backend)
+    data = {"items": [{"title": "Example Title", "age": 30}]}
+
+    assert codec.loads(codec.dumps(data)) == data
+
+
+def test_unknown_json_backend() -> None:
+    """Test invalid backend names are rejected"""
+    with pytest.raises(ValueError):
+        JSONCodec("simplejson")
+
+
+@responses.activate
+def test_session_attaches_codec() -> None:
+    """Test clients decode responses with the session's codec"""
+    responses.add(responses.GET, HexpySession.ROOT + "team/list", json={"teams": []})
+    session = HexpySession(token="test-token-00000", json_backend="json")
+
+    assert MetadataAPI(session).team_list() == {"teams": []}
+    assert responses.calls[0].response.codec is session.codec
+
+
+@responses.activate
+def test_aggregate_concurrent(fake_session: HexpySession) -> None:
+    """Test aggregate keeps its structure and order when calls run concurrently"""
+
+    def callback(request: requests.PreparedRequest) -> tuple:
+        time.sleep(0.05)
+        endpoint = request.path_url.split("?")[0].split("/")[-1]
+        return 200, {}, json.dumps({"endpoint": endpoint})
+
+    for endpoint in ["volume", "wordcloud"]:
+        responses.add_callback(
+            responses.GET, HexpySession.ROOT + "monitor/" + endpoint, callback=callback
+        )
+    client = MonitorAPI(fake_session)
+    dates = [("2019-01-01", "2019-02-01"), ("2019-02-01", "2019-03-01")]
+
+    start = time.monotonic()
+    results = client.aggregate([1, 2], dates, ["volume", "word_cloud"], max_workers=8)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.05 * 8
+    assert [monitor["monitor_id"] for monitor in results] == [1, 2]
+    assert results[1]["results"][1]["resultsStart"] == "2019-02-01"
+    assert results[1]["results"][1]["results"] == {
+        "volume": {"endpoint": "volume"},
+        "word_cloud": {"endpoint": "wordcloud"},
+    }
+
+
+@responses.activate
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_aggregate_partial_failure(
+    fake_session: HexpySession, max_workers: int
+) -> None:
+    """Test failed aggregate calls are collected when returning errors"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": 1}
+    )
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/wordcloud", status=404, body="no"
+    )
+    client = MonitorAPI(fake_session)
+    dates = ("2019-01-01", "2019-02-01")
+
+    results, errors = client.aggregate(
+        1, dates, ["volume", "word_cloud"], max_workers, return_errors=True
+    )
+
+    assert results[0]["results"][0]["results"] == {
+        "volume": {"volume": 1},
+        "word_cloud": None,
+    }
+    assert list(errors) == [(1, "2019-01-01", "2019-02-01", "word_cloud")]
+    assert isinstance(
+        errors[(1, "2019-01-01", "2019-02-01", "word_cloud")], ResponseError
+    )
+    with pytest.raises(ResponseError):
+        client.aggregate(1, dates, ["volume", "word_cloud"], max_workers)
+
+
+def test_aggregate_rejects_unknown_metrics(fake_session: HexpySession) -> None:
+    """Test unknown metrics are rejected before any call is made"""
+    client = MonitorAPI(fake_session)
+
+    with pytest.raises(ValueError, match="valid metrics"):
+        client.aggregate(1, ("2019-01-01", "2019-02-01"), ["volume", "likes"])
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+@responses.activate
+def test_stream_posts(
+    fake_session: HexpySession,
+    posts_json: List[JSONDict],
+    monkeypatch: MonkeyPatch,
+    incremental: bool,
+) -> None:
+    """Test posts are parsed from a compressed body, with or without ijson"""
+    if incremental:
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setattr(base, "ijson", None)
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/posts",
+        body=gzip.compress(json.dumps({"posts": posts_json}).encode("utf-8")),
+        headers={"Content-Encoding": "gzip"},
+    )
+    responses.add(
+        responses.GET,
+        HexpySession.ROOT + "monitor/trainingposts",
+        json={"status": "error"},
+        status=404,
+    )
+    client = MonitorAPI(fake_session)
+
+    posts = client.stream_posts(123, "2019-01-01", "2019-01-02", extend_limit=True)
+
+    assert list(posts) == posts_json
+    assert "gzip" in responses.calls[0].request.headers["Accept-Encoding"]
+    with pytest.raises(ResponseError):
+        client.stream_training_posts(123)
+
+
+@responses.activate
+def test_iter_posts_bisects_busy_days(fake_session: HexpySession) -> None:
+    """Test posts are fetched in windows fitting under the posts limit"""
+    daily = [
+        {
+            "startDate": "2019-01-01T00:00:00",
+            "endDate": "2019-01-02T00:00:00",
+            "numberOfDocuments": 2,
+        },
+        {
+            "startDate": "2019-01-02T00:00:00",
+            "endDate": "2019-01-03T00:00:00",
+            "numberOfDocuments": 2,
+        },
+        {
+            "startDate": "2019-01-03T00:00:00",
+            "endDate": "2019-01-04T00:00:00",
+            "numberOfDocuments": 9,
+        },
+    ]
+    hourly = [
+        {
+            "startDate": "2019-01-03T00:00:00",
+            "endDate": "2019-01-03T01:00:00",
+            "numberOfDocuments": 4,
+        },
+        {
+            "startDate": "2019-01-03T01:00:00",
+            "endDate": "2019-01-03T02:00:00",
+            "numberOfDocuments": 5,
+        },
+    ]
+
+    def volume(request: requests.PreparedRequest) -> tuple:
+        grouped = hourly if request.params["groupBy"] == "HOURLY" else daily
+        return 200, {}, json.dumps({"volume": grouped})
+
+    def posts(request: requests.PreparedRequest) -> tuple:
+        window = f"{request.params['start']}/{request.params['end']}"
+        return 200, {}, json.dumps({"posts": [{"url": window}, {"url": "repeated"}]})
+
+    responses.add_callback(
+        responses.GET, HexpySession.ROOT + "monitor/volume", callback=volume
+    )
+    responses.add_callback(
+        responses.GET, HexpySession.ROOT + "monitor/posts", callback=posts
+    )
+    client = MonitorAPI(fake_session)
+    client.POSTS_LIMIT = 5
+
+    urls = [post["url"] for post in client.iter_posts(1, "2019-01-01", "2019-01-04")]
+
+    assert sorted(urls) == [
+        "2019-01-01/2019-01-03",
+        "2019-01-03/2019-01-03T01:00:00",
+        "2019-01-03T01:00:00/2019-01-03T02:00:00",
+        "repeated",
+    ]
+
+
+@responses.activate
+def test_metadata_memoized(fake_session: HexpySession) -> None:
+    """Test reference metadata is served from memory until invalidated"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "geography/info/states", json={"id": 1}
+    )
+    responses.add(responses.GET, HexpySession.ROOT + "team/list", json={"teams": []})
+    client = MetadataAPI(fake_session)
+
+    assert client.states("USA") == client.states(country="USA") == {"id": 1}
+    client.states("CAN")
+    assert len(responses.calls) == 2
+
+    client.warm_up(["team_list"])
+    client.team_list()
+    assert len(responses.calls) == 3
+    assert MetadataAPI(fake_session).team_list() == {"teams": []}
+    assert len(responses.calls) == 3
+
+    client.invalidate("states")
+    client.states("USA")
+    client.team_list()
+    assert len(responses.calls) == 4
+    assert fake_session.metadata_cache.stats()["hits"] == 4
+
+
+@responses.activate
+def test_identical_gets_coalesced(fake_session: HexpySession) -> None:
+    """Test concurrent identical GET requests share one response"""
+
+    def callback(request: requests.PreparedRequest) -> tuple:
+        time.sleep(0.1)
+        return 200, {}, json.dumps({"name": "test_monitor"})
+
+    responses.add_callback(
+        responses.GET, HexpySession.ROOT + "monitor/detail", callback=callback
+    )
+    client = MonitorAPI(fake_session)
+    results: List[JSONDict] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.details(123)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"name": "test_monitor"}] * 5
+    assert len(responses.calls) == 1
+    assert fake_session.limiter._tokens >= fake_session.MAX_CALLS - 1
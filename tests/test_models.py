@@ -1,19 +1,26 @@
 # -*- coding: utf-8 -*-
 """Tests for model validation."""
+import json
 import logging
-from typing import List
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List
 
 import pandas as pd
 import pendulum
 import pytest
+import requests
 import responses
 from _pytest.capture import CaptureFixture
+from _pytest.monkeypatch import MonkeyPatch
 from pydantic import ValidationError
 
 from hexpy import ContentUploadAPI, HexpySession, MonitorAPI, Project
-from hexpy.base import JSONDict
+from hexpy.base import JSONDict, pack_payloads
+from hexpy.content_upload import UploadJournal
 from hexpy.models import (
     AnalysisRequest,
+    GuidIndex,
     TrainCollection,
     TrainItem,
     UploadCollection,
@@ -36,6 +43,60 @@ def test_upload_from_df(
     assert validated.dict() == upload_items
 
 
+def test_trusted_upload_from_df(
+    upload_items: List[JSONDict], upload_dataframe: pd.DataFrame
+) -> None:
+    """Test trusted dataframes are checked a column at a time and built without validation"""
+    upload_dataframe["custom.field0"] = ["value0", None, "value2"]
+    validated = UploadCollection.from_dataframe(upload_dataframe)
+    trusted = UploadCollection.from_dataframe(upload_dataframe, trusted=True)
+
+    assert [item.date for item in trusted] == ["2010-01-26T16:14:00Z"] * 3
+    for fast, item in zip(trusted.dict(), validated.dict()):
+        assert {**fast, "date": item["date"]} == item
+    assert trusted.items[1].geolocation.id == "USA.NY"
+    assert trusted.items[0].custom == {"field0": "value0"}
+
+    upload_dataframe.loc[0, "language"] = "eng"
+    upload_dataframe.loc[1, "date"] = "not a date"
+    upload_dataframe.loc[2, "guid"] = upload_dataframe.loc[0, "guid"]
+    upload_dataframe.loc[2, "gender"] = "X"
+    with pytest.raises(ValueError) as e:
+        UploadCollection.from_dataframe(upload_dataframe, trusted=True)
+    assert str(e.value) == (
+        "Could not validate items. "
+        "1 rows have language codes that are not 2 characters: [0]; "
+        "1 rows have dates that could not be parsed: [1]; "
+        "2 rows have duplicate guids: [0, 2]; "
+        "1 rows have invalid gender values: [2]"
+    )
+
+
+def test_trusted_train_from_df(train_items: List[JSONDict]) -> None:
+    """Test trusted training dataframes need a single category id"""
+    df = pd.DataFrame(train_items)
+    trusted = TrainCollection.from_dataframe(df, trusted=True)
+    assert [item.url for item in trusted] == [item["url"] for item in train_items]
+
+    df.loc[0, "categoryid"] = 123
+    with pytest.raises(ValueError, match="Multiple `categoryid` values"):
+        TrainCollection.from_dataframe(df, trusted=True)
+
+
+def test_slices_are_not_validated_again(upload_items: List[JSONDict]) -> None:
+    """Test slicing a collection keeps its items without validating them again"""
+    collection = UploadCollection(items=upload_items)
+    unchecked = UploadCollection.construct(
+        items=[UploadItem.construct(**{**upload_items[0], "language": "english"})]
+    )
+
+    assert collection[1:].items == collection.items[1:]
+    assert collection[1:].items[0] is collection.items[1]
+    assert unchecked[:1].items[0].language == "english"
+    with pytest.raises(ValidationError):
+        collection[5:]
+
+
 def test_upload_to_df(upload_dataframe: pd.DataFrame) -> None:
     """Test back and forth to dataframe is equal"""
     validated = UploadCollection.from_dataframe(upload_dataframe)
@@ -371,6 +432,185 @@ def test_batch_upload(
     assert response == {"Batch 0": {}, "Batch 1": {}, "Batch 2": {}, "Batch 3": {}}
 
 
+@responses.activate
+def test_batch_upload_packs_by_size(
+    large_upload_collection: UploadCollection, fake_session: HexpySession
+) -> None:
+    """Test batches hold at most 1000 items and max_bytes bytes of serialized items"""
+    responses.add(
+        responses.POST, HexpySession.ROOT + "content/upload", json={}, status=200
+    )
+    items = large_upload_collection.dict()[:300]
+    for item in items[::10]:
+        item["contents"] = "x" * 16000
+    collection = UploadCollection(items=items)
+
+    client = ContentUploadAPI(fake_session)
+    response = client.batch_upload(123, collection, max_bytes=50_000)
+
+    bodies = [call.request.body for call in responses.calls]
+    batches = [json.loads(body)["items"] for body in bodies]
+    assert len(batches) > 4
+    assert all(len(body) <= 50_000 + len('{"items":}') for body in bodies)
+    assert [item for batch in batches for item in batch] == items
+    assert list(response) == [f"Batch {i}" for i in range(len(batches))]
+
+
+def test_pack_payloads() -> None:
+    """Test serialized items are packed by count and size, keeping their order"""
+    payloads = [b"1" * 10, b"2" * 10, b"3" * 50, b"4", b"5", b"6"]
+
+    assert pack_payloads(payloads, max_items=4, max_bytes=40) == [
+        slice(0, 2),
+        slice(2, 3),
+        slice(3, 6),
+    ]
+    assert pack_payloads(payloads, max_items=2, max_bytes=1000) == [
+        slice(0, 2),
+        slice(2, 4),
+        slice(4, 6),
+    ]
+    assert pack_payloads([]) == []
+
+
+def test_journal_key_needs_guids() -> None:
+    """Test batches with an item missing its guid cannot be journaled"""
+    batch = UploadCollection.construct(items=[UploadItem.construct(guid=None)])
+
+    with pytest.raises(ValueError, match="guid"):
+        UploadJournal.key(batch)
+
+
+@responses.activate
+def test_batch_upload_resumes_from_journal(
+    large_upload_collection: UploadCollection,
+    fake_session: HexpySession,
+    tmp_path: Path,
+) -> None:
+    """Test a failed concurrent batch upload resumes with only the batches left"""
+    failing = {"post2000"}
+
+    def upload(request: requests.PreparedRequest) -> tuple:
+        guid = json.loads(request.body)["items"][0]["guid"]
+        if any(guid.endswith(name) for name in failing):
+            return 400, {}, json.dumps({"message": "Bad batch"})
+        return 200, {}, json.dumps({"batch": guid})
+
+    responses.add_callback(
+        responses.POST, HexpySession.ROOT + "content/upload", callback=upload
+    )
+    client = ContentUploadAPI(fake_session)
+    journal = UploadJournal(tmp_path / "upload.db")
+
+    with pytest.raises(ValueError):
+        client.batch_upload(
+            123, large_upload_collection, max_workers=2, journal=journal
+        )
+    recorded = {batch["batch"]: batch for batch in journal.batches(123)}
+    assert recorded[2]["status"] == "failed"
+    assert recorded[2]["first_guid"].endswith("post2000")
+    assert recorded[2]["last_guid"].endswith("post2999")
+    assert recorded[2]["size"] == 1000
+
+    sent = len(responses.calls)
+    failing.clear()
+    response = client.batch_upload(
+        123, large_upload_collection, max_workers=2, journal=tmp_path / "upload.db"
+    )
+
+    assert list(response) == ["Batch 0", "Batch 1", "Batch 2", "Batch 3"]
+    assert response["Batch 0"]["batch"].endswith("post0")
+    assert len(responses.calls) - sent == 4 - sum(
+        batch["status"] == "done" for batch in recorded.values()
+    )
+    assert [batch["status"] for batch in journal.batches(123)] == ["done"] * 4
+    assert journal.batches(456) == []
+
+
+@responses.activate
+def test_batch_upload_closes_journal_it_opened(
+    fake_session: HexpySession,
+    upload_items: List[JSONDict],
+    tmp_path: Path,
+    monkeypatch: MonkeyPatch,
+) -> None:
+    """Test journals given as a path are closed after the upload, and others are left open"""
+    responses.add(
+        responses.POST, HexpySession.ROOT + "content/upload", json={"batch": "1"}
+    )
+    closed: List[UploadJournal] = []
+    close = UploadJournal.close
+    monkeypatch.setattr(
+        UploadJournal, "close", lambda self: closed.append(self) or close(self)
+    )
+    client = ContentUploadAPI(fake_session)
+    upload_collection = UploadCollection(items=upload_items)
+
+    client.batch_upload(123, upload_collection, journal=tmp_path / "upload.db")
+    assert len(closed) == 1
+
+    with UploadJournal(tmp_path / "upload.db") as journal:
+        client.batch_upload(123, upload_collection, journal=journal)
+        assert len(closed) == 1
+        assert journal.batches(123)[0]["status"] == "done"
+    assert closed[-1] is journal
+
+
+def test_guid_index() -> None:
+    """Test guids are found across every merged array of fingerprints"""
+    guids = GuidIndex()
+    for start in range(0, 5000, 700):
+        guids.add([f"post{i}" for i in range(start, start + 700)])
+
+    assert len(guids) == 5600
+    assert guids.find(["post0", "post5599", "post5600", "other"]) == [
+        "post0",
+        "post5599",
+    ]
+    assert "post3000" in guids
+
+
+def test_duplicates_across_chunks(upload_dataframe: pd.DataFrame) -> None:
+    """Test guids repeated in a later chunk are detected"""
+    chunks = UploadCollection.from_dataframes(
+        [
+            upload_dataframe.iloc[:2],
+            upload_dataframe.iloc[2:],
+            upload_dataframe.iloc[1:2],
+        ]
+    )
+
+    assert [len(collection) for collection in islice(chunks, 2)] == [2, 1]
+    with pytest.raises(ValueError) as e:
+        next(chunks)
+    assert "['http://www.crimsonhexagon.com/post2']" in e.value.args[0]
+
+
+@responses.activate
+def test_stream_upload(
+    large_upload_collection: UploadCollection, fake_session: HexpySession
+) -> None:
+    """Test collections are uploaded in batches of 1000 as they are produced"""
+    responses.add(
+        responses.POST, HexpySession.ROOT + "content/upload", json={}, status=200
+    )
+    produced = []
+
+    def collections() -> Iterator[UploadCollection]:
+        for i in range(0, 3050, 1500):
+            produced.append(i)
+            yield large_upload_collection[i : i + 1500]
+
+    client = ContentUploadAPI(fake_session)
+    uploads = client.stream_upload(123456789, collections())
+
+    assert next(uploads) == {}
+    assert produced in ([0], [0, 1500])
+    assert len(list(uploads)) == 4
+    batches = [json.loads(call.request.body)["items"] for call in responses.calls]
+    assert [len(batch) for batch in batches] == [1000, 500, 1000, 500, 50]
+
+
 @pytest.fixture
 def large_train_collection(train_items: List[JSONDict]) -> TrainCollection:
     """Collection of 3000 unique training items"""
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `plan.py` module."""
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+import requests
+import responses
+
+from hexpy import HexpySession, MonitorAPI
+from hexpy.base import BULK, JSONDict, RateLimiter
+from hexpy.cache import ResponseCache
+from hexpy.models import UploadCollection, UploadItem
+from hexpy.plan import Planner
+
+
+def test_limiter_estimate() -> None:
+    """Test estimates follow the tokens left and the share reserved for interactive calls"""
+    limiter = RateLimiter(max_calls=60, period=60, reserve=0.5)
+    for _ in range(50):
+        limiter.acquire()
+
+    assert limiter.estimate(0) == 0
+    assert 0 <= limiter.estimate(10) < 0.1
+    assert 19.9 < limiter.estimate(30) <= 20
+    assert 29.9 < limiter.estimate(10, BULK) <= 30
+
+
+@responses.activate
+def test_plan_aggregate_with_cache_hits(tmp_path: Path) -> None:
+    """Test aggregate plans count distinct calls and the ones served from the cache"""
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": []}
+    )
+    session = HexpySession(
+        token="test-token-00000", cache=ResponseCache(tmp_path / "cache.db")
+    )
+    MonitorAPI(session).volume(123, "2019-01-01", "2019-01-02")
+
+    plan = Planner(session).aggregate(
+        [123, 456, 123], ("2019-01-01", "2019-01-02"), ["volume", "word_cloud"]
+    )
+
+    assert plan.summary() == {
+        "calls": 4,
+        "api_calls": 3,
+        "cache_hits": 1,
+        "eta_seconds": 0.0,
+        "methods": {"MonitorAPI.volume": 2, "MonitorAPI.word_cloud": 2},
+    }
+    assert plan.calls[0].arguments["monitor_id"] == 123
+    assert plan.calls[0].cached
+    assert len(responses.calls) == 1
+
+
+def test_plan_uploads(fake_session: HexpySession, upload_items: List[JSONDict]) -> None:
+    """Test upload plans count batches by size and the token drawn to hand them over"""
+    item = UploadItem(**upload_items[0])
+
+    def collection(size: int) -> UploadCollection:
+        return UploadCollection.construct(items=[item] * size)
+
+    items = collection(2500)
+    planner = Planner(fake_session)
+    batches = planner.batch_upload(1, items).calls
+
+    assert [call.arguments["items"] for call in batches] == [1000, 1000, 500]
+    assert {call.method for call in batches} == {"ContentUploadAPI._post_upload"}
+    size = len(fake_session.codec.dumps(item.dict()))
+    small = planner.batch_upload(1, collection(10), max_bytes=4 * size + 5).calls
+    assert [call.arguments["items"] for call in small] == [4, 4, 2]
+    assert planner.upload(1, items).summary()["methods"] == {
+        "ContentUploadAPI.upload": 1,
+        "ContentUploadAPI._post_upload": 3,
+    }
+    assert len(planner.upload(1, collection(10))) == 1
+    chunks = [collection(size) for size in (1500, 10)]
+    assert [
+        call.arguments["items"] for call in planner.stream_upload(1, chunks).calls
+    ] == [1000, 500, 10]
+
+
+@responses.activate
+def test_plan_posts_export(fake_session: HexpySession) -> None:
+    """Test export plans count volume calls and one posts call per window"""
+    daily = [
+        {
+            "startDate": "2019-01-01T00:00:00",
+            "endDate": "2019-01-02T00:00:00",
+            "numberOfDocuments": 6000,
+        },
+        {
+            "startDate": "2019-01-02T00:00:00",
+            "endDate": "2019-01-03T00:00:00",
+            "numberOfDocuments": 3000,
+        },
+        {
+            "startDate": "2019-01-03T00:00:00",
+            "endDate": "2019-01-04T00:00:00",
+            "numberOfDocuments": 12000,
+        },
+    ]
+    hourly = [
+        {
+            "startDate": "2019-01-03T00:00:00",
+            "endDate": "2019-01-03T12:00:00",
+            "numberOfDocuments": 6000,
+        },
+        {
+            "startDate": "2019-01-03T12:00:00",
+            "endDate": "2019-01-04T00:00:00",
+            "numberOfDocuments": 6000,
+        },
+    ]
+
+    def volume(request: requests.PreparedRequest) -> tuple:
+        grouped = hourly if request.params["groupBy"] == "HOURLY" else daily
+        return 200, {}, json.dumps({"volume": grouped})
+
+    responses.add_callback(
+        responses.GET, HexpySession.ROOT + "monitor/volume", callback=volume
+    )
+
+    planner = Planner(fake_session)
+    with pytest.raises(ValueError, match="not in the session cache"):
+        planner.iter_posts(123, "2019-01-01", "2019-01-04")
+    assert len(responses.calls) == 0
+
+    plan = planner.iter_posts(123, "2019-01-01", "2019-01-04", fetch_volume=True)
+
+    assert plan.summary()["methods"] == {"MonitorAPI.volume": 2, "MonitorAPI.posts": 3}
+    assert [call.arguments["start"] for call in plan.calls] == [
+        "2019-01-01",
+        "2019-01-03",
+        "2019-01-01",
+        "2019-01-03",
+        "2019-01-03T12:00:00",
+    ]
+    assert plan.api_calls == 5
+
+
+@responses.activate
+def test_plan_posts_export_from_cache(tmp_path: Path) -> None:
+    """Test export plans read cached volumes without calling the API"""
+    daily = [
+        {
+            "startDate": "2019-01-01T00:00:00",
+            "endDate": "2019-01-02T00:00:00",
+            "numberOfDocuments": 6000,
+        },
+        {
+            "startDate": "2019-01-02T00:00:00",
+            "endDate": "2019-01-03T00:00:00",
+            "numberOfDocuments": 6000,
+        },
+    ]
+    responses.add(
+        responses.GET, HexpySession.ROOT + "monitor/volume", json={"volume": daily}
+    )
+    session = HexpySession(
+        token="test-token-00000", cache=ResponseCache(tmp_path / "cache.db")
+    )
+    MonitorAPI(session).volume(123, "2019-01-01", "2019-01-03", group_by="DAILY")
+    stats = session.cache.stats()
+
+    plan = Planner(session).iter_posts(123, "2019-01-01", "2019-01-03")
+
+    assert session.cache.stats() == stats
+
+    assert plan.summary()["methods"] == {"MonitorAPI.volume": 1, "MonitorAPI.posts": 2}
+    assert plan.cache_hits == 1
+    assert len(responses.calls) == 1
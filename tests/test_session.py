@@ -7,7 +7,8 @@ from pathlib import Path
 import pytest
 import responses
 
-from hexpy import HexpySession
+from hexpy import HexpySession, MonitorAPI
+from hexpy.session import PoolConfig
 
 
 @pytest.fixture
@@ -65,3 +66,26 @@ def test_save_token(
         auth = json.load(infile)
 
     assert auth == {"auth": "test-token-00000"}
+
+
+def test_login_reuses_connection_pool(
+    mocked_authenticate: responses.RequestsMock,
+) -> None:
+    """Test login and the session's clients share one tuned connection pool"""
+    mocked_authenticate.add(
+        responses.GET, HexpySession.ROOT + "monitor/detail", json={}, status=200
+    )
+    pool = PoolConfig(pool_maxsize=64, keep_alive=False, timeout=(5, 30))
+    session = HexpySession.login(username="test", password="testpassword", pool=pool)
+    MonitorAPI(session).details(123)
+
+    adapter = session.session.get_adapter(HexpySession.ROOT)
+    assert adapter is pool.adapter
+    assert adapter._pool_maxsize == 64
+    assert [
+        call.request.req_kwargs["timeout"] for call in mocked_authenticate.calls
+    ] == [
+        (5, 30),
+        (5, 30),
+    ]
+    assert mocked_authenticate.calls[1].request.headers["Connection"] == "close"
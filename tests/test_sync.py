@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `sync.py` module."""
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+import responses
+
+from hexpy import HexpySession, MonitorSync
+
+
+@responses.activate
+def test_sync_fetches_only_new_and_open_days(
+    fake_session: HexpySession, tmp_path: Path
+) -> None:
+    """Test a second sync only fetches days after the checkpoint"""
+    details: Dict[str, str] = {
+        "resultsStart": "2019-01-01T00:00:00",
+        "resultsEnd": "2019-01-05T00:00:00",
+    }
+    calls: List[str] = []
+
+    def volume(request: requests.PreparedRequest) -> tuple:
+        calls.append(request.params["start"])
+        return 200, {}, json.dumps({"numberOfDocuments": len(calls)})
+
+    responses.add_callback(
+        responses.GET,
+        HexpySession.ROOT + "monitor/detail",
+        callback=lambda request: (200, {}, json.dumps(details)),
+    )
+    responses.add_callback(
+        responses.GET, HexpySession.ROOT + "monitor/volume", callback=volume
+    )
+    syncer = MonitorSync(fake_session, path=tmp_path / "sync.db", open_days=1)
+
+    assert syncer.sync(123, endpoints=["volume"]) == {
+        "volume": ["2019-01-01", "2019-01-02", "2019-01-03", "2019-01-04"]
+    }
+    assert syncer.sync(123, endpoints=["volume"]) == {"volume": ["2019-01-04"]}
+
+    details["resultsEnd"] = "2019-01-06T00:00:00"
+    assert syncer.sync(123, endpoints=["volume"]) == {
+        "volume": ["2019-01-04", "2019-01-05"]
+    }
+
+    stored = syncer.load(123, "volume")
+    assert list(stored) == [
+        "2019-01-01",
+        "2019-01-02",
+        "2019-01-03",
+        "2019-01-04",
+        "2019-01-05",
+    ]
+    assert len(calls) == 7
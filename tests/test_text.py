@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Tests for hexpy `text.py` module."""
+import ftfy
+import pandas as pd
+from _pytest.monkeypatch import MonkeyPatch
+
+from hexpy import models, text
+from hexpy.models import TrainCollection, UploadCollection
+from hexpy.text import FixedText, TextFixer, needs_fixing
+
+
+def test_clean_ascii_is_skipped() -> None:
+    """Test only strings ftfy may change are fixed"""
+    assert not needs_fixing("Plain title\twith a tab\nand a newline")
+    assert needs_fixing("cafÃ©")
+    assert needs_fixing("fish &amp; chips")
+    assert needs_fixing("line\r\nbreak")
+    assert needs_fixing("bell\x07")
+
+
+def test_fix_many_fixes_repeated_strings_once(monkeypatch: MonkeyPatch) -> None:
+    """Test repeated and remembered strings are not fixed again"""
+    fixed = []
+    original = ftfy.fix_text
+
+    def fix_text(value: str) -> str:
+        fixed.append(value)
+        return original(value)
+
+    monkeypatch.setattr(text.ftfy, "fix_text", fix_text)
+    fixer = TextFixer(processes=1)
+    mojibake = "cafÃ©"
+
+    assert fixer.fix_many([mojibake, "plain", mojibake, "fish &amp; chips"]) == [
+        "café",
+        "plain",
+        "café",
+        "fish & chips",
+    ]
+    assert fixer.fix(mojibake) == "café"
+    assert fixer.fix("café") == "café"
+    assert fixed == [mojibake, "fish &amp; chips"]
+
+
+def test_fix_many_in_worker_processes() -> None:
+    """Test strings are fixed in worker processes in chunks, keeping their order"""
+    fixer = TextFixer(processes=2, min_parallel=1, chunksize=2, max_length=0)
+    texts = [f"cafÃ© {i}" for i in range(5)] + ["plain"]
+
+    assert fixer.fix_many(texts) == [f"café {i}" for i in range(5)] + ["plain"]
+
+
+def test_fixed_columns_are_not_fixed_again(monkeypatch: MonkeyPatch) -> None:
+    """Test strings of fixed columns are returned as they are, however long"""
+    fixed = []
+    original = ftfy.fix_text
+
+    def fix_text(value: str) -> str:
+        fixed.append(value)
+        return original(value)
+
+    monkeypatch.setattr(text.ftfy, "fix_text", fix_text)
+    fixer = TextFixer(processes=1, max_length=3)
+    [contents] = fixer.fix_column(pd.Series(["cafÃ© au lait"]))
+
+    assert isinstance(contents, FixedText)
+    assert fixer.fix(contents) == "café au lait"
+    assert type(fixer.fix(contents)) is str
+    assert fixed == ["cafÃ© au lait"]
+
+
+def test_dataframes_fixed_a_column_at_a_time(
+    upload_dataframe: pd.DataFrame, train_dataframe: pd.DataFrame
+) -> None:
+    """Test text columns are fixed before items are validated"""
+    upload_dataframe["author"] = "cafÃ©"
+    train_dataframe["title"] = "fish &amp; chips"
+
+    uploads = UploadCollection.from_dataframe(upload_dataframe)
+    training = TrainCollection.from_dataframe(train_dataframe)
+
+    assert [item.author for item in uploads] == ["café"] * len(upload_dataframe)
+    assert {item.title for item in training} == {"fish & chips"}
+
+
+def test_dataframes_fixed_once_beyond_max_entries(
+    upload_dataframe: pd.DataFrame, monkeypatch: MonkeyPatch
+) -> None:
+    """Test every text is fixed once, even with more texts than the fixer remembers"""
+    fixed = []
+    original = ftfy.fix_text
+
+    def fix_text(value: str) -> str:
+        fixed.append(value)
+        return original(value)
+
+    fixer = TextFixer(max_entries=10, processes=1)
+    monkeypatch.setattr(text.ftfy, "fix_text", fix_text)
+    monkeypatch.setattr(text, "TEXT_FIXER", fixer)
+    monkeypatch.setattr(models, "TEXT_FIXER", fixer)
+    rows = 30
+    df = pd.concat([upload_dataframe.iloc[:1]] * rows, ignore_index=True)
+    df["guid"] = [f"post{i}" for i in range(rows)]
+    df["author"] = [f"cafÃ© {i}" for i in range(rows)]
+    df["title"] = [f"fish &amp; chips {i}" for i in range(rows)]
+
+    uploads = UploadCollection.from_dataframe(df)
+
+    assert [item.author for item in uploads] == [f"café {i}" for i in range(rows)]
+    assert len(fixed) == 2 * rows